@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+Adaptive admission control for chat requests.
+
+AdaptiveLimit caps how many chat requests are answered at once and adjusts
+the cap with AIMD (additive increase, multiplicative decrease), like TCP
+congestion control. Every finished request is a sample. The limit shrinks by
+`decrease` when the backend looks overloaded:
+
+- recent latency is over `tolerance` times the long-run baseline
+- event-loop lag is over max_lag_ms
+- a request ran out its deadline
+
+It shrinks at most once per recent request duration, so one burst of slow
+answers does not collapse it. When requests are fine and the limit is
+actually in use, it grows by about one slot per limit's worth of requests.
+Requests over the limit are turned away at once instead of queueing until
+they all time out together.
+"""
+import math
+import os
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+# How quickly the recent and baseline latency averages follow new samples
+RECENT_WEIGHT = 0.2
+BASELINE_WEIGHT = 0.01
+
+class AdaptiveLimit:
+    """AIMD concurrency limit driven by latency and event-loop lag"""
+
+    def __init__(self, initial: int = 32, min_limit: int = 4, max_limit: int = 256,
+                 tolerance: float = 2.0, max_lag_ms: float = 200, decrease: float = 0.9,
+                 warmup: int = 20, lag: Optional[Callable[[], Optional[float]]] = None):
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.max_lag_ms = max_lag_ms
+        self.decrease = decrease
+        self.warmup = warmup
+        self.lag = lag  # Current event-loop lag in ms
+        self.in_flight = 0
+        self.baseline_ms: Optional[float] = None
+        self.recent_ms: Optional[float] = None
+        self._samples = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"admitted": 0, "rejected": 0, "degraded": 0, "decreases": 0,
+                      "overloaded_samples": 0}
+
+    @property
+    def saturated(self) -> bool:
+        return self.in_flight >= int(self.limit)
+
+    def try_acquire(self, count_rejection: bool = True) -> Optional[Tuple[float, int]]:
+        """A ticket for release(), or None if the limit is reached
+
+        count_rejection=False is for callers that wait and try again rather than turn the request away.
+        """
+        with self._lock:
+            if self.in_flight >= int(self.limit):
+                if count_rejection:
+                    self.stats["rejected"] += 1
+                return None
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+            return time.monotonic(), self.in_flight
+
+    def release(self, ticket: Tuple[float, int], timed_out: bool = False, sample: bool = True) -> None:
+        """Finish an admitted request; sample=False (e.g. the client hung up) skips adjusting the limit"""
+        started, in_flight_at_start = ticket
+        now = time.monotonic()
+        latency = (now - started) * 1000
+        with self._lock:
+            self.in_flight -= 1
+            if not sample:
+                return
+            self._samples += 1
+            if self.recent_ms is None:
+                self.recent_ms = self.baseline_ms = latency
+            else:
+                self.recent_ms += RECENT_WEIGHT * (latency - self.recent_ms)
+                self.baseline_ms += BASELINE_WEIGHT * (latency - self.baseline_ms)
+            if self._samples < self.warmup:
+                return
+
+            lag = self.lag() if self.lag else None
+            overloaded = (timed_out or self.recent_ms > self.tolerance * self.baseline_ms
+                          or (lag is not None and lag > self.max_lag_ms))
+            if overloaded:
+                self.stats["overloaded_samples"] += 1
+                if now - self._last_decrease >= self.recent_ms / 1000:
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self._last_decrease = now
+                    self.stats["decreases"] += 1
+            elif in_flight_at_start >= self.limit / 2:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def retry_after(self) -> int:
+        """Seconds a turned-away client should wait: about one recent request's duration"""
+        return max(1, math.ceil((self.recent_ms or 1000) / 1000))
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return dict(self.stats, limit=round(self.limit, 2), in_flight=self.in_flight,
+                        recent_ms=round(self.recent_ms, 1) if self.recent_ms is not None else None,
+                        baseline_ms=round(self.baseline_ms, 1) if self.baseline_ms is not None else None)
+
+def admission_from_env(lag: Optional[Callable[[], Optional[float]]] = None) -> Optional[AdaptiveLimit]:
+    """AdaptiveLimit from ADMISSION_* settings, or None with ADMISSION_CONTROL=0"""
+    if os.getenv("ADMISSION_CONTROL", "1") != "1":
+        return None
+    return AdaptiveLimit(
+        initial=int(os.getenv("ADMISSION_INITIAL_LIMIT", "32")),
+        min_limit=int(os.getenv("ADMISSION_MIN_LIMIT", "4")),
+        max_limit=int(os.getenv("ADMISSION_MAX_LIMIT", "256")),
+        tolerance=float(os.getenv("ADMISSION_LATENCY_TOLERANCE", "2.0")),
+        max_lag_ms=float(os.getenv("ADMISSION_MAX_LAG_MS", "200")),
+        lag=lag,
+    )
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+"""
+Backend connections for the desktop GUI and the voice assistant.
+
+HttpBackend sends one POST /chat per message and keeps the conversation context
+on the client. WebSocketBackend keeps a /ws session open: only new messages are
+sent, the server holds the context, answers stream back as text deltas, and
+provider status changes are pushed instead of polled. EmbeddedBackend runs the
+server's routing core inside the client process, on a background event loop,
+so no server has to be started and messages skip HTTP entirely.
+"""
+import asyncio
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Callable, Optional
+
+import requests
+
+# The server is asked to finish this much earlier than the client gives up, so
+# its fallback answer still arrives in time
+DEADLINE_MARGIN = 1.0
+
+def server_timeout(timeout: float) -> float:
+    return max(1.0, timeout - DEADLINE_MARGIN)
+
+try:
+    import websocket  # websocket-client
+except ImportError:
+    websocket = None
+
+class HttpBackend:
+    """One HTTP request per message"""
+
+    streaming = False
+
+    def __init__(self, base_url: str = "http://localhost:8001", session_id: Optional[str] = None):
+        self.base_url = base_url.rstrip("/")
+        self.session_id = session_id or uuid.uuid4().hex
+        self.context = {}
+        self.http = requests.Session()
+
+    def chat(self, message: str, on_delta: Optional[Callable[[str], None]] = None,
+             on_reset: Optional[Callable[[], None]] = None, timeout: float = 30) -> dict:
+        """Send a message and return {"answer", "provider"}; raises on failure"""
+        response = self.http.post(
+            f"{self.base_url}/chat",
+            json={"message": message, "context": self.context, "session_id": self.session_id},
+            headers={"X-Request-Timeout": str(server_timeout(timeout))},
+            timeout=timeout
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"Server error: {response.status_code}")
+        result = response.json()
+        self.context = result.get("context", {})
+        return result
+
+    def models(self) -> dict:
+        """Providers and models, as returned by GET /models"""
+        response = self.http.get(f"{self.base_url}/models", timeout=3)
+        response.raise_for_status()
+        return response.json()
+
+    def switch_model(self, model: str) -> dict:
+        """Pick a model ("Provider: model") for this session"""
+        response = self.http.post(f"{self.base_url}/switch_model",
+                                  json={"model": model, "session_id": self.session_id}, timeout=5)
+        return response.json()
+
+    def health(self) -> dict:
+        response = self.http.get(f"{self.base_url}/", timeout=3)
+        response.raise_for_status()
+        return response.json()
+
+    def reset(self):
+        """Start a new conversation"""
+        self.context = {}
+
+    def close(self):
+        self.http.close()
+
+class WebSocketBackend(HttpBackend):
+    """Persistent /ws session with streamed answers and pushed status events"""
+
+    streaming = True
+
+    def __init__(self, base_url: str = "http://localhost:8001", session_id: Optional[str] = None,
+                 on_status: Optional[Callable[[dict], None]] = None):
+        super().__init__(base_url, session_id)
+        self.on_status = on_status
+        ws_url = "ws" + self.base_url[len("http"):] if self.base_url.startswith("http") else self.base_url
+        self.ws = websocket.create_connection(f"{ws_url}/ws?session_id={self.session_id}", timeout=5)
+        ready = json.loads(self.ws.recv())
+        self.ws.settimeout(None)
+        if self.on_status:
+            self.on_status(ready)
+
+        self._turn_ids = itertools.count(1)
+        self._turn_id = None
+        self._turn_events = None
+        self._turn_lock = threading.Lock()  # One message in flight at a time
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    def _read_loop(self):
+        while True:
+            try:
+                event = json.loads(self.ws.recv())
+            except Exception as e:
+                events = self._turn_events
+                if events:
+                    events.put({"type": "error", "error": f"Connection closed: {e}"})
+                return
+
+            if event.get("type") in ("models", "status", "reminder") and self.on_status:
+                self.on_status(event)
+            
+            # Events from a turn we already gave up on are dropped
+            turn_id, events = self._turn_id, self._turn_events
+            if events and (event.get("id") == turn_id or (event.get("type") == "error" and "id" not in event)):
+                events.put(event)
+
+    def chat(self, message: str, on_delta: Optional[Callable[[str], None]] = None,
+             on_reset: Optional[Callable[[], None]] = None, timeout: float = 30) -> dict:
+        with self._turn_lock:
+            self._turn_id = next(self._turn_ids)
+            self._turn_events = queue.Queue()
+            self.ws.send(json.dumps({"type": "message", "message": message, "id": self._turn_id,
+                                     "timeout": server_timeout(timeout)}))
+
+            deadline = time.monotonic() + timeout
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.ws.send(json.dumps({"type": "cancel", "id": self._turn_id}))
+                        raise TimeoutError(f"No answer within {timeout}s")
+                    try:
+                        event = self._turn_events.get(timeout=remaining)
+                    except queue.Empty:
+                        continue
+
+                    kind = event.get("type")
+                    if kind == "delta" and on_delta:
+                        on_delta(event["text"])
+                    elif kind == "reset" and on_reset:
+                        on_reset()
+                    elif kind == "done":
+                        return {"answer": event["answer"], "provider": event.get("provider")}
+                    elif kind == "error":
+                        raise RuntimeError(event.get("error", "Unknown error"))
+            finally:
+                self._turn_id = None
+                self._turn_events = None
+
+    def reset(self):
+        self.ws.send(json.dumps({"type": "reset"}))
+
+    def close(self):
+        try:
+            self.ws.close()
+        finally:
+            super().close()
+
+class EmbeddedBackend:
+    """The server's routing core running in this process.
+    
+    main.py is imported on first use (that's where the provider clients are set
+    up) and its startup work (jobs, reminders) runs on a private event loop in
+    a background thread. Calls go straight to route_chat, with no HTTP and no
+    serialization.
+    """
+
+    streaming = True
+
+    def __init__(self, session_id: Optional[str] = None, on_status: Optional[Callable[[dict], None]] = None):
+        import main  # Slow: connects to the providers
+        self.server = main
+        self.session_id = session_id or uuid.uuid4().hex
+        self.context = {}
+        self.on_status = on_status
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="embedded-backend", daemon=True)
+        self._thread.start()
+        self._call(main.start_jobs())
+        main.attach_session(self.session_id, self._push)
+        main.state.subscribe(self._on_state_change)
+        self._push({"type": "ready", "session_id": self.session_id, **self._session_status()})
+
+    def _call(self, coroutine, timeout: Optional[float] = None):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def _session_status(self) -> dict:
+        return {"models": self.server.models_status(), "session": self.server.state.get(f"session:{self.session_id}")}
+
+    def _push(self, event: dict):
+        if self.on_status:
+            self.on_status(event)
+
+    def _on_state_change(self, key, value):
+        if key in ("selected_provider", f"session:{self.session_id}") or key.endswith("_model"):
+            self._push({"type": "models", **self._session_status()})
+
+    def chat(self, message: str, on_delta: Optional[Callable[[str], None]] = None,
+             on_reset: Optional[Callable[[], None]] = None, timeout: float = 30) -> dict:
+        server = self.server
+
+        def events(event: dict):
+            kind = event.get("type")
+            if kind == "delta" and on_delta:
+                on_delta(event["text"])
+            elif kind == "reset" and on_reset:
+                on_reset()
+            elif kind == "status":
+                self._push(event)
+
+        req = server.ChatRequest(message=message, context=self.context, session_id=self.session_id)
+        deadline = server.Deadline(server_timeout(timeout))
+        future = asyncio.run_coroutine_threadsafe(server.coalesced_chat(req, events=events, deadline=deadline),
+                                                  self.loop)
+        try:
+            result = future.result(timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise TimeoutError(f"No answer within {timeout}s")
+        self.context = result.get("context", {})
+        return result
+
+    def models(self) -> dict:
+        return self.server.models_status()
+
+    def switch_model(self, model: str) -> dict:
+        return self._call(self.server.switch_model({"model": model, "session_id": self.session_id}), 5)
+
+    def health(self) -> dict:
+        return self._call(self.server.root(), 3)
+
+    def reset(self):
+        self.context = {}
+
+    def close(self):
+        self.server.state.unsubscribe(self._on_state_change)
+        self.server.detach_session(self.session_id, self._push)
+        self._call(self.server.stop_jobs(), 5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+
+def create_backend(base_url: str = "http://localhost:8001", transport: Optional[str] = None,
+                   session_id: Optional[str] = None,
+                   on_status: Optional[Callable[[dict], None]] = None):
+    """Connect with ASSISTANT_TRANSPORT: "ws" (default, falls back to HTTP), "http",
+    or "embedded" (no server; the routing core runs in this process)"""
+    transport = (transport or os.getenv("ASSISTANT_TRANSPORT", "ws")).lower()
+    if transport == "embedded":
+        return EmbeddedBackend(session_id, on_status)
+    if transport == "ws":
+        if websocket is None:
+            print("⚠️  websocket-client not installed, using HTTP")
+        else:
+            try:
+                return WebSocketBackend(base_url, session_id, on_status)
+            except Exception as e:
+                print(f"⚠️  WebSocket connection failed ({e}), using HTTP")
+    return HttpBackend(base_url, session_id)
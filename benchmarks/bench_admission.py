@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Burst benchmark for admission control (admission.py).
+
+    python benchmarks/bench_admission.py
+    python benchmarks/bench_admission.py --burst 500 --waves 5 --timeout 10
+
+Starts an in-process ollama_stub.py and two backends, one with
+ADMISSION_CONTROL=1 and one with it off, then sends waves of --burst
+simultaneous /chat requests to each. Reports how many were answered by Ollama,
+turned away (503) or fell back, and the latency of the answered ones. Without
+admission control every request queues for the Ollama lane and many of them
+run out their deadline and get the fallback answer.
+"""
+import argparse
+import asyncio
+import collections
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from bench_gui_backend import free_port, percentile
+
+async def burst(url: str, args) -> None:
+    limits = httpx.Limits(max_connections=args.burst, max_keepalive_connections=args.burst)
+    async with httpx.AsyncClient(timeout=args.timeout * 3, limits=limits) as client:
+        async def one(i):
+            started = time.perf_counter()
+            response = await client.post(f"{url}/chat", json={"message": f"explain python lists {i}", "context": {}},
+                                         headers={"X-Request-Timeout": str(args.timeout)})
+            provider = response.json().get("provider", "") if response.status_code == 200 else ""
+            return response.status_code, provider, time.perf_counter() - started
+
+        for wave in range(args.waves):
+            results = await asyncio.gather(*(one(i) for i in range(args.burst)))
+            outcomes = collections.Counter(
+                "answered" if provider.startswith("Ollama") else ("busy" if status == 503 else "fallback")
+                for status, provider, _ in results)
+            answered = [seconds * 1000 for _, provider, seconds in results if provider.startswith("Ollama")]
+            print(f"  wave {wave}: answered {outcomes['answered']:>4}  busy {outcomes['busy']:>4}  "
+                  f"fallback {outcomes['fallback']:>4} | answered p50 "
+                  f"{percentile(answered, 50) if answered else 0:7.0f} ms  p95 "
+                  f"{percentile(answered, 95) if answered else 0:7.0f} ms")
+        metrics = (await client.get(f"{url}/metrics")).json()["admission"]
+        if metrics:
+            print(f"  limit now {metrics['limit']}, {metrics['decreases']} decreases")
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend behaviour under request bursts")
+    parser.add_argument("--burst", type=int, default=300, help="Simultaneous requests per wave")
+    parser.add_argument("--waves", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=10, help="X-Request-Timeout for each request")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Stub seconds per generated token")
+    args = parser.parse_args()
+
+    from ollama_stub import StubState, serve
+    stub = serve(StubState(0, ["llama3.2"], ["llama3.2"], load_delay=0, token_delay=args.token_delay))
+    with tempfile.TemporaryDirectory() as workdir:
+        for enabled in ("1", "0"):
+            env = {
+                **os.environ,
+                "GEMINI_API_KEY": "", "GOOGLE_API_KEY": "", "OPENAI_API_KEY": "",
+                "OLLAMA_HOSTS": f"http://127.0.0.1:{stub.server_address[1]}",
+                "ADMISSION_CONTROL": enabled,
+                "STATE_BACKEND": "local",
+                "CLIENT_RPM": "0",
+                "COALESCE_REQUESTS": "0",  # Every request is different anyway; keep it out of the picture
+                "JOBS_DB_PATH": os.path.join(workdir, f"jobs{enabled}.db"),
+                "REMINDERS_DB_PATH": os.path.join(workdir, f"reminders{enabled}.db"),
+                "RAG_INDEX_DIR": os.path.join(workdir, "rag_index"),
+            }
+            port = free_port()
+            server = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            try:
+                url = f"http://127.0.0.1:{port}"
+                while True:
+                    try:
+                        httpx.get(f"{url}/", timeout=1)
+                        break
+                    except httpx.HTTPError:
+                        if server.poll() is not None:
+                            raise RuntimeError("Server exited during startup")
+                        time.sleep(0.05)
+                print(f"🎯 Admission control {'on' if enabled == '1' else 'off'}")
+                asyncio.run(burst(url, args))
+            finally:
+                server.terminate()
+                server.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+Model cascade benchmark: mean latency and cost of cascade routing versus
+sending every prompt to the large model.
+
+1. Record each prompt's answer and latency from both models (needs Ollama):
+       python benchmarks/bench_cascade.py record --small llama3.2:1b --large gpt-oss:20b
+2. Replay the recording through the cascade (classifier + confidence check):
+       python benchmarks/bench_cascade.py replay --large-price 0.002
+
+This is a harness: no recording ships with the repo, because the figures
+depend on the models and hardware it is recorded on. Without a recording,
+replay only shows how the classifier would route the prompt mix; latency,
+cost and escalation can only come from real answers.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from cascade import Cascade
+from rate_limiter import estimate_tokens
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PROMPTS = os.path.join(HERE, "prompt_mix.jsonl")
+RECORDING = os.path.join(HERE, "cascade_recording.jsonl")
+
+def load_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def record(args):
+    from ollama_client import OllamaClient
+    client = OllamaClient()
+    with open(args.output, "w", encoding="utf-8") as out:
+        for item in load_jsonl(args.prompts):
+            row = {"message": item["message"]}
+            for size, model in (("small", args.small), ("large", args.large)):
+                started = time.perf_counter()
+                answer = client.generate_response(item["message"], model=model, timeout=args.timeout)
+                row[size] = {"model": model, "answer": answer, "latency": time.perf_counter() - started}
+            out.write(json.dumps(row) + "\n")
+            print(f"🎯 {row['small']['latency']:.2f}s / {row['large']['latency']:.2f}s  {item['message'][:50]!r}")
+    print(f"✅ Recorded to {args.output}")
+
+def routing(args):
+    """How the classifier splits the prompt mix; needs no models"""
+    cascade = Cascade(("ollama", "small"), ("ollama", "large"), args.threshold, args.min_confidence)
+    rows = load_jsonl(args.prompts)
+    for row in rows:
+        cascade.plan(row["message"])
+    stats = cascade.metrics()
+    print(f"🎯 {len(rows)} prompts would go: {stats['simple']} small model first, "
+          f"{stats['complex']} complex and {stats['code']} code straight to the large model")
+    print("⚠️  No latency or cost figures without real answers. Record some first:")
+    print("    python benchmarks/bench_cascade.py record --small <model> --large <model>")
+
+def replay(args):
+    if not os.path.exists(args.recording):
+        print(f"🔍 No recording at {args.recording}")
+        routing(args)
+        return
+    rows = load_jsonl(args.recording)
+    print(f"🔍 Replaying {args.recording}")
+    cascade = Cascade(("ollama", "small"), ("ollama", "large"), args.threshold, args.min_confidence)
+    prices = {"small": args.small_price, "large": args.large_price}
+
+    def run(row, size):
+        """(latency, cost, answer) of one model on one prompt"""
+        answer, latency = row[size]["answer"], row[size]["latency"]
+        tokens = estimate_tokens(row["message"]) + estimate_tokens(answer or "")
+        return latency, tokens / 1000 * prices[size], answer
+
+    baseline = [run(row, "large") for row in rows]
+    cascaded = []
+    for row in rows:
+        plan = cascade.plan(row["message"])
+        if plan.small is None:
+            cascaded.append(run(row, "large"))
+            continue
+        latency, cost, answer = run(row, "small")
+        if cascade.should_escalate(plan, plan.small, row["message"], answer):
+            large_latency, large_cost, _ = run(row, "large")
+            latency, cost = latency + large_latency, cost + large_cost
+        cascaded.append((latency, cost, answer))
+
+    def summary(results):
+        return (sum(r[0] for r in results) / len(results), sum(r[1] for r in results))
+
+    base_latency, base_cost = summary(baseline)
+    cascade_latency, cascade_cost = summary(cascaded)
+    stats = cascade.metrics()
+    print(f"🎯 {len(rows)} prompts ({rows[0]['small']['model']} / {rows[0]['large']['model']}): {stats['simple']} simple, {stats['complex']} complex, {stats['code']} code, "
+          f"{stats['escalated']} escalated")
+    print(f"   always large: mean latency {base_latency:.2f}s, cost ${base_cost:.4f}")
+    print(f"   cascade:      mean latency {cascade_latency:.2f}s, cost ${cascade_cost:.4f}")
+    if base_latency and base_cost:
+        print(f"✅ Latency -{(1 - cascade_latency / base_latency) * 100:.0f}%, "
+              f"cost -{(1 - cascade_cost / base_cost) * 100:.0f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark complexity-based model cascade routing")
+    parser.add_argument("--prompts", default=PROMPTS)
+    commands = parser.add_subparsers(dest="command")
+
+    rec = commands.add_parser("record", help="Run every prompt on both models and save answers/latencies")
+    rec.add_argument("--small", required=True, help="Small Ollama model")
+    rec.add_argument("--large", required=True, help="Large Ollama model")
+    rec.add_argument("--timeout", type=float, default=120)
+    rec.add_argument("-o", "--output", default=RECORDING)
+
+    rep = commands.add_parser("replay", help="Simulate cascade routing over a recording (default)")
+    rep.add_argument("--recording", default=RECORDING)
+    rep.add_argument("--threshold", type=float, default=0.3)
+    rep.add_argument("--min-confidence", type=float, default=0.5)
+    rep.add_argument("--small-price", type=float, default=0.0001, help="$ per 1k tokens")
+    rep.add_argument("--large-price", type=float, default=0.002, help="$ per 1k tokens")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args)
+    else:
+        if args.command is None:
+            args = rep.parse_args([], namespace=args)
+        replay(args)
+
+if __name__ == "__main__":
+    main()
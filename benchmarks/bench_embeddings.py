@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+Embedding throughput benchmark (embeddings.py).
+
+    python benchmarks/bench_embeddings.py
+    python benchmarks/bench_embeddings.py --ollama http://localhost:11434 --model nomic-embed-text
+
+For each request size, measures texts per second for new texts (provider
+calls, batched) and for the same texts again (served from the memory-mapped
+cache), plus the cost of encoding the response as JSON floats or base64.
+Then sends many one-text requests at once to show them being grouped into
+batches. Without --ollama an in-process ollama_stub.py answers (768
+dimensions, --stub-delay seconds per text).
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from embeddings import EmbeddingCache, EmbeddingService
+from ollama_client import OllamaClient
+
+def texts_for(run: str, count: int):
+    return [f"{run} document {i}: the quick brown fox jumps over the lazy dog" for i in range(count)]
+
+async def bench_sizes(service: EmbeddingService, model: str, sizes, rounds: int) -> None:
+    print(f"{'texts':>7} {'new texts/s':>12} {'cached texts/s':>15} {'json ms':>9} {'base64 ms':>10}")
+    for size in sizes:
+        cold = warm = 0.0
+        for run in range(rounds):
+            texts = texts_for(f"size{size}-run{run}", size)
+            started = time.perf_counter()
+            await service.embed(texts, model)
+            cold += time.perf_counter() - started
+            started = time.perf_counter()
+            vectors, cached = await service.embed(texts, model)
+            warm += time.perf_counter() - started
+            assert cached == size
+        started = time.perf_counter()
+        json.dumps({"embeddings": vectors.tolist()})
+        as_json = time.perf_counter() - started
+        started = time.perf_counter()
+        base64.b64encode(vectors.astype("<f4", copy=False).tobytes()).decode("ascii")
+        as_base64 = time.perf_counter() - started
+        print(f"{size:>7} {size * rounds / cold:>12.0f} {size * rounds / warm:>15.0f} "
+              f"{as_json * 1000:>9.2f} {as_base64 * 1000:>10.2f}")
+
+async def bench_concurrent(service: EmbeddingService, model: str, requests: int) -> None:
+    calls = service.stats["provider_calls"]
+    texts = texts_for("concurrent", requests)
+    started = time.perf_counter()
+    await asyncio.gather(*(service.embed([text], model) for text in texts))
+    elapsed = time.perf_counter() - started
+    print(f"🎯 {requests} concurrent one-text requests: {elapsed * 1000:.1f} ms, "
+          f"{service.stats['provider_calls'] - calls} provider calls")
+
+async def run(args) -> None:
+    client = OllamaClient(args.ollama, connect=False)
+    loop = asyncio.get_running_loop()
+
+    async def embed_batch(texts, model):
+        return await loop.run_in_executor(None, client.embed, texts, model)
+
+    with tempfile.TemporaryDirectory() as directory:
+        service = EmbeddingService(EmbeddingCache(directory), embed_batch, max_batch=args.batch)
+        sizes = [int(size) for size in args.sizes.split(",")]
+        await bench_sizes(service, args.model, sizes, args.rounds)
+        await bench_concurrent(service, args.model, args.concurrent)
+        store = service.cache.store(args.model)
+        print(f"✅ Cache: {len(store)} vectors, {os.path.getsize(store.path) / 2**20:.1f} MiB on disk")
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding throughput benchmark")
+    parser.add_argument("--ollama", default=None, help="Ollama URL (default: in-process stub)")
+    parser.add_argument("--model", default="nomic-embed-text")
+    parser.add_argument("--sizes", default="1,16,64,256,1024,4096", help="Texts per request")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--batch", type=int, default=64, help="Texts per provider call")
+    parser.add_argument("--concurrent", type=int, default=256)
+    parser.add_argument("--stub-delay", type=float, default=0.0005)
+    args = parser.parse_args()
+
+    if not args.ollama:
+        from ollama_stub import StubState, serve
+        server = serve(StubState(0, [args.model], [args.model], load_delay=0, embed_delay=args.stub_delay))
+        args.ollama = f"http://127.0.0.1:{server.server_address[1]}"
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+GUI backend benchmark: startup time and per-message overhead of the server
+modes (HTTP, WebSocket) against the embedded backend.
+
+    python benchmarks/bench_gui_backend.py
+    python benchmarks/bench_gui_backend.py --messages 500 --ollama http://localhost:11435
+
+By default no provider is reachable, so every message is answered by the
+rule-based fallback and the timings are pure transport and routing overhead.
+With --ollama (a real server or ollama_stub.py) answers come from Ollama and
+are streamed, as the GUI sees them.
+
+Startup is measured from a cold process: for the server modes, from launching
+uvicorn until the first connection succeeds; for embedded, creating the
+backend in a fresh interpreter (importing main.py included).
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, len(ordered) * p // 100)]
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def bench_env(args, workdir: str) -> dict:
+    """Environment for the backend under test: private state files, only the chosen providers"""
+    return {
+        **os.environ,
+        "GEMINI_API_KEY": "", "GOOGLE_API_KEY": "", "OPENAI_API_KEY": "",
+        "OLLAMA_HOSTS": args.ollama or "http://127.0.0.1:9",
+        "STATE_BACKEND": "local",
+        "CLIENT_RPM": "0",  # No per-client limit: the benchmark is one very busy client
+        "JOBS_DB_PATH": os.path.join(workdir, "jobs.db"),
+        "REMINDERS_DB_PATH": os.path.join(workdir, "reminders.db"),
+        "RAG_INDEX_DIR": os.path.join(workdir, "rag_index"),
+        "PYTHONPATH": ROOT,
+    }
+
+def time_messages(backend, count: int) -> list:
+    backend.chat("warm up", on_delta=lambda text: None)
+    samples = []
+    for i in range(count):
+        started = time.perf_counter()
+        backend.chat(f"hello number {i}", on_delta=lambda text: None)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+def report(mode: str, startup: float, samples: list) -> None:
+    print(f"🎯 {mode:<9} startup {startup:6.2f}s | per message "
+          f"mean {sum(samples) / len(samples):7.3f} ms  p50 {percentile(samples, 50):7.3f} ms  "
+          f"p95 {percentile(samples, 95):7.3f} ms")
+
+def bench_server(args, transport: str, env: dict) -> None:
+    from backend_client import HttpBackend, WebSocketBackend
+    backend_class = WebSocketBackend if transport == "ws" else HttpBackend
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                backend = backend_class(f"http://127.0.0.1:{port}")
+                backend.health()
+                break
+            except Exception:
+                if server.poll() is not None:
+                    raise RuntimeError("Server exited during startup")
+                time.sleep(0.02)
+        startup = time.perf_counter() - started
+        report(transport, startup, time_messages(backend, args.messages))
+        backend.close()
+    finally:
+        server.terminate()
+        server.wait()
+
+def bench_embedded(args, env: dict) -> None:
+    # Startup in a fresh interpreter, so importing main.py is counted
+    code = ("import time; started = time.perf_counter(); from backend_client import EmbeddedBackend; "
+            "backend = EmbeddedBackend(); print('startup', time.perf_counter() - started); backend.close()")
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True)
+    startup = float(next(line.split()[1] for line in output.stdout.splitlines() if line.startswith("startup ")))
+
+    os.environ.update(env)
+    from backend_client import EmbeddedBackend
+    backend = EmbeddedBackend()
+    report("embedded", startup, time_messages(backend, args.messages))
+    backend.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare GUI backend modes")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--ollama", default=None, help="Ollama URL to answer from (default: no providers)")
+    parser.add_argument("--modes", default="http,ws,embedded")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = bench_env(args, workdir)
+        for mode in args.modes.split(","):
+            if mode == "embedded":
+                bench_embedded(args, env)
+            else:
+                bench_server(args, mode, env)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Reminder scheduler benchmark (reminders.py).
+
+    python benchmarks/bench_reminders.py              # 1M reminders
+    python benchmarks/bench_reminders.py --count 100000
+
+Measures heap insert/cancel/pop cost, bulk persistence and startup load of
+every reminder, and how late the single timer thread delivers reminders
+while the full set is pending.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from reminders import IndexedHeap, ReminderScheduler, ReminderStore
+
+def timed(label: str, count: int, fn):
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    print(f"🎯 {label:<28} {elapsed:7.2f}s  ({elapsed / max(count, 1) * 1e6:.2f} µs each)")
+    return result
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the reminder scheduler")
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--ops", type=int, default=100_000, help="Cancels and pops to time")
+    parser.add_argument("--fire", type=int, default=10_000, help="Reminders due during the delivery test")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    now = time.time()
+    dues = [now + 3600 + rng.random() * 86400 * 30 for _ in range(args.count)]
+
+    heap = IndexedHeap()
+    def fill():
+        for i, due in enumerate(dues):
+            heap.push(i, due)
+    timed(f"heap insert x{args.count:,}", args.count, fill)
+    victims = rng.sample(range(args.count), args.ops)
+    timed(f"heap cancel x{args.ops:,}", args.ops, lambda: [heap.remove(i) for i in victims])
+    timed(f"heap pop x{args.ops:,}", args.ops, lambda: [heap.pop() for _ in range(args.ops)])
+
+    workdir = tempfile.mkdtemp(prefix="bench_reminders_")
+    try:
+        store = ReminderStore(os.path.join(workdir, "reminders.db"))
+        timed(f"persist x{args.count:,}", args.count,
+              lambda: store.add_many((f"session-{i % 5000}", "Stand up and stretch", due)
+                                     for i, due in enumerate(dues)))
+
+        lateness = []
+        done = threading.Event()
+        def deliver(reminder):
+            lateness.append(time.time() - reminder["due_at"])
+            if len(lateness) >= args.fire:
+                done.set()
+            return store.claim_delivery(reminder["id"])
+
+        scheduler = ReminderScheduler(store, deliver)
+        timed(f"startup load x{args.count:,}", args.count, scheduler.start)
+        print(f"🔍 Timer threads: 1, pending reminders: {len(scheduler.heap):,}")
+
+        # Due over a 2s window that opens once scheduling is surely finished
+        start = time.time() + 2 + args.fire * 0.0005
+        timed(f"schedule x{args.fire:,}", args.fire, lambda: [
+            scheduler.schedule(f"session-{i}", "due soon", start + rng.random() * 2)
+            for i in range(args.fire)
+        ])
+        if time.time() > start:
+            print("⚠️  Scheduling overran the delivery window; lateness below includes it")
+        done.wait(timeout=30)
+        scheduler.stop()
+        if lateness:
+            print(f"🎯 delivered {len(lateness):,}: lateness p50 {percentile(lateness, 50) * 1000:.1f} ms, "
+                  f"p99 {percentile(lateness, 99) * 1000:.1f} ms, max {max(lateness) * 1000:.1f} ms")
+        store.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
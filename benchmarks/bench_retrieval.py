@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+Retrieval latency benchmark for the memory-mapped BM25 index (retrieval.py).
+
+Builds a synthetic index (Zipf-distributed vocabulary, like real text) and
+times queries against it. It also reports how close the (truncated-postings)
+top-k scores come to an exact search over every posting:
+
+    python benchmarks/bench_retrieval.py                  # 1M chunks
+    python benchmarks/bench_retrieval.py --chunks 100000 --queries 500
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from retrieval import Retriever, write_index
+
+def zipf_terms(rng, vocab_size: int, count: int) -> np.ndarray:
+    """Term ids whose frequencies fall off like natural language"""
+    ranks = np.arange(1, vocab_size + 1, dtype=np.float64)
+    probabilities = 1.0 / (ranks + 2.7)
+    probabilities /= probabilities.sum()
+    return rng.choice(vocab_size, size=count, p=probabilities).astype(np.int32)
+
+def build(index_dir: str, chunks: int, tokens_per_chunk: int, vocab_size: int, rng) -> float:
+    started = time.perf_counter()
+    doc_ids = np.repeat(np.arange(chunks, dtype=np.int32), tokens_per_chunk)
+    term_ids = zipf_terms(rng, vocab_size, chunks * tokens_per_chunk)
+    vocab = {f"t{i}": i for i in range(vocab_size)}
+    texts = [f"synthetic chunk {i}".encode() for i in range(chunks)]
+    write_index(index_dir, doc_ids, term_ids, vocab, texts,
+                np.zeros(chunks, dtype=np.int32), ["synthetic"])
+    return time.perf_counter() - started
+
+def percentile_ms(samples, q):
+    return np.percentile(samples, q) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark BM25 retrieval latency")
+    parser.add_argument("--chunks", type=int, default=1_000_000)
+    parser.add_argument("--tokens-per-chunk", type=int, default=60)
+    parser.add_argument("--vocab", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--terms-per-query", type=int, default=4)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--max-postings", type=int, help="Postings read per term (default RAG_MAX_POSTINGS)")
+    parser.add_argument("--index", help="Index directory to (re)use; default is a temporary one")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    index_dir = args.index or os.path.join(tempfile.mkdtemp(prefix="bench_retrieval_"), "index")
+    try:
+        if not os.path.exists(os.path.join(index_dir, "meta.json")):
+            print(f"🔧 Building {args.chunks:,} chunks x {args.tokens_per_chunk} tokens...")
+            print(f"✅ Built in {build(index_dir, args.chunks, args.tokens_per_chunk, args.vocab, rng):.1f}s")
+
+        started = time.perf_counter()
+        retriever = Retriever(index_dir, args.max_postings)
+        print(f"✅ Opened {len(retriever):,} chunks / {retriever.meta['postings']:,} postings "
+              f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        query_terms = zipf_terms(rng, args.vocab, args.queries * args.terms_per_query)
+        queries = [" ".join(f"t{t}" for t in query_terms[i:i + args.terms_per_query])
+                   for i in range(0, len(query_terms), args.terms_per_query)]
+
+        for label, run in (("search_ids", lambda q: retriever.search_ids(q, args.k)),
+                           ("search", lambda q: retriever.search(q, args.k))):
+            samples = []
+            for query in queries:
+                started = time.perf_counter()
+                run(query)
+                samples.append(time.perf_counter() - started)
+            print(f"🎯 {label:<10} p50 {percentile_ms(samples, 50):6.2f} ms   "
+                  f"p95 {percentile_ms(samples, 95):6.2f} ms   p99 {percentile_ms(samples, 99):6.2f} ms   "
+                  f"max {max(samples) * 1000:6.2f} ms")
+
+        exact = Retriever(index_dir, max_postings=retriever.meta["postings"])
+        ratios = []
+        for query in queries[:200]:
+            best = exact.search_ids(query, args.k)[1].sum()
+            if best > 0:
+                ratios.append(retriever.search_ids(query, args.k)[1].sum() / best)
+        print(f"🔍 top-{args.k} score vs exact search (max_postings={retriever.max_postings:,}): "
+              f"mean {np.mean(ratios):.3f}, worst {np.min(ratios):.3f}")
+    finally:
+        if not args.index:
+            shutil.rmtree(os.path.dirname(index_dir), ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
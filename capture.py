@@ -0,0 +1,514 @@
+#!/usr/bin/env python
+"""
+Traffic capture and replay for the AI Assistant backend.
+
+Capture: with CAPTURE_DIR set, CaptureMiddleware records every request to the
+captured paths (/chat, /chat/batch and /switch_model by default): the request
+body, status, provider, answer and timings. Each /ws message turn is recorded
+as the /chat request it stands for (marked "via": "ws"), so it replays over
+HTTP. Records go onto a queue and a
+writer thread appends them as compact JSON lines, so requests never wait on
+disk (or even on encoding JSON). Files rotate at CAPTURE_MAX_MB. Rotated files are gzipped, and only
+the newest CAPTURE_KEEP are kept.
+
+Replay: re-sends a capture to a backend at the original pace (or --speed
+times faster), recording each request's latency and provider:
+
+    python capture.py replay captures/ --url http://localhost:8001 -o run-a.json
+    python capture.py replay captures/ --launch --stub-ollama --speed 10 -o run-a.json
+    python capture.py replay captures/ --launch --root ../other-checkout --stub-ollama -o run-b.json
+    python capture.py compare run-a.json run-b.json
+
+--launch starts the backend itself (from --root, to compare builds), with no
+cloud providers and, with --stub-ollama, a local ollama_stub.py answering with
+fixed delays, so runs are repeatable.
+"""
+import argparse
+import functools
+import glob
+import gzip
+import json
+import os
+import queue
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CAPTURE_PATHS = ("/chat", "/chat/batch", "/switch_model", "/ws")
+CAPTURE_HEADERS = ("x-request-timeout", "x-client-id")
+
+def compact(record: dict) -> str:
+    return json.dumps(record, separators=(",", ":"), ensure_ascii=False)
+
+class CaptureWriter:
+    """Appends records to rotating JSONL files from a background thread"""
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 2**20, keep: int = 20, max_queue: int = 10000):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.written = 0
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[dict]]" = queue.Queue(maxsize=max_queue)
+        self._file = None
+        self._size = 0
+        self._sequence = 0
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="capture-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, record) -> None:
+        """Queue a record, or a function returning one to call on the writer thread.
+        
+        Never blocks: records are dropped if the writer falls behind.
+        """
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _open(self) -> None:
+        self._sequence += 1
+        name = f"capture-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._sequence:04d}.jsonl"
+        path = os.path.join(self.directory, name)
+        self._file = open(path, "a", encoding="utf-8")
+        self._size = 0
+
+    def _rotate(self) -> None:
+        path = self._file.name
+        self._file.close()
+        self._file = None
+        with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+            dst.writelines(src)
+        os.remove(path)
+        rotated = sorted(glob.glob(os.path.join(self.directory, "capture-*.jsonl.gz")))
+        for old in rotated[:-self.keep] if self.keep else []:
+            os.remove(old)
+
+    def _run(self) -> None:
+        while True:
+            record = self._queue.get()
+            batch = [record]
+            # Write whatever else is waiting in one go
+            while record is not None and len(batch) < 1000:
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(record)
+            lines = []
+            for item in batch:
+                if item is None:
+                    continue
+                try:
+                    lines.append(compact(item() if callable(item) else item) + "\n")
+                except Exception as e:
+                    self.dropped += 1
+                    print(f"⚠️  Capture record failed: {e}")
+            if lines:
+                try:
+                    if self._file is None:
+                        self._open()
+                    data = "".join(lines)
+                    self._file.write(data)
+                    self._file.flush()
+                    self._size += len(data)
+                    self.written += len(lines)
+                    if self._size >= self.max_bytes:
+                        self._rotate()
+                except OSError as e:
+                    self.dropped += len(lines)
+                    print(f"⚠️  Capture write failed: {e}")
+            if batch[-1] is None:
+                if self._file:
+                    self._file.close()
+                return
+
+    def stats(self) -> dict:
+        return {"written": self.written, "dropped": self.dropped, "queued": self._queue.qsize()}
+
+class CaptureMiddleware:
+    """ASGI middleware recording requests to the capture paths"""
+
+    def __init__(self, app, writer: CaptureWriter, paths=CAPTURE_PATHS, max_body: int = 256 * 1024):
+        self.app = app
+        self.writer = writer
+        self.paths = set(paths)
+        self.max_body = max_body
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket") or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+        if scope["type"] == "websocket":
+            return await self._capture_turns(scope, receive, send)
+
+        started = time.time()
+        clock = time.perf_counter()
+        request_body, response_body = [], []
+        response = {"status": None, "first_byte": None}
+
+        async def capture_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                request_body.append(message.get("body", b""))
+            return message
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["first_byte"] = time.perf_counter() - clock
+            elif message["type"] == "http.response.body" and sum(map(len, response_body)) < self.max_body:
+                response_body.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, capture_receive, capture_send)
+        finally:
+            headers = self._headers(scope)
+            self.writer.write(functools.partial(self._record, scope, started, time.perf_counter() - clock, headers,
+                                                b"".join(request_body), b"".join(response_body), response))
+
+    @staticmethod
+    def _headers(scope) -> dict:
+        return {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]
+                if key.decode("latin-1") in CAPTURE_HEADERS}
+
+    async def _capture_turns(self, scope, receive, send):
+        """Record each /ws message turn, from the client's message to its done (or error) event.
+
+        A connection's turns are answered one at a time in order, so deltas
+        belong to the oldest open turn. Only done, error and ready events are
+        decoded; the rest are told apart by their prefix.
+        """
+        headers = self._headers(scope)
+        session = {"id": None}
+        pending: List[dict] = []  # Open turns, oldest first
+
+        def finish(turn: dict, status: int, event: dict) -> None:
+            elapsed = time.perf_counter() - turn["clock"]
+            self.writer.write(functools.partial(self._turn_record, turn, status, elapsed, event,
+                                                session["id"], headers))
+
+        async def capture_receive():
+            message = await receive()
+            if message["type"] == "websocket.receive":
+                data = self._decode(message)
+                kind = data.get("type", "message") if isinstance(data, dict) else None
+                if kind == "message" and data.get("message"):
+                    pending.append({"data": data, "t": time.time(), "clock": time.perf_counter(),
+                                    "first_byte": None})
+                elif kind == "cancel" and pending and pending[0]["data"].get("id") == data.get("id"):
+                    pending.pop(0)  # The running turn stops without a done event
+            return message
+
+        async def capture_send(message):
+            text = message.get("text") if message["type"] == "websocket.send" else None
+            if text and text.startswith('{"type":"delta"'):
+                if pending and pending[0]["first_byte"] is None:
+                    pending[0]["first_byte"] = time.perf_counter() - pending[0]["clock"]
+            elif text and text.startswith(('{"type":"done"', '{"type":"error"', '{"type":"ready"')):
+                event = self._decode(message) or {}
+                if event.get("type") == "ready":
+                    session["id"] = event.get("session_id")
+                elif "id" in event:
+                    # A turn's own answer or error (the id is echoed, None if the client sent none)
+                    turn = next((turn for turn in pending if turn["data"].get("id") == event["id"]), None)
+                    if turn:
+                        pending.remove(turn)
+                        finish(turn, 200 if event["type"] == "done" else 503, event)
+                elif "retry_after" in event and pending:
+                    finish(pending.pop(), 429, event)  # Rate limited as soon as it arrived
+            await send(message)
+
+        await self.app(scope, capture_receive, capture_send)
+
+    @staticmethod
+    def _decode(message) -> Optional[dict]:
+        try:
+            return json.loads(message.get("text") or message.get("bytes") or "null")
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _turn_record(turn, status, elapsed, event, session_id, headers) -> dict:
+        data = turn["data"]
+        request = {key: data[key] for key in ("message", "provider", "model") if data.get(key) is not None}
+        if session_id:
+            request["session_id"] = session_id
+        if data.get("timeout") is not None:
+            headers = dict(headers, **{"x-request-timeout": str(data["timeout"])})
+        record = {"t": round(turn["t"], 6), "path": "/chat", "via": "ws", "method": "POST", "status": status,
+                  "ms": round(elapsed * 1000, 3),
+                  "ttfb_ms": round(turn["first_byte"] * 1000, 3) if turn["first_byte"] else None}
+        if headers:
+            record["headers"] = headers
+        record["request"] = request
+        if event.get("type") == "done":
+            record["provider"] = event.get("provider")
+            record["answer"] = event.get("answer")
+        return record
+
+    def _record(self, scope, started, elapsed, headers, request_body, response_body, response) -> dict:
+        record = {"t": round(started, 6), "path": scope["path"], "method": scope["method"],
+                  "status": response["status"], "ms": round(elapsed * 1000, 3),
+                  "ttfb_ms": round(response["first_byte"] * 1000, 3) if response["first_byte"] else None}
+        if headers:
+            record["headers"] = headers
+        try:
+            record["request"] = json.loads(request_body) if request_body else None
+        except ValueError:
+            record["request"] = request_body.decode("utf-8", "replace")
+        try:
+            body = json.loads(response_body)
+        except ValueError:
+            body = None  # Streamed NDJSON (batch) or cut off at max_body
+        if isinstance(body, dict):
+            record["provider"] = body.get("provider")
+            record["answer"] = body.get("answer")
+        return record
+
+def capture_from_env() -> Optional[CaptureWriter]:
+    """CaptureWriter for CAPTURE_DIR, or None when capture is off"""
+    directory = os.getenv("CAPTURE_DIR")
+    if not directory:
+        return None
+    writer = CaptureWriter(directory, max_bytes=int(float(os.getenv("CAPTURE_MAX_MB", "64")) * 2**20),
+                           keep=int(os.getenv("CAPTURE_KEEP", "20")))
+    print(f"✅ Capturing traffic to {directory}")
+    return writer
+
+def read_capture(paths: List[str]) -> List[dict]:
+    """Records from capture files and directories (plain or gzipped), in time order"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, "capture-*.jsonl*")))
+        else:
+            files.append(path)
+    records = []
+    for path in files:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        pass  # A line cut short by a crash
+    return sorted(records, key=lambda record: record["t"])
+
+def percentile(samples, p) -> Optional[float]:
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, len(ordered) * p // 100)], 3)
+
+def summarize(latencies: List[float]) -> dict:
+    return {"count": len(latencies),
+            "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else None,
+            **{f"p{p}_ms": percentile(latencies, p) for p in (50, 90, 95, 99)},
+            "max_ms": round(max(latencies), 3) if latencies else None}
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def launch_backend(root: str, env: dict, timeout: float = 60) -> Tuple[subprocess.Popen, str]:
+    """Start uvicorn for the main.py in root; returns the process and its URL once it answers"""
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Backend in {root} exited during startup")
+        try:
+            requests.get(url, timeout=1)
+            return process, url
+        except requests.RequestException:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"Backend in {root} did not start within {timeout}s")
+
+def replay(records: List[dict], url: str, speed: float, concurrency: int, timeout: float) -> List[dict]:
+    """Send records at their original offsets divided by speed (speed 0: back to back)"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    results: List[Optional[dict]] = [None] * len(records)
+
+    def send(index: int, record: dict, due: float):
+        started = time.perf_counter()
+        result = {"path": record["path"], "lag_ms": round((started - due) * 1000, 3),
+                  "original_ms": record.get("ms"), "original_provider": record.get("provider")}
+        try:
+            response = session.request(record.get("method", "POST"), url + record["path"],
+                                       json=record.get("request"), headers=record.get("headers") or {},
+                                       timeout=timeout)
+            result["status"] = response.status_code
+            body = response.json() if response.headers.get("content-type", "").startswith("application/json") else None
+            if isinstance(body, dict):
+                result["provider"] = body.get("provider")
+        except requests.RequestException as e:
+            result["status"] = None
+            result["error"] = str(e)
+        result["ms"] = round((time.perf_counter() - started) * 1000, 3)
+        results[index] = result
+
+    first = records[0]["t"] if records else 0
+    begin = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for index, record in enumerate(records):
+            due = begin + ((record["t"] - first) / speed if speed else 0)
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, index, record, due if speed else time.perf_counter())
+    return results
+
+def replay_report(results: List[dict]) -> dict:
+    chat = [r for r in results if r["path"] != "/switch_model"]
+    providers = {}
+    for result in chat:
+        providers[result.get("provider") or "none"] = providers.get(result.get("provider") or "none", 0) + 1
+    return {
+        "latency": summarize([r["ms"] for r in chat if r.get("status") == 200]),
+        "original_latency": summarize([r["original_ms"] for r in chat if r.get("original_ms") is not None]),
+        "errors": sum(1 for r in chat if r.get("status") != 200),
+        "providers": providers,
+        "max_lag_ms": max((r["lag_ms"] for r in results), default=0),
+    }
+
+def ks_distance(a: List[float], b: List[float]) -> float:
+    """Largest gap between the two empirical CDFs (0 = same distribution, 1 = disjoint).
+
+    Both CDFs are taken at every distinct value, so tied samples are counted together.
+    """
+    a, b = sorted(a), sorted(b)
+    i = j = 0
+    distance = 0.0
+    for value in sorted(set(a) | set(b)):
+        while i < len(a) and a[i] <= value:
+            i += 1
+        while j < len(b) and b[j] <= value:
+            j += 1
+        distance = max(distance, abs(i / len(a) - j / len(b)))
+    return round(distance, 4)
+
+def compare(first: dict, second: dict) -> None:
+    a = [r["ms"] for r in first["results"] if r["path"] != "/switch_model" and r.get("status") == 200]
+    b = [r["ms"] for r in second["results"] if r["path"] != "/switch_model" and r.get("status") == 200]
+    sa, sb = summarize(a), summarize(b)
+    print(f"{'':<10}{first['label']:>14}{second['label']:>14}{'change':>10}")
+    for key in ("count", "mean_ms", "p50_ms", "p90_ms", "p95_ms", "p99_ms", "max_ms"):
+        x, y = sa[key], sb[key]
+        change = f"{(y - x) / x * 100:+.1f}%" if x and y is not None and key != "count" else ""
+        print(f"{key:<10}{x if x is not None else '-':>14}{y if y is not None else '-':>14}{change:>10}")
+    print(f"{'errors':<10}{first['report']['errors']:>14}{second['report']['errors']:>14}")
+    if a and b:
+        print(f"🎯 KS distance between latency distributions: {ks_distance(a, b)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured traffic and compare runs")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    replay_parser = commands.add_parser("replay", help="Re-send captured requests to a backend")
+    replay_parser.add_argument("paths", nargs="+", help="Capture files or directories")
+    replay_parser.add_argument("--url", default="http://localhost:8001")
+    replay_parser.add_argument("--launch", action="store_true", help="Start a backend for the run")
+    replay_parser.add_argument("--root", default=os.path.dirname(os.path.abspath(__file__)),
+                               help="Checkout to launch (to compare builds)")
+    replay_parser.add_argument("--stub-ollama", action="store_true",
+                               help="With --launch: answer from ollama_stub.py only")
+    replay_parser.add_argument("--stub-delay", type=float, default=0.01, help="Stub seconds per word")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="Pace multiplier; 0 sends back to back")
+    replay_parser.add_argument("--concurrency", type=int, default=64)
+    replay_parser.add_argument("--timeout", type=float, default=60)
+    replay_parser.add_argument("--limit", type=int, default=None)
+    replay_parser.add_argument("--label", default=None, help="Name for this run in comparisons")
+    replay_parser.add_argument("-o", "--output", required=True, help="Results JSON file")
+
+    compare_parser = commands.add_parser("compare", help="Compare the latency of two replay runs")
+    compare_parser.add_argument("first")
+    compare_parser.add_argument("second")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.first, encoding="utf-8") as f:
+            first = json.load(f)
+        with open(args.second, encoding="utf-8") as f:
+            second = json.load(f)
+        compare(first, second)
+        return
+
+    records = [record for record in read_capture(args.paths) if record.get("request") is not None]
+    records = records[:args.limit] if args.limit else records
+    if not records:
+        print("❌ No captured requests found")
+        return
+
+    processes = []
+    url = args.url
+    workdir = tempfile.TemporaryDirectory()
+    try:
+        if args.launch:
+            # Fresh state for every run, and no capture of the replay itself
+            env = {**os.environ, "CAPTURE_DIR": "", "CLIENT_RPM": "0", "STATE_BACKEND": "local",
+                   "JOBS_DB_PATH": os.path.join(workdir.name, "jobs.db"),
+                   "REMINDERS_DB_PATH": os.path.join(workdir.name, "reminders.db")}
+            if args.stub_ollama:
+                port = free_port()
+                models = sorted({(r["request"].get("model") or "") for r in records if isinstance(r["request"], dict)}
+                                - {""}) or ["tiny:latest"]
+                stub = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ollama_stub.py")
+                processes.append(subprocess.Popen(
+                    [sys.executable, stub, "--ports", str(port), "--models", ",".join(models),
+                     "--loaded", ",".join(models), "--max-loaded", str(len(models)),
+                     "--token-delay", str(args.stub_delay), "--load-delay", "0"],
+                    stdout=subprocess.DEVNULL))
+                env.update(GEMINI_API_KEY="", OPENAI_API_KEY="", OLLAMA_HOSTS=f"http://127.0.0.1:{port}")
+                time.sleep(0.5)
+            backend, url = launch_backend(args.root, env)
+            processes.append(backend)
+
+        pace = f"{args.speed}x" if args.speed else "back to back"
+        print(f"🔄 Replaying {len(records)} requests to {url} ({pace})")
+        started = time.perf_counter()
+        results = replay(records, url, args.speed, args.concurrency, args.timeout)
+        report = replay_report(results)
+        report["wall_s"] = round(time.perf_counter() - started, 3)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+        workdir.cleanup()
+
+    label = args.label or os.path.splitext(os.path.basename(args.output))[0]
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"label": label, "url": url, "speed": args.speed, "report": report, "results": results}, f)
+    latency = report["latency"]
+    print(f"✅ {latency['count']} answered, {report['errors']} errors in {report['wall_s']}s | "
+          f"p50 {latency['p50_ms']} ms  p95 {latency['p95_ms']} ms  p99 {latency['p99_ms']} ms")
+    if report["max_lag_ms"] > 100:
+        print(f"⚠️  Requests went out up to {report['max_lag_ms']:.0f} ms late; raise --concurrency")
+    print(f"✅ Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+Complexity-based model cascade for the AI Assistant backend.
+
+A cheap, rule-based classifier looks at each message before it is routed.
+Chit-chat and short factual questions go to a small, fast model first; code
+and multi-step reasoning go straight to a large model (local or cloud). When
+the small model's answer looks unreliable (hedging, cut off, repetitive or far
+too short) the request is escalated to the large model as well.
+
+Configured with CASCADE_SMALL and CASCADE_LARGE as "provider/model", e.g.
+    CASCADE_SMALL=ollama/llama3.2:1b
+    CASCADE_LARGE=ollama/gpt-oss:20b   (or gemini/gemini-1.5-pro)
+"""
+import os
+import re
+import threading
+from typing import List, Optional, Tuple
+
+ModelRef = Tuple[str, str]
+
+# Matched at the start of a word, so "decode" or "description" don't count
+CODE_KEYWORDS = re.compile(r"\b(program|code|coding|function|cpp|c\+\+|python|java|algorithm|script|sql|"
+                           r"regex|compile|debug|stack trace|refactor)", re.IGNORECASE)
+CODE_MARKERS = re.compile(r"```|\bdef \w+\(|#include|=>|\bimport \w+|[{};]\s*$", re.MULTILINE)
+
+REASONING_KEYWORDS = ('explain', 'why', 'compare', 'analy', 'design', 'prove', 'derive', 'step by step',
+                      'trade-off', 'tradeoff', 'evaluate', 'summarize', 'plan ', 'difference between',
+                      'pros and cons', 'calculate', 'optimi', 'strategy', 'in detail')
+CHITCHAT = ('hello', 'hi', 'hey', 'thanks', 'thank you', 'bye', 'goodbye', 'good morning',
+            'good night', 'how are you', 'what is your name', 'who are you', 'ok', 'okay', 'cool')
+
+HEDGES = ("i'm not sure", "i am not sure", "i don't know", "i do not know", "not certain",
+          "i cannot", "i can't", "i'm unable", "i am unable", "as an ai", "unclear",
+          "i don't have enough information", "it depends")
+
+def is_code_request(text: str) -> bool:
+    """Whether a prompt asks for (or contains) code"""
+    return bool(CODE_KEYWORDS.search(text) or CODE_MARKERS.search(text))
+
+def complexity_score(message: str) -> float:
+    """Rough 0..1 estimate of how much reasoning a message needs"""
+    lowered = message.lower().strip()
+    if lowered.rstrip("!?.") in CHITCHAT:
+        return 0.0
+    words = len(lowered.split())
+    score = 0.0
+    if words > 25:
+        score += 0.2
+    if words > 80:
+        score += 0.2
+    score += 0.3 * min(2, sum(1 for keyword in REASONING_KEYWORDS if keyword in lowered))
+    if lowered.count("?") > 1 or "\n" in lowered:
+        score += 0.15
+    if re.search(r"\d+\s*[-+*/^=]\s*\d+|∫|√|\bequation\b|\bprobability\b", lowered):
+        score += 0.2
+    return min(1.0, score)
+
+def classify(message: str, threshold: float = 0.3) -> Tuple[str, float]:
+    """("code" | "complex" | "simple", complexity score)"""
+    score = complexity_score(message)
+    if is_code_request(message):
+        return "code", max(score, threshold)
+    return ("complex" if score >= threshold else "simple"), score
+
+def answer_confidence(question: str, answer: Optional[str]) -> float:
+    """0..1 guess at whether an answer can be trusted, from surface signals only"""
+    if not answer or not answer.strip():
+        return 0.0
+    lowered = answer.lower()
+    words = lowered.split()
+    confidence = 1.0
+    confidence -= 0.4 * min(2, sum(1 for hedge in HEDGES if hedge in lowered))
+    if len(words) < 4 and len(question.split()) > 8:
+        confidence -= 0.4  # A one-liner for a real question
+    if len(words) > 20 and not answer.rstrip().endswith((".", "!", "?", "`", ")", ":", "\"")):
+        confidence -= 0.2  # Probably cut off
+    trigrams = [tuple(words[i:i + 3]) for i in range(len(words) - 2)]
+    if len(trigrams) > 20 and len(set(trigrams)) / len(trigrams) < 0.5:
+        confidence -= 0.4  # Stuck repeating itself
+    return max(0.0, confidence)
+
+def parse_model_ref(spec: Optional[str]) -> Optional[ModelRef]:
+    """"ollama/llama3.2:1b" -> ("ollama", "llama3.2:1b")"""
+    if not spec or "/" not in spec:
+        return None
+    provider, model = spec.split("/", 1)
+    return provider.strip().lower(), model.strip()
+
+class CascadePlan:
+    """Models to try first for one message, and whether the first answer needs checking"""
+
+    def __init__(self, tier: str, score: float, models: List[ModelRef], small: Optional[ModelRef]):
+        self.tier = tier
+        self.score = score
+        self.models = models
+        self.small = small
+
+class Cascade:
+    def __init__(self, small: ModelRef, large: ModelRef, threshold: float = 0.3, min_confidence: float = 0.5):
+        self.small = small
+        self.large = large
+        self.threshold = threshold
+        self.min_confidence = min_confidence
+        self.stats = {"simple": 0, "complex": 0, "code": 0, "escalated": 0}
+        self._lock = threading.Lock()
+
+    def plan(self, message: str) -> CascadePlan:
+        tier, score = classify(message, self.threshold)
+        with self._lock:
+            self.stats[tier] += 1
+        if tier == "simple":
+            return CascadePlan(tier, score, [self.small, self.large], self.small)
+        return CascadePlan(tier, score, [self.large], None)
+
+    def should_escalate(self, plan: CascadePlan, model: ModelRef, message: str, answer: str) -> bool:
+        """True when the small model answered but not convincingly"""
+        if model != plan.small:
+            return False
+        if answer_confidence(message, answer) >= self.min_confidence:
+            return False
+        with self._lock:
+            self.stats["escalated"] += 1
+        return True
+
+    def metrics(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        small_first = stats["simple"]
+        return {
+            **stats,
+            "small": "/".join(self.small),
+            "large": "/".join(self.large),
+            "escalation_ratio": round(stats["escalated"] / small_first, 4) if small_first else 0.0,
+        }
+
+def cascade_from_env() -> Optional[Cascade]:
+    """Cascade from CASCADE_SMALL / CASCADE_LARGE, or None when not configured"""
+    small = parse_model_ref(os.getenv("CASCADE_SMALL"))
+    large = parse_model_ref(os.getenv("CASCADE_LARGE"))
+    if not small or not large:
+        return None
+    print(f"✅ Model cascade: {'/'.join(small)} → {'/'.join(large)}")
+    return Cascade(
+        small, large,
+        threshold=float(os.getenv("CASCADE_COMPLEXITY_THRESHOLD", "0.3")),
+        min_confidence=float(os.getenv("CASCADE_MIN_CONFIDENCE", "0.5"))
+    )
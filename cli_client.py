@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+"""
+Headless command-line client for bulk prompt runs.
+
+Reads prompts from a JSONL file (or stdin), sends them to the backend's /chat
+endpoint with a fixed number of concurrent requests over pooled connections, and
+appends one JSONL result per prompt. Results already in the output file are
+skipped on the next run, so an interrupted run can simply be restarted.
+
+Input lines may be a JSON object ({"id": ..., "message": ..., "context": {...}},
+"prompt" is accepted for "message") or a bare JSON string. Prompts without an
+"id" are numbered by their line in the input.
+
+When the backend is busy (429 or 503), every worker pauses for its
+Retry-After before trying again. Answers that came from no AI provider (a
+"Rule-based Fallback" or "Error Fallback" answer, or a canned one with
+X-Degraded) are recorded as failures, so a resumed run asks for them again.
+
+    python cli_client.py prompts.jsonl -o answers.jsonl --concurrency 16
+    cat prompts.jsonl | python cli_client.py - -o answers.jsonl
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Iterator, Optional, Set, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Statuses that mean "slow down", not "this prompt failed"
+BUSY_STATUSES = (429, 503)
+
+# Provider labels (prefixes) of answers no AI provider gave
+FALLBACK_PROVIDERS = ("Rule-based Fallback", "Error Fallback")
+
+def retry_after(response, default: float) -> float:
+    """Seconds from a Retry-After header given in seconds, else default"""
+    try:
+        return max(0.0, float(response.headers.get("Retry-After", "")))
+    except ValueError:
+        return default
+
+def read_prompts(source) -> Iterator[Tuple[str, dict]]:
+    """Yield (id, payload) for each prompt line, without loading the whole file"""
+    for line_number, line in enumerate(source, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            print(f"⚠️  Skipping line {line_number}: {e}", file=sys.stderr)
+            continue
+
+        if isinstance(item, str):
+            item = {"message": item}
+        message = item.get("message", item.get("prompt"))
+        if not message:
+            print(f"⚠️  Skipping line {line_number}: no message", file=sys.stderr)
+            continue
+
+        prompt_id = str(item.get("id", line_number))
+        yield prompt_id, {"message": message, "context": item.get("context", {})}
+
+def load_completed(output_path: str) -> Set[str]:
+    """Ids that already have a successful result in the output file"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Partial last line from a crash
+            if record.get("status") == "ok":
+                completed.add(str(record["id"]))
+    return completed
+
+class BulkChatClient:
+    """Sends prompts to /chat from a thread pool sharing one connection pool"""
+
+    def __init__(self, backend_url: str = "http://localhost:8001", concurrency: int = 8,
+                 timeout: float = 60, retries: int = 2, busy_wait: float = 600):
+        self.backend_url = backend_url.rstrip("/")
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.busy_wait = busy_wait  # Longest one prompt keeps retrying a busy backend
+
+        # Set when the backend says it is busy; every worker holds off until then
+        self._resume_at = 0.0
+        self._resume_lock = threading.Lock()
+
+        # Keep one keep-alive connection per worker instead of reconnecting per prompt
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def back_off(self, seconds: float) -> None:
+        """Make every worker wait at least this long before its next request"""
+        with self._resume_lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+    def wait_turn(self) -> None:
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def send(self, prompt_id: str, payload: dict) -> dict:
+        """Send one prompt, retrying connection errors, 5xx and fallback answers.
+
+        429 and 503 are retried after Retry-After for up to busy_wait seconds
+        without using up the retries.
+        """
+        error = None
+        latency_ms = None
+        attempt = 0
+        busy_since = None
+        while True:
+            self.wait_turn()
+            start = time.perf_counter()
+            try:
+                response = self.session.post(f"{self.backend_url}/chat", json=payload,
+                                             timeout=self.timeout)
+                latency_ms = round((time.perf_counter() - start) * 1000, 1)
+                degraded = response.headers.get("X-Degraded") == "1"
+                if response.status_code in BUSY_STATUSES or degraded:
+                    busy_since = busy_since or time.monotonic()
+                    error = "Backend busy (degraded answer)" if degraded else f"HTTP {response.status_code}"
+                    if time.monotonic() - busy_since >= self.busy_wait:
+                        break
+                    self.back_off(retry_after(response, min(2 ** attempt, 10)))
+                    continue
+                busy_since = None
+                if response.status_code < 500:
+                    result = response.json()
+                    if response.status_code == 200 and (result.get("provider") or "").startswith(FALLBACK_PROVIDERS):
+                        error = f"No provider answered: {result.get('answer')}"
+                    elif response.status_code == 200 and "answer" in result:
+                        return {
+                            "id": prompt_id,
+                            "status": "ok",
+                            "answer": result["answer"],
+                            "provider": result.get("provider"),
+                            "latency_ms": latency_ms,
+                        }
+                    else:
+                        error = result.get("error") or f"HTTP {response.status_code}"
+                        break
+                else:
+                    error = f"HTTP {response.status_code}"
+            except Exception as e:
+                latency_ms = round((time.perf_counter() - start) * 1000, 1)
+                error = str(e)
+            if attempt >= self.retries:
+                break
+            time.sleep(min(2 ** attempt, 10))
+            attempt += 1
+
+        return {"id": prompt_id, "status": "error", "error": error, "latency_ms": latency_ms}
+
+    def run(self, prompts: Iterator[Tuple[str, dict]], out, skip: Optional[Set[str]] = None,
+            progress_every: int = 100) -> dict:
+        """Stream prompts through the pool, writing each result as soon as it finishes"""
+        skip = skip or set()
+        stats = {"sent": 0, "ok": 0, "failed": 0, "skipped": 0}
+        started = time.perf_counter()
+        max_pending = self.concurrency * 2  # Bounded read-ahead keeps memory flat
+        pending = set()
+
+        def drain(block_until_below: int):
+            nonlocal pending
+            while len(pending) >= block_until_below:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record = future.result()
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    out.flush()
+                    stats["ok" if record["status"] == "ok" else "failed"] += 1
+                    finished = stats["ok"] + stats["failed"]
+                    if finished % progress_every == 0:
+                        rate = finished / (time.perf_counter() - started)
+                        print(f"📊 {finished} done ({stats['failed']} failed), {rate:.1f}/s",
+                              file=sys.stderr)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for prompt_id, payload in prompts:
+                if prompt_id in skip:
+                    stats["skipped"] += 1
+                    continue
+                drain(max_pending)
+                pending.add(executor.submit(self.send, prompt_id, payload))
+                stats["sent"] += 1
+            drain(1)
+
+        stats["elapsed_s"] = round(time.perf_counter() - started, 2)
+        return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of prompts through the AI Assistant backend")
+    parser.add_argument("input", help="JSONL prompt file, or - for stdin")
+    parser.add_argument("-o", "--output", help="JSONL results file (appended to; enables resume). Defaults to stdout")
+    parser.add_argument("--backend", default="http://localhost:8001", help="Backend base URL")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="Concurrent requests")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--retries", type=int, default=2,
+                        help="Retries for connection errors, 5xx and answers no provider gave")
+    parser.add_argument("--busy-wait", type=float, default=600,
+                        help="Seconds one prompt keeps retrying while the backend answers 429/503")
+    args = parser.parse_args()
+
+    skip = load_completed(args.output) if args.output else set()
+    if skip:
+        print(f"🔄 Resuming: {len(skip)} prompts already done", file=sys.stderr)
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    out = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    if out is not sys.stdout and out.tell() > 0:
+        with open(args.output, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                out.write("\n")  # Terminate a line cut short by a crash
+    client = BulkChatClient(args.backend, args.concurrency, args.timeout, args.retries, args.busy_wait)
+    try:
+        stats = client.run(read_prompts(source), out, skip)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"✅ Sent {stats['sent']}, ok {stats['ok']}, failed {stats['failed']}, "
+          f"skipped {stats['skipped']} in {stats['elapsed_s']}s", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+"""
+End-to-end request deadlines.
+
+A chat request gets one total time budget. Each provider attempt in the fallback
+chain receives a slice of what is left, so a slow first provider cannot use up
+the time the later ones (and the instant rule-based fallback) need.
+"""
+import time
+from typing import Optional, Union
+
+class Deadline:
+    """A point in time by which the whole request must be answered (None = no limit)"""
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds if seconds else None
+
+    def remaining(self) -> Optional[float]:
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def budget(self, attempts_left: int, share: float = 0.6) -> Optional[float]:
+        """Time for the next attempt: a share of what is left, or all of it for the last attempt"""
+        remaining = self.remaining()
+        if remaining is None or attempts_left <= 1:
+            return remaining
+        return remaining * share
+
+def parse_timeout(value: Optional[Union[str, float]], default: Optional[float], maximum: float) -> Optional[float]:
+    """Read a client-supplied timeout in seconds, clamped to the server maximum"""
+    try:
+        seconds = float(value) if value is not None else default
+    except (TypeError, ValueError):
+        seconds = default
+    if seconds is None or seconds <= 0:
+        return default
+    return min(seconds, maximum)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+"""
+Embeddings for the /embed endpoint: batching, deduplication and a disk cache.
+
+EmbeddingCache keeps one append-only file per model and dimension, where every
+record is a 16-byte content hash followed by the float32 vector. The file is
+opened memory-mapped and an in-memory dict maps hashes to rows, so a cached
+vector costs a dict lookup and a memory read. Records are only ever appended,
+and every process picks up rows the others added the next time it misses.
+
+EmbeddingService sits in front of the provider. Texts from concurrent requests
+are collected for up to max_wait seconds and sent in groups of up to
+max_batch, and a text that is already cached, already queued or repeated in
+the same request is never embedded twice.
+"""
+import asyncio
+import glob
+import hashlib
+import os
+import re
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl  # Serializes appends across worker processes (not on Windows)
+except ImportError:
+    fcntl = None
+
+KEY_BYTES = 16
+
+def content_key(model: str, text: str) -> bytes:
+    return hashlib.blake2b(f"{model}\0{text}".encode("utf-8"), digest_size=KEY_BYTES).digest()
+
+class EmbeddingStore:
+    """Vectors of one model and dimension in a file of (key, float32 vector) records"""
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self.dtype = np.dtype([("key", f"V{KEY_BYTES}"), ("vector", "<f4", (dim,))])
+        self._index: Dict[bytes, int] = {}
+        self._records: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        if not os.path.exists(path):
+            open(path, "ab").close()
+        with self._lock:
+            self._refresh()
+
+    def __len__(self):
+        return len(self._index)
+
+    def _refresh(self) -> None:
+        """Index records appended since the last look (by this or another process)"""
+        rows = os.path.getsize(self.path) // self.dtype.itemsize
+        known = len(self._records) if self._records is not None else 0
+        if rows <= known:
+            return
+        self._records = np.memmap(self.path, dtype=self.dtype, mode="r", shape=(rows,))
+        keys = self._records["key"][known:rows].tobytes()
+        for row in range(known, rows):
+            offset = (row - known) * KEY_BYTES
+            self._index.setdefault(keys[offset:offset + KEY_BYTES], row)
+
+    def lookup(self, keys: List[bytes]) -> Tuple[List[int], np.ndarray]:
+        """(positions of keys that are cached, their vectors in that order)"""
+        with self._lock:
+            rows = [self._index.get(key) for key in keys]
+            if any(row is None for row in rows):
+                self._refresh()
+                rows = [self._index.get(key) for key in keys]
+            found = [i for i, row in enumerate(rows) if row is not None]
+            if not found:
+                return [], np.empty((0, self.dim), dtype=np.float32)
+            return found, np.asarray(self._records["vector"][[rows[i] for i in found]])
+
+    def add(self, keys: List[bytes], vectors: np.ndarray) -> None:
+        records = np.empty(len(keys), dtype=self.dtype)
+        records["key"] = [np.void(key) for key in keys]
+        records["vector"] = vectors
+        with self._lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+            try:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                size = os.fstat(fd).st_size
+                if size % self.dtype.itemsize:
+                    os.ftruncate(fd, size - size % self.dtype.itemsize)  # Drop a record cut short by a crash
+                os.write(fd, records.tobytes())
+            finally:
+                os.close(fd)  # Also releases the lock
+            self._refresh()
+
+class EmbeddingCache:
+    """EmbeddingStores by model, in one directory"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._stores: Dict[Tuple[str, int], EmbeddingStore] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, model: str, dim: int) -> str:
+        return os.path.join(self.directory, f"{re.sub(r'[^A-Za-z0-9_.-]', '_', model)}.{dim}.f32")
+
+    def store(self, model: str, dim: Optional[int] = None) -> Optional[EmbeddingStore]:
+        """The model's store; without dim, whichever one exists on disk (None if none yet)"""
+        with self._lock:
+            if dim is None:
+                for (name, known_dim), store in self._stores.items():
+                    if name == model:
+                        return store
+                prefix = self._path(model, 0)[:-len("0.f32")]
+                existing = glob.glob(glob.escape(prefix) + "*.f32")
+                if not existing:
+                    return None
+                dim = int(existing[0][len(prefix):-len(".f32")])
+            key = (model, dim)
+            if key not in self._stores:
+                self._stores[key] = EmbeddingStore(self._path(model, dim), dim)
+            return self._stores[key]
+
+class EmbeddingService:
+    """Cache-first embedding with request batching and deduplication.
+
+    embed_batch(texts, model) is the provider call: it returns one vector per
+    text and is awaited with at most max_batch texts at a time.
+    """
+
+    def __init__(self, cache: EmbeddingCache, embed_batch: Callable[[List[str], str], Awaitable[list]],
+                 max_batch: int = 64, max_wait: float = 0.005):
+        self.cache = cache
+        self.embed_batch = embed_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending: Dict[str, List[Tuple[bytes, str]]] = {}
+        self._in_flight: Dict[Tuple[str, bytes], asyncio.Future] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self.stats = {"texts": 0, "cache_hits": 0, "deduplicated": 0, "embedded": 0, "provider_calls": 0}
+
+    async def embed(self, texts: List[str], model: str) -> Tuple[np.ndarray, int]:
+        """(vectors as a len(texts) x dim float32 array, how many came from the cache)"""
+        keys = [content_key(model, text) for text in texts]
+        unique: Dict[bytes, str] = dict(zip(keys, texts))
+        self.stats["texts"] += len(texts)
+        self.stats["deduplicated"] += len(texts) - len(unique)
+
+        vectors: Dict[bytes, np.ndarray] = {}
+        store = self.cache.store(model)
+        if store is not None:
+            unique_keys = list(unique)
+            found, rows = store.lookup(unique_keys)
+            for i, row in zip(found, rows):
+                vectors[unique_keys[i]] = row
+        cached = sum(1 for key in keys if key in vectors)
+        self.stats["cache_hits"] += len([key for key in unique if key in vectors])
+
+        waiting = []
+        loop = asyncio.get_running_loop()
+        for key, text in unique.items():
+            if key in vectors:
+                continue
+            future = self._in_flight.get((model, key))
+            if future is None:
+                future = self._in_flight[(model, key)] = loop.create_future()
+                self._queue(model, key, text)
+            else:
+                self.stats["deduplicated"] += 1
+            waiting.append((key, future))
+        for key, future in waiting:
+            vectors[key] = await future
+        return np.stack([vectors[key] for key in keys]).astype(np.float32, copy=False), cached
+
+    def _queue(self, model: str, key: bytes, text: str) -> None:
+        pending = self._pending.setdefault(model, [])
+        pending.append((key, text))
+        loop = asyncio.get_running_loop()
+        while len(pending) >= self.max_batch:
+            batch, pending[:] = pending[:self.max_batch], pending[self.max_batch:]
+            loop.create_task(self._run(model, batch))
+        if pending and model not in self._timers:
+            self._timers[model] = loop.call_later(self.max_wait, self._flush, model)
+
+    def _flush(self, model: str) -> None:
+        self._timers.pop(model, None)
+        batch = self._pending.pop(model, [])
+        if batch:
+            asyncio.get_running_loop().create_task(self._run(model, batch))
+
+    async def _run(self, model: str, batch: List[Tuple[bytes, str]]) -> None:
+        keys = [key for key, _ in batch]
+        self.stats["provider_calls"] += 1
+        try:
+            vectors = np.asarray(await self.embed_batch([text for _, text in batch], model), dtype=np.float32)
+            store = self.cache.store(model, vectors.shape[1])
+            await asyncio.get_running_loop().run_in_executor(None, store.add, keys, vectors)
+            self.stats["embedded"] += len(keys)
+        except Exception as e:
+            for key in keys:
+                future = self._in_flight.pop((model, key))
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, vector in zip(keys, vectors):
+            future = self._in_flight.pop((model, key))
+            if not future.done():
+                future.set_result(vector)
+
+    def metrics(self) -> dict:
+        return dict(self.stats, in_flight=len(self._in_flight))
@@ -1,61 +1,115 @@
 #!/usr/bin/env python
 """
 Google Gemini Pro Integration for AI Assistant
+
+chat_async sends conversations to Gemini as real multi-turn contents, without
+blocking a thread. Given a conversation id, it keeps a ChatSession for it that
+holds the conversation's turns. The Gemini API is stateless, so every turn
+still sends the whole stored history along with the new message. What the
+session saves is rebuilding the prompt from the client's context each time,
+and the history it sends is capped (see below). Sessions are shared by every
+GeminiClient, so a conversation that moves to another Gemini model keeps its
+history. They are kept for the GEMINI_MAX_SESSIONS most recently active
+conversations (least recently used are dropped), and each keeps its last
+GEMINI_SESSION_TURNS exchanges.
 """
 import google.generativeai as genai
+import asyncio
 import os
-from typing import Optional, Dict, Any
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable, List, Tuple
+
+class GeminiSession:
+    """A ChatSession for one conversation; one turn at a time"""
+
+    def __init__(self, chat):
+        self.chat = chat
+        self.lock = asyncio.Lock()
 
 class GeminiClient:
-    def __init__(self, api_key: Optional[str] = None):
+    # Conversation id -> GeminiSession, least recently used first (shared by all models)
+    _sessions: "OrderedDict[str, GeminiSession]" = OrderedDict()
+    _sessions_lock = threading.Lock()
+
+    def __init__(self, api_key: Optional[str] = None, model_name: str = 'gemini-1.5-flash',
+                 max_sessions: Optional[int] = None, session_turns: Optional[int] = None):
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
+        self.model_name = model_name
         self.model = None
         self.is_configured = False
+        self.max_sessions = max_sessions or int(os.getenv("GEMINI_MAX_SESSIONS", "1000"))
+        self.session_turns = session_turns or int(os.getenv("GEMINI_SESSION_TURNS", "20"))
+        # Built once and shared by every request
+        self.generation_config = genai.types.GenerationConfig(temperature=0.7, max_output_tokens=1000)
+        self._models: Dict[Optional[str], Any] = {}  # By system instruction
         self.setup_client()
-        
+
     def setup_client(self) -> bool:
         """Setup Gemini client"""
         if not self.api_key:
             print("❌ Gemini API key not found")
             return False
-            
+
         try:
             genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
+            self.model = genai.GenerativeModel(self.model_name)
+            self._models[None] = self.model
             self.is_configured = True
             print("✅ Connected to Google Gemini Pro")
             return True
         except Exception as e:
             print(f"❌ Failed to setup Gemini: {str(e)}")
             return False
-    
-    def generate_response(self, prompt: str, temperature: float = 0.7) -> str:
-        """Generate response using Gemini Pro"""
+
+    def generate_response(self, prompt: str, temperature: float = 0.7,
+                          on_delta: Optional[Callable[[str], None]] = None,
+                          timeout: Optional[float] = None) -> str:
+        """Generate response using Gemini Pro, streaming pieces to on_delta if given.
+
+        timeout is the total time allowed in seconds (no limit if None).
+        """
         if not self.is_configured:
             return "Gemini not configured"
-            
+
         try:
             # Configure generation parameters
-            generation_config = genai.types.GenerationConfig(
+            generation_config = self.generation_config if temperature == 0.7 else genai.types.GenerationConfig(
                 temperature=temperature,
                 max_output_tokens=1000,
             )
-            
-            response = self.model.generate_content(
-                prompt,
-                generation_config=generation_config
-            )
-            
-            return response.text
-            
+
+            request_options = {"timeout": timeout} if timeout else None
+
+            if on_delta is None:
+                response = self.model.generate_content(
+                    prompt,
+                    generation_config=generation_config,
+                    request_options=request_options
+                )
+                return response.text
+
+            stop_at = time.monotonic() + timeout if timeout else None
+            parts = []
+            for chunk in self.model.generate_content(prompt, generation_config=generation_config,
+                                                     stream=True, request_options=request_options):
+                if chunk.text:
+                    parts.append(chunk.text)
+                    on_delta(chunk.text)
+                if stop_at and time.monotonic() > stop_at:
+                    return "Gemini error: deadline exceeded"
+            return "".join(parts)
+
         except Exception as e:
             return f"Gemini error: {str(e)}"
-    
-    def chat_completion(self, messages: list) -> str:
+
+    def chat_completion(self, messages: list, on_delta: Optional[Callable[[str], None]] = None,
+                        timeout: Optional[float] = None) -> str:
         """Chat completion similar to OpenAI format"""
         if not self.is_configured:
             return "Gemini not configured"
-            
+
         # Convert messages to a single prompt
         prompt = ""
         for msg in messages:
@@ -67,16 +121,133 @@ class GeminiClient:
                 prompt += f"Human: {content}\n"
             elif role == 'assistant':
                 prompt += f"Assistant: {content}\n"
-        
+
         prompt += "Assistant: "
-        
-        return self.generate_response(prompt)
+
+        return self.generate_response(prompt, on_delta=on_delta, timeout=timeout)
+
+    def _model_for(self, instruction: Optional[str]):
+        """A model with this system instruction, created once"""
+        model = self._models.get(instruction)
+        if model is None:
+            model = self._models[instruction] = genai.GenerativeModel(self.model_name, system_instruction=instruction)
+        return model
+
+    @staticmethod
+    def _split_messages(messages: list) -> Tuple[Optional[str], List[dict], str]:
+        """(system instruction, earlier turns as Gemini contents, final user turn).
+
+        The first system message becomes the model's system instruction. Later
+        ones (context, documents) only apply to this turn, so they are put in
+        front of the user's message.
+        """
+        instruction = None
+        extras, contents = [], []
+        for msg in messages:
+            role, content = msg.get('role', 'user'), msg.get('content', '')
+            if role == 'system':
+                if instruction is None and not contents and not extras:
+                    instruction = content
+                else:
+                    extras.append(content)
+            elif role == 'assistant':
+                contents.append({"role": "model", "parts": [content]})
+            else:
+                contents.append({"role": "user", "parts": [content]})
+        last = contents.pop()["parts"][0] if contents and contents[-1]["role"] == "user" else ""
+        turn = "\n\n".join(extras + [last]) if extras else last
+        return instruction, contents, turn
+
+    def _session(self, conversation: str, model, restart: bool) -> GeminiSession:
+        """The conversation's session (a new one if restart), now the most recently used"""
+        with self._sessions_lock:
+            session = self._sessions.get(conversation)
+            if session is None or restart:
+                session = self._sessions[conversation] = GeminiSession(model.start_chat())
+            self._sessions.move_to_end(conversation)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return session
+
+    def end_session(self, conversation: str) -> None:
+        with self._sessions_lock:
+            self._sessions.pop(conversation, None)
+
+    async def chat_async(self, messages: list, on_delta: Optional[Callable[[str], None]] = None,
+                         timeout: Optional[float] = None, conversation: Optional[str] = None,
+                         restart: bool = False) -> str:
+        """Answer the last user message without blocking the event loop.
+
+        With a conversation id the turn goes through that conversation's
+        ChatSession (a new one if restart), which sends its stored history
+        plus the new message. Without one, the messages are sent as a one-off
+        multi-turn request.
+        """
+        if not self.is_configured:
+            return "Gemini not configured"
+
+        instruction, contents, turn = self._split_messages(messages)
+        model = self._model_for(instruction)
+        request_options = {"timeout": timeout} if timeout else None
+        try:
+            if conversation is None:
+                return await self._send(
+                    lambda stream: model.generate_content_async(
+                        contents + [{"role": "user", "parts": [turn]}], generation_config=self.generation_config,
+                        stream=stream, request_options=request_options),
+                    on_delta)
+
+            session = self._session(conversation, model, restart)
+            async with session.lock:
+                if session.chat.model is not model:
+                    # Same conversation on another model or system instruction
+                    session.chat = model.start_chat(history=session.chat.history)
+                chat = session.chat
+                history = list(chat.history)
+                try:
+                    answer = await self._send(
+                        lambda stream: chat.send_message_async(
+                            turn, generation_config=self.generation_config, stream=stream,
+                            request_options=request_options),
+                        on_delta)
+                except BaseException:
+                    chat.history = history  # Drop the unfinished turn
+                    raise
+                # Remember the plain message (not this turn's context or documents)
+                user_message = messages[-1].get('content', '') if messages else turn
+                turns = history + [{"role": "user", "parts": [user_message]}, {"role": "model", "parts": [answer]}]
+                chat.history = turns[-2 * self.session_turns:]
+                return answer
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return f"Gemini error: {str(e)}"
+
+    @staticmethod
+    async def _send(request, on_delta: Optional[Callable[[str], None]]) -> str:
+        if on_delta is None:
+            response = await request(False)
+            return response.text
+        parts = []
+        async for chunk in await request(True):
+            try:
+                text = chunk.text
+            except ValueError:
+                continue  # No text in this chunk (e.g. only finish metadata)
+            if text:
+                parts.append(text)
+                on_delta(text)
+        return "".join(parts)
+
+    def metrics(self) -> dict:
+        with self._sessions_lock:
+            return {"sessions": len(self._sessions), "max_sessions": self.max_sessions}
 
 # Test the Gemini client
 if __name__ == "__main__":
     print("Testing Google Gemini Pro integration...")
     client = GeminiClient()
-    
+
     if client.is_configured:
         response = client.generate_response("Hello! How are you today?")
         print(f"Gemini Response: {response}")
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+"""
+Per-model Ollama inference settings, and a tuner that finds them.
+
+A profile holds the runtime options that matter most on CPU-only machines:
+num_thread, num_ctx, num_batch and num_predict, plus keep_alive (how long the
+model stays loaded between requests). Profiles live in ollama_profiles.json
+(OLLAMA_PROFILES_PATH) and are picked up by the running server when the file
+changes. A profile can apply to every host, or to one host when it sits in
+that host's section of the file:
+
+    {"mistral:latest": {...}, "http://gpu-box:11434": {"mistral:latest": {...}}}
+
+    python inference_profiles.py tune --model mistral:latest
+    python inference_profiles.py tune --model mistral:latest --threads 4,8 --min-ctx 8192 --batch 128,512
+    python inference_profiles.py show
+
+The tuner measures each host on its own and saves a profile per host. It runs
+a prompt set once per thread count and batch size and keeps the fastest
+setting whose loaded size (from /api/ps) fits in memory. num_ctx is not a
+speed knob: a smaller context is always faster, so it is fixed at the context
+the requests need (--min-ctx, or more if the prompt set needs it).
+"""
+import argparse
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+from rate_limiter import estimate_tokens
+
+PROFILE_OPTIONS = ("num_thread", "num_ctx", "num_batch", "num_predict")
+DEFAULT_PROMPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "prompt_mix.jsonl")
+
+def is_host(key: str) -> bool:
+    """Host sections are keyed by URL; model names never contain ://"""
+    return "://" in key
+
+class InferenceProfiles:
+    """Profiles by model name (and by host), re-read when the file changes.
+
+    The file is checked at most every check_interval seconds, so requests
+    don't pay for a stat each.
+    """
+
+    def __init__(self, path: Optional[str] = None, check_interval: float = 5.0):
+        self.path = path or os.getenv("OLLAMA_PROFILES_PATH", "ollama_profiles.json")
+        self.default_keep_alive = os.getenv("OLLAMA_KEEP_ALIVE") or None
+        self.check_interval = check_interval
+        self._profiles: Dict[str, dict] = {}
+        self._mtime = None
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> None:
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            self._profiles, self._mtime = {}, None
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._profiles = json.load(f)
+            self._mtime = mtime
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Could not read inference profiles from {self.path}: {e}")
+
+    def all(self) -> Dict[str, dict]:
+        with self._lock:
+            self._load()
+            return dict(self._profiles)
+
+    def for_host(self, host: str) -> Dict[str, dict]:
+        """Every model's profile as requests to host get it"""
+        profiles = self.all()
+        shared = {key: profile for key, profile in profiles.items() if not is_host(key)}
+        return dict(shared, **profiles.get(host.rstrip("/"), {}))
+
+    def get(self, model: str, host: Optional[str] = None) -> dict:
+        """The model's profile for host, falling back to the one for every host"""
+        with self._lock:
+            self._load()
+            if host:
+                profile = self._profiles.get(host.rstrip("/"), {}).get(model)
+                if profile:
+                    return profile
+            return self._profiles.get(model, {})
+
+    def options(self, model: str, host: Optional[str] = None) -> dict:
+        """Ollama options set by the model's profile"""
+        profile = self.get(model, host)
+        return {key: profile[key] for key in PROFILE_OPTIONS if profile.get(key) is not None}
+
+    def keep_alive(self, model: str, host: Optional[str] = None) -> Optional[str]:
+        return self.get(model, host).get("keep_alive") or self.default_keep_alive
+
+    def save(self, model: str, profile: dict, host: Optional[str] = None) -> None:
+        """Save the model's profile, for one host if given"""
+        with self._lock:
+            self._checked_at = None
+            self._load()
+            if host:
+                host = host.rstrip("/")
+                profiles = dict(self._profiles, **{host: dict(self._profiles.get(host, {}), **{model: profile})})
+            else:
+                profiles = dict(self._profiles, **{model: profile})
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(profiles, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+            self._profiles, self._mtime = profiles, None
+
+def total_memory() -> Optional[int]:
+    """Physical memory in bytes, or None where the platform doesn't say"""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def load_prompts(path: str, limit: int) -> List[str]:
+    prompts = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                prompts.append(json.loads(line)["message"])
+    return prompts[:limit]
+
+def loaded_size(host: str, model: str) -> Optional[int]:
+    """Bytes the model takes up while loaded, from /api/ps"""
+    try:
+        response = requests.get(f"{host}/api/ps", timeout=5)
+        for entry in response.json().get("models", []):
+            if entry.get("name") == model or entry.get("model") == model:
+                return entry.get("size")
+    except (requests.RequestException, ValueError):
+        pass
+    return None
+
+def required_context(prompts: List[str], num_predict: int, minimum: int) -> int:
+    """num_ctx the profile must give: minimum, or more if the longest prompt and its answer need it"""
+    needed = max(estimate_tokens(prompt) for prompt in prompts) + num_predict
+    return max(minimum, -(-needed // 1024) * 1024)
+
+def run_candidate(host: str, model: str, options: dict, prompts: List[str], timeout: float) -> dict:
+    """Time a prompt set with one setting; the first (warm-up) call also loads the model"""
+    def generate(prompt: str) -> dict:
+        response = requests.post(f"{host}/api/generate", json={
+            "model": model, "prompt": prompt, "stream": False, "options": options, "keep_alive": "5m"
+        }, timeout=timeout)
+        if response.status_code != 200:
+            raise RuntimeError(f"{response.status_code} - {response.text[:200]}")
+        return response.json()
+
+    generate(prompts[0])
+    elapsed, tokens, eval_seconds = [], 0, 0.0
+    for prompt in prompts:
+        started = time.perf_counter()
+        result = generate(prompt)
+        elapsed.append(time.perf_counter() - started)
+        tokens += result.get("eval_count", 0)
+        eval_seconds += result.get("eval_duration", 0) / 1e9
+    return {
+        "mean_s": round(sum(elapsed) / len(elapsed), 3),
+        "tokens_per_s": round(tokens / eval_seconds, 2) if eval_seconds else None,
+        "size": loaded_size(host, model),
+    }
+
+def tune(host: str, model: str, prompts: List[str], threads: List[int], batches: List[int],
+         num_ctx: int, num_predict: int, keep_alive: str, memory_limit: Optional[int],
+         timeout: float = 300) -> Optional[dict]:
+    """Try every thread count and batch size at num_ctx; return the fastest profile that fits, or None"""
+    best = None
+    for num_thread, num_batch in itertools.product(threads, batches):
+        options = {"num_thread": num_thread, "num_ctx": num_ctx, "num_batch": num_batch,
+                   "num_predict": num_predict}
+        label = f"num_thread={num_thread} num_ctx={num_ctx} num_batch={num_batch}"
+        try:
+            result = run_candidate(host, model, options, prompts, timeout)
+        except (requests.RequestException, RuntimeError) as e:
+            print(f"❌ {label}: {e}")
+            continue
+        size = result["size"]
+        if memory_limit and size and size > memory_limit:
+            print(f"⚠️  {label}: {size / 2**30:.1f} GiB loaded, over the {memory_limit / 2**30:.1f} GiB limit")
+            continue
+        print(f"🎯 {label}: {result['mean_s']:.2f}s per prompt, {result['tokens_per_s']} tokens/s")
+        if best is None or result["mean_s"] < best["mean_s"]:
+            best = dict(options, keep_alive=keep_alive, **result, tuned_at=time.time())
+    return best
+
+def int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+def str_list(value: str) -> List[str]:
+    return [item.strip().rstrip("/") for item in value.split(",") if item.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune Ollama inference settings per model")
+    parser.add_argument("--profiles", default=None, help="Profile file (default OLLAMA_PROFILES_PATH)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    cpus = os.cpu_count() or 4
+    tune_parser = commands.add_parser("tune", help="Benchmark candidate settings and save the fastest per host")
+    tune_parser.add_argument("--model", required=True)
+    tune_parser.add_argument("--host", type=str_list, default=str_list(os.getenv("OLLAMA_HOSTS") or "http://localhost:11434"),
+                             help="Hosts to tune, comma separated (default OLLAMA_HOSTS)")
+    tune_parser.add_argument("--prompts", default=DEFAULT_PROMPTS, help="JSONL file of {\"message\": ...}")
+    tune_parser.add_argument("--limit", type=int, default=8, help="Prompts per candidate")
+    tune_parser.add_argument("--threads", type=int_list, default=sorted({max(1, cpus // 2), cpus}))
+    tune_parser.add_argument("--min-ctx", type=int, default=4096,
+                             help="Context size the requests need; the profile never uses less")
+    tune_parser.add_argument("--batch", type=int_list, default=[128, 256, 512])
+    tune_parser.add_argument("--num-predict", type=int, default=None,
+                             help="Answer length cap to save in the profile (benchmarks use 200 if unset)")
+    tune_parser.add_argument("--keep-alive", default="30m")
+    tune_parser.add_argument("--max-memory-gb", type=float, default=None,
+                             help="Largest loaded model size allowed (default 80%% of RAM)")
+    tune_parser.add_argument("--dry-run", action="store_true", help="Don't save the result")
+    show_parser = commands.add_parser("show", help="Print the saved profiles")
+    show_parser.add_argument("--host", default=None, help="Only the profiles this host uses")
+    args = parser.parse_args()
+
+    profiles = InferenceProfiles(args.profiles)
+    if args.command == "show":
+        saved = profiles.for_host(args.host) if args.host else profiles.all()
+        print(json.dumps(saved, indent=2, sort_keys=True))
+        return
+
+    if args.max_memory_gb:
+        memory_limit = int(args.max_memory_gb * 2**30)
+    else:
+        memory = total_memory()
+        memory_limit = int(memory * 0.8) if memory else None
+    prompts = load_prompts(args.prompts, args.limit)
+    num_predict = args.num_predict or 200
+    num_ctx = required_context(prompts, num_predict, args.min_ctx)
+    candidates = len(args.threads) * len(args.batch)
+    for host in args.host:
+        print(f"🔧 Tuning {args.model} on {host}: {candidates} candidates × {len(prompts)} prompts at num_ctx={num_ctx}")
+        best = tune(host, args.model, prompts, args.threads, args.batch, num_ctx,
+                    num_predict, args.keep_alive, memory_limit)
+        if best is None:
+            print(f"❌ No candidate setting worked on {host}")
+            continue
+        print(f"✅ Fastest on {host}: num_thread={best['num_thread']} num_batch={best['num_batch']} "
+              f"({best['mean_s']:.2f}s per prompt)")
+        if args.num_predict is None:
+            best.pop("num_predict")  # Keep the per-request defaults (longer for code)
+        if not args.dry_run:
+            profiles.save(args.model, best, host)
+            print(f"✅ Saved to {profiles.path}")
+
+if __name__ == "__main__":
+    main()
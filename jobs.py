@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+"""
+Background job engine for the /task endpoint.
+
+Jobs are rows in a SQLite table, so they survive restarts and every worker
+process sees the same queue. Worker threads claim queued jobs one at a time
+and hold a lease on each job they run, renewing it while it runs. A job whose
+lease runs out (its process died) goes back to the queue. After
+MAX_ATTEMPTS such restarts it is marked failed instead. On a graceful
+shutdown, running jobs are handed back to the queue straight away, without
+counting as an attempt. Only a user's cancel ends a job as cancelled.
+
+Job states: queued → running → succeeded | failed | cancelled
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, List, Optional
+
+JOB_COLUMNS = ("id", "task", "parameters", "status", "result", "error", "progress",
+               "created_at", "started_at", "finished_at", "attempts")
+
+class JobCancelled(Exception):
+    """Raised inside a task when its job has been cancelled"""
+
+class JobStore:
+    """The jobs table"""
+
+    def __init__(self, path: str = "assistant_jobs.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, task TEXT NOT NULL, parameters TEXT NOT NULL, "
+            "status TEXT NOT NULL, result TEXT, error TEXT, progress TEXT, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, owner TEXT, lease_until REAL, "
+            "cancel_requested INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def _row(self, row) -> Optional[dict]:
+        if row is None:
+            return None
+        job = dict(zip(JOB_COLUMNS, row))
+        for key in ("parameters", "result", "progress"):
+            job[key] = json.loads(job[key]) if job[key] is not None else None
+        job["job_id"] = job.pop("id")
+        return job
+
+    def create(self, task: str, parameters: dict) -> dict:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, task, parameters, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, task, json.dumps(parameters), time.time()),
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row(row)
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[dict]:
+        query = f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs"
+        params: tuple = ()
+        if status:
+            query += " WHERE status = ?"
+            params = (status,)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY created_at DESC LIMIT ?", params + (limit,)).fetchall()
+        return [self._row(row) for row in rows]
+
+    def claim(self, owner: str, lease: float) -> Optional[dict]:
+        """Take the oldest queued job for owner, or None if there is none"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', owner = ?, lease_until = ?, "
+                        "started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                        (owner, now + lease, now, row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(row[0]) if row else None
+
+    def finish(self, job_id: str, owner: str, status: str, result: Any = None, error: Optional[str] = None) -> bool:
+        """Record the outcome; False if owner no longer holds the job (its lease ran out or was released)"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, owner = NULL, "
+                "lease_until = NULL WHERE id = ? AND owner = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id, owner),
+            )
+        return cursor.rowcount > 0
+
+    def release(self, owner: str, job_ids: List[str]) -> int:
+        """Put owner's running jobs back in the queue (shutdown), unless a cancel was asked for.
+
+        A release is not a failed attempt, so it doesn't count towards MAX_ATTEMPTS.
+        """
+        if not job_ids:
+            return 0
+        marks = ", ".join("?" * len(job_ids))
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL, lease_until = NULL, "
+                f"attempts = MAX(0, attempts - 1) WHERE owner = ? AND status = 'running' "
+                f"AND cancel_requested = 0 AND id IN ({marks})",
+                (owner, *job_ids),
+            )
+        return cursor.rowcount
+
+    def set_progress(self, job_id: str, progress: Any) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET progress = ? WHERE id = ?", (json.dumps(progress), job_id))
+
+    def request_cancel(self, job_id: str) -> Optional[dict]:
+        """Cancel a queued job outright; flag a running one so its task can stop"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                (now, job_id),
+            )
+            self._conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,)
+            )
+        return self.get(job_id)
+
+    def renew(self, owner: str, job_ids: List[str], lease: float) -> List[str]:
+        """Extend owner's leases; returns the ids among them that were asked to cancel"""
+        if not job_ids:
+            return []
+        marks = ", ".join("?" * len(job_ids))
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET lease_until = ? WHERE owner = ? AND id IN ({marks})",
+                (time.time() + lease, owner, *job_ids),
+            )
+            rows = self._conn.execute(
+                f"SELECT id FROM jobs WHERE cancel_requested = 1 AND id IN ({marks})", job_ids
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def recover(self, max_attempts: int) -> int:
+        """Requeue running jobs whose lease ran out; give up on ones that keep dying"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Worker stopped too many times', "
+                "finished_at = ?, owner = NULL WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (now, now, max_attempts),
+            )
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL, lease_until = NULL "
+                "WHERE status = 'running' AND lease_until < ?",
+                (now,),
+            )
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class JobContext:
+    """What a running task can see and do"""
+
+    def __init__(self, engine: "JobEngine", job: dict):
+        self.engine = engine
+        self.job_id = job["job_id"]
+        self.parameters = job["parameters"]
+        self.cancel_event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self) -> None:
+        if self.cancelled:
+            raise JobCancelled()
+
+    def progress(self, value: Any) -> None:
+        """Report progress, shown when the job is polled"""
+        self.engine.store.set_progress(self.job_id, value)
+
+    def ask(self, message: str, timeout: float = 120, **options) -> dict:
+        """Ask the AI providers, returning {"answer", "provider"}; stops early if the job is cancelled"""
+        if self.engine.llm is None:
+            raise RuntimeError("No AI providers available to background jobs")
+        future: Future = self.engine.llm(message, timeout=timeout, **options)
+        while True:
+            try:
+                return future.result(timeout=0.5)
+            except FutureTimeout:
+                if self.cancelled:
+                    future.cancel()
+                    raise JobCancelled()
+
+class JobEngine:
+    """Worker threads running jobs from a JobStore.
+
+    handlers maps task names to functions called as handler(job: JobContext).
+    Their return value (anything JSON-serializable) becomes the job result.
+    llm(message, timeout=..., **options) is how tasks reach the AI providers.
+    It must return a concurrent.futures.Future.
+    """
+
+    MAX_ATTEMPTS = 3
+
+    def __init__(self, store: JobStore, handlers: Dict[str, Callable[[JobContext], Any]],
+                 workers: int = 2, lease: float = 30.0, poll_interval: float = 1.0,
+                 llm: Optional[Callable[..., Future]] = None):
+        self.store = store
+        self.handlers = handlers
+        self.workers = workers
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.llm = llm
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._running: Dict[str, JobContext] = {}
+        self._running_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        recovered = self.store.recover(self.MAX_ATTEMPTS)
+        if recovered:
+            print(f"🔄 Requeued {recovered} interrupted job(s)")
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._maintain, name="job-leases", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        print(f"✅ Job engine started with {self.workers} workers")
+
+    def stop(self) -> None:
+        """Stop taking jobs and hand running ones back to the queue for the next start"""
+        self._stop.set()
+        self._wake.set()
+        with self._running_lock:
+            running = dict(self._running)
+        try:
+            released = self.store.release(self.owner, list(running))
+        except sqlite3.Error as e:
+            print(f"⚠️  Could not requeue running jobs: {e}")  # Let them finish
+            return
+        if released:
+            print(f"🔄 Requeued {released} running job(s) for the next start")
+        for context in running.values():
+            context.cancel_event.set()  # Stop work whose outcome would not be kept anyway
+
+    def submit(self, task: str, parameters: Optional[dict] = None) -> dict:
+        if task not in self.handlers:
+            raise KeyError(task)
+        job = self.store.create(task, parameters or {})
+        self._wake.set()
+        return job
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        job = self.store.request_cancel(job_id)
+        with self._running_lock:
+            context = self._running.get(job_id)
+        if context:
+            context.cancel_event.set()
+        return job
+
+    def _work(self) -> None:
+        while not self._stop.is_set():
+            try:
+                job = self.store.claim(self.owner, self.lease)
+            except sqlite3.Error as e:
+                print(f"⚠️  Job queue unavailable: {e}")
+                job = None
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job: dict) -> None:
+        context = JobContext(self, job)
+        with self._running_lock:
+            self._running[context.job_id] = context
+        print(f"🔧 Job {context.job_id[:8]} ({job['task']}) started")
+        try:
+            result = self.handlers[job["task"]](context)
+            if context.cancelled:
+                raise JobCancelled()
+            outcome, message = ("succeeded", result, None), f"✅ Job {context.job_id[:8]} succeeded"
+        except JobCancelled:
+            outcome, message = ("cancelled", None, None), f"⚠️  Job {context.job_id[:8]} cancelled"
+        except Exception as e:
+            outcome, message = ("failed", None, str(e)), f"❌ Job {context.job_id[:8]} failed: {e}"
+        try:
+            if self.store.finish(context.job_id, self.owner, *outcome):
+                print(message)
+            else:
+                print(f"🔄 Job {context.job_id[:8]} was handed back to the queue, outcome not kept")
+        finally:
+            with self._running_lock:
+                self._running.pop(context.job_id, None)
+
+    def _maintain(self) -> None:
+        """Keep our leases alive, pass on cancels made by other processes, requeue orphans"""
+        while not self._stop.wait(self.lease / 3):
+            try:
+                with self._running_lock:
+                    running = dict(self._running)
+                for job_id in self.store.renew(self.owner, list(running), self.lease):
+                    running[job_id].cancel_event.set()
+                if self.store.recover(self.MAX_ATTEMPTS):
+                    self._wake.set()
+            except sqlite3.Error as e:
+                print(f"⚠️  Job lease renewal failed: {e}")
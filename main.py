@@ -1,10 +1,37 @@
 import os
-from fastapi import FastAPI, Request
+import json
+import asyncio
+import base64
+import functools
+import hmac
+import re
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Callable, List, Optional, Tuple
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse, JSONResponse, Response, PlainTextResponse
 from pydantic import BaseModel
 from openai import OpenAI
 from dotenv import load_dotenv
 from ollama_client import OllamaClient
 from gemini_client import GeminiClient
+from shared_state import create_state_store
+from provider_pool import ProviderPool, ProviderLane
+from rate_limiter import RateLimiter, rate_limiter_from_env, estimate_tokens
+from singleflight import SingleFlight, request_key
+from deadline import Deadline, parse_timeout
+from retrieval import load_retriever
+from cascade import cascade_from_env
+from jobs import JobEngine, JobStore
+from reminders import ReminderScheduler, ReminderStore
+from profiling import LoopLagMonitor, SamplingProfiler, StageTimers
+from capture import CaptureMiddleware, capture_from_env
+from embeddings import EmbeddingCache, EmbeddingService
+from shadow import shadow_from_env
+from admission import admission_from_env
+from prefetch import prefetcher_from_env
 
 # Load environment variables
 load_dotenv()
@@ -23,11 +50,204 @@ except Exception as e:
 # 3. Ollama (local, slower but private)
 ollama_client = OllamaClient()
 
-# Track selected provider (default to auto priority)
-selected_provider = None  # None means use priority order, or specific provider name
+# Routing state shared by all worker processes:
+#   selected_provider - None means use priority order, or specific provider name
+#   <provider>_model  - Default model per provider, picked through /switch_model
+#   session:<id>      - {"provider", "model"} preference for one session
+state = create_state_store()
+
+def on_state_change(key, value):
+    """Apply model switches made by other workers to our local Ollama client"""
+    if key == "ollama_model" and value and value != ollama_client.current_model:
+        ollama_client.switch_model(value)
+
+if state.get("ollama_model"):
+    on_state_change("ollama_model", state.get("ollama_model"))
+state.subscribe(on_state_change)
+
+# Local document index (built with `python retrieval.py ingest <paths>`), if any
+retriever = load_retriever()
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "3"))
+RAG_MIN_SCORE = float(os.getenv("RAG_MIN_SCORE", "1.0"))
+
+# Providers in default priority order, and the models each one offers
+PROVIDER_ORDER = ("gemini", "openai", "ollama")
+GEMINI_MODELS = [m.strip() for m in os.getenv("GEMINI_MODELS", "gemini-1.5-flash,gemini-1.5-pro").split(",") if m.strip()]
+OPENAI_MODELS = [m.strip() for m in os.getenv("OPENAI_MODELS", "gpt-3.5-turbo,gpt-4").split(",") if m.strip()]
+
+def default_model(provider: str) -> Optional[str]:
+    """Model used for a provider when neither the request nor its session picks one"""
+    if provider == "gemini":
+        return state.get("gemini_model") or gemini_client.model_name
+    if provider == "openai":
+        return state.get("openai_model") or os.getenv("OPENAI_MODEL", OPENAI_MODELS[0])
+    if provider == "ollama":
+        return state.get("ollama_model") or ollama_client.current_model
+    return None
+
+def provider_label(provider: str, model: Optional[str]) -> str:
+    names = {"gemini": "Google Gemini", "openai": "OpenAI", "ollama": "Ollama"}
+    return f"{names[provider]} ({model})"
+
+def make_gemini(model):
+    return gemini_client if model == gemini_client.model_name else GeminiClient(model_name=model)
+
+def make_openai(model):
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY")) if openai_client else None
+
+def make_ollama(model):
+    return ollama_client.for_model(model) if model else ollama_client
+
+# Small-model-first routing by message complexity (CASCADE_SMALL / CASCADE_LARGE)
+cascade = cascade_from_env()
+
+# One client and worker-thread lane per (provider, model)
+provider_pool = ProviderPool({"gemini": make_gemini, "openai": make_openai, "ollama": make_ollama})
+
+# Background jobs get lanes of their own, so they never hold up chat requests
+job_pool = ProviderPool(provider_pool.factories, max_workers=int(os.getenv("JOB_LANE_WORKERS", "1")), overrides={})
+
+# Which pool the current request draws its lanes from
+lane_pool: ContextVar[ProviderPool] = ContextVar("lane_pool", default=provider_pool)
+
+# Shadow calls to a candidate model (SHADOW_FRACTION / SHADOW_CANDIDATE) also get their own lanes
+shadow_pool = ProviderPool(provider_pool.factories, max_workers=int(os.getenv("SHADOW_LANE_WORKERS", "1")), overrides={})
+
+async def shadow_ask(provider: str, model: str, messages: list, timeout: float) -> Optional[str]:
+    lane_pool.set(shadow_pool)
+    provider_limits.set(None)
+    quota_limiter.set(shadow_limiter)
+    return await ask_provider(provider, model, messages, timeout=timeout)
+
+shadow_mirror = shadow_from_env(shadow_ask, provider_label)
+
+# Speculative answers to likely follow-ups (PREFETCH_FOLLOWUPS=1), computed on lanes of their own
+prefetch_pool = ProviderPool(provider_pool.factories, max_workers=1, overrides={})
+PREFETCH_TIMEOUT = float(os.getenv("PREFETCH_TIMEOUT", "60"))
+
+async def prefetch_answer(session_id: str, prompt: str, context: dict) -> Optional[tuple]:
+    """(answer, provider label) for a predicted follow-up, from the model the session would use"""
+    lane_pool.set(prefetch_pool)
+    provider_limits.set(None)
+    quota_limiter.set(prefetch_limiter)
+    provider, model = resolve_selection(ChatRequest(message=prompt, session_id=session_id))
+    # No session id: the speculative turn must not enter the session's Gemini chat
+    req = ChatRequest(message=prompt, context=context, provider=provider, model=model)
+    result = await route_chat(req, deadline=Deadline(PREFETCH_TIMEOUT))
+    return (result["answer"], result["provider"]) if answered_by_provider(result) else None
+
+def providers_idle() -> bool:
+    return not admission or admission.in_flight == 0
+
+prefetcher = prefetcher_from_env(prefetch_answer, providers_idle)
+
+def quota_share(prefix: str, default: float, enabled: bool = True) -> float:
+    """<prefix>_QUOTA_SHARE: the share of each provider quota kept for one kind of background call"""
+    if not enabled:
+        return 0.0
+    return min(0.5, max(0.01, float(os.getenv(f"{prefix}_QUOTA_SHARE", str(default)))))
+
+# RPM/TPM quotas per provider and request budget per client, split across workers.
+# Background calls get shares of each provider quota to themselves, so they never eat
+# into chat's; chat keeps at least half.
+WORKERS = int(os.getenv("UVICORN_WORKERS", "1"))
+QUOTA_SHARES = {"prefetch": quota_share("PREFETCH", 0.1, prefetcher is not None),
+                "shadow": quota_share("SHADOW", 0.1, shadow_mirror is not None),
+                "jobs": quota_share("JOB", 0.2)}
+_scale = min(1.0, 0.5 / max(sum(QUOTA_SHARES.values()), 0.5))
+QUOTA_SHARES = {name: share * _scale for name, share in QUOTA_SHARES.items()}
+rate_limiter = rate_limiter_from_env(PROVIDER_ORDER, WORKERS, share=1 - sum(QUOTA_SHARES.values()))
+prefetch_limiter = rate_limiter_from_env(PROVIDER_ORDER, WORKERS, share=QUOTA_SHARES["prefetch"]) if prefetcher else None
+shadow_limiter = rate_limiter_from_env(PROVIDER_ORDER, WORKERS, share=QUOTA_SHARES["shadow"]) if shadow_mirror else None
+job_limiter = rate_limiter_from_env(PROVIDER_ORDER, WORKERS, share=QUOTA_SHARES["jobs"])
+
+# Which quotas the current request spends
+quota_limiter: ContextVar[RateLimiter] = ContextVar("quota_limiter", default=rate_limiter)
+
+# Wait up to this long for quota to refill before routing to the next provider
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "2.0"))
+
+# Output tokens we expect a typical answer to use, for the up-front TPM reservation
+EXPECTED_ANSWER_TOKENS = 500
+
+async def acquire_quota(provider: str, tokens: int, max_wait: float = RATE_LIMIT_MAX_WAIT) -> bool:
+    """Reserve quota for a call, waiting briefly if it will free up soon.
+    
+    Returns False when the provider is out of quota for longer than max_wait,
+    so the caller should try another provider.
+    """
+    waited = 0.0
+    while True:
+        wait = quota_limiter.get().reserve(provider, tokens)
+        if wait == 0:
+            return True
+        if waited + wait > max_wait:
+            print(f"⏳ {provider} quota exhausted for {wait:.1f}s, rerouting")
+            return False
+        await asyncio.sleep(wait)
+        waited += wait
+
+def is_rate_limit_error(error: str) -> bool:
+    error = error.lower()
+    return "429" in error or "rate limit" in error or "quota" in error
+
+# Per-provider concurrency limits for the current request (set by /chat/batch)
+provider_limits: ContextVar[Optional[dict]] = ContextVar("provider_limits", default=None)
+
+# Default number of in-flight calls per provider for one batch
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+async def run_provider(lane: ProviderLane, func, *args, **kwargs):
+    """Run a blocking provider call on its lane's worker threads so the event loop stays free.
+    
+    When a batch has set per-provider limits, the call waits for a slot first.
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(func, *args, **kwargs)
+    limits = provider_limits.get()
+    if limits and lane.provider in limits:
+        async with limits[lane.provider]:
+            return await loop.run_in_executor(lane.executor, call)
+    return await loop.run_in_executor(lane.executor, call)
+
+async def run_provider_async(lane: ProviderLane, func, *args, **kwargs):
+    """Await an async provider call on the event loop, under the batch's per-provider limit if set"""
+    limits = provider_limits.get()
+    if limits and lane.provider in limits:
+        async with limits[lane.provider]:
+            return await func(*args, **kwargs)
+    return await func(*args, **kwargs)
+
+# Total time allowed for one chat request across every provider attempt.
+# Clients can ask for less (or more, up to the maximum) with X-Request-Timeout.
+CHAT_DEADLINE_SECONDS = float(os.getenv("CHAT_DEADLINE_SECONDS", "30"))
+CHAT_DEADLINE_MAX = float(os.getenv("CHAT_DEADLINE_MAX", "120"))
+
+# Share of the remaining time given to each attempt, so later providers still get a turn
+DEADLINE_ATTEMPT_SHARE = float(os.getenv("DEADLINE_ATTEMPT_SHARE", "0.6"))
+
+# How often /chat checks whether the client has hung up
+DISCONNECT_POLL_INTERVAL = 0.5
+
+# Diagnostics: timers around request stages, event-loop lag and an on-demand profiler
+stage_timers = StageTimers()
+loop_monitor = LoopLagMonitor()
+profiler = SamplingProfiler()
+
+# Adaptive cap on chat requests answered at once (ADMISSION_*); requests over it are turned away
+admission = admission_from_env(lambda: loop_monitor.samples[-1] if loop_monitor.samples else None)
+
+# Whether turned-away requests still get a rule-based answer when one matches
+ADMISSION_DEGRADE = os.getenv("ADMISSION_DEGRADE", "1") == "1"
+ADMISSION_POLL_SECONDS = 0.05  # How often a queued /chat/batch item checks for a free slot
 
 app = FastAPI()
 
+# Optional record of /chat traffic for replay (capture.py)
+capture_writer = capture_from_env()
+if capture_writer:
+    app.add_middleware(CaptureMiddleware, writer=capture_writer)
+
 @app.get("/")
 async def root():
     return {"message": "AI Assistant Backend is running!", "status": "active"}
@@ -35,15 +255,196 @@ async def root():
 class ChatRequest(BaseModel):
     message: str
     context: dict = {}
+    provider: Optional[str] = None  # Overrides the session/global provider for this request
+    model: Optional[str] = None
+    session_id: Optional[str] = None  # Preferences set via /switch_model with this id
+    timeout: Optional[float] = None  # Total seconds allowed (X-Request-Timeout on /chat)
+
+class BatchChatRequest(BaseModel):
+    requests: List[ChatRequest]
+    stream: bool = False  # Stream NDJSON lines as items complete
+    max_concurrency: Optional[int] = None  # Per provider, defaults to BATCH_CONCURRENCY
 
 class TaskRequest(BaseModel):
     task: str
     parameters: dict = {}
+    wait: float = 0  # Seconds to wait for the job to finish before returning
+
+class EmbedRequest(BaseModel):
+    texts: List[str]
+    model: Optional[str] = None  # Ollama embedding model, defaults to EMBED_MODEL
+    encoding: str = "float"  # "float" (lists of numbers) or "base64" (little-endian float32, row by row)
+
+def client_id(request: Request) -> str:
+    """Identify the caller for per-client rate limits"""
+    return request.headers.get("X-Client-Id") or (request.client.host if request.client else "unknown")
 
 @app.post("/chat")
-async def chat_endpoint(req: ChatRequest):
+async def chat_endpoint(req: ChatRequest, request: Request):
     """Chat endpoint with multi-provider AI support"""
+    retry_after = rate_limiter.check_client(client_id(request))
+    if retry_after:
+        return JSONResponse(
+            status_code=429,
+            content={"error": "Rate limit exceeded, please slow down"},
+            headers={"Retry-After": str(max(1, round(retry_after)))}
+        )
+    prefetched = prefetched_answer(req)
+    if prefetched:
+        return JSONResponse(prefetched)
+    timeout = request.headers.get("X-Request-Timeout", req.timeout)
+    deadline = Deadline(parse_timeout(timeout, CHAT_DEADLINE_SECONDS, CHAT_DEADLINE_MAX))
+    if not admission:
+        return await answer_chat(req, request, deadline)
     
+    ticket = admission.try_acquire()
+    if ticket is None:
+        degraded = degraded_answer(req)
+        if degraded:
+            return JSONResponse(degraded, headers={"X-Degraded": "1"})
+        return JSONResponse(
+            status_code=503,
+            content={"error": "Server busy, please retry shortly"},
+            headers={"Retry-After": str(admission.retry_after())}
+        )
+    response = None
+    try:
+        response = await answer_chat(req, request, deadline)
+        return response
+    finally:
+        # A request the client abandoned says nothing about how loaded we are
+        admission.release(ticket, timed_out=deadline.expired,
+                          sample=response is not None and response.status_code != 499)
+
+async def admit_when_free(deadline: Deadline) -> Optional[Tuple[float, int]]:
+    """Wait for an admission slot instead of being turned away; None if the deadline passes first"""
+    while True:
+        ticket = admission.try_acquire(count_rejection=False)
+        if ticket is not None:
+            return ticket
+        if deadline.expired:
+            return None
+        await asyncio.sleep(ADMISSION_POLL_SECONDS)
+
+def prefetched_answer(req: ChatRequest) -> Optional[dict]:
+    """The precomputed answer if this is a predicted follow-up to the session's last exchange"""
+    hit = prefetcher.take(req.session_id, req.message, req.context) if prefetcher else None
+    if not hit:
+        return None
+    answer, provider = hit
+    return chat_result(req, answer, f"{provider} - Prefetched")
+
+def answered_by_provider(result: dict) -> bool:
+    return not result["provider"].startswith(("Rule-based Fallback", "Error Fallback"))
+
+def prefetch_followups(req: ChatRequest, result: dict) -> None:
+    """Start computing likely follow-ups to an answer the session just got"""
+    if prefetcher and answered_by_provider(result):
+        prefetcher.schedule(req.session_id, req.message, result["answer"], result["context"])
+
+def degraded_answer(req: ChatRequest) -> Optional[dict]:
+    """Canned answer for a request turned away under load, if the whole message is a canned intent"""
+    answer = rule_based_answer(req.message, whole_message=True) if ADMISSION_DEGRADE else None
+    if not answer:
+        return None
+    admission.stats["degraded"] += 1
+    return chat_result(req, answer, "Rule-based Fallback (busy)")
+
+async def answer_chat(req: ChatRequest, request: Request, deadline: Deadline) -> Response:
+    """The /chat work for an admitted request"""
+    # Copied before the answer is added to the context, so the candidate sees the same prompt.
+    # Not sampled while saturated: the candidate may share hardware with the providers in use.
+    mirror = shadow_mirror and not (admission and admission.saturated) and shadow_mirror.should_mirror()
+    shadow_req = req.model_copy(deep=True) if mirror else None
+    started = time.perf_counter()
+    try:
+        with stage_timers.stage("chat_total"):
+            result = await unless_disconnected(request, coalesced_chat(req, deadline=deadline))
+    except BaseException:
+        if shadow_req:
+            shadow_mirror.release()
+        raise
+    if isinstance(result, Response):
+        if shadow_req:
+            shadow_mirror.release()  # The client hung up: nothing to compare against
+        return result
+    if shadow_req:
+        shadow_mirror.mirror(shadow_req.message, lambda: build_messages(shadow_req), result, time.perf_counter() - started)
+    prefetch_followups(req, result)
+    with stage_timers.stage("serialize"):
+        return JSONResponse(result)
+
+async def unless_disconnected(request: Request, work):
+    """Await work, cancelling it if the client hangs up first"""
+    task = asyncio.ensure_future(work)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+        if done:
+            return task.result()
+        if await request.is_disconnected():
+            print("🔌 Client disconnected, cancelling its request")
+            task.cancel()
+            return Response(status_code=499)
+
+@app.post("/chat/batch")
+async def chat_batch_endpoint(batch: BatchChatRequest, request: Request):
+    """Run many chat requests through the provider chain with bounded concurrency per provider"""
+    # Each item counts against the client's CLIENT_RPM like a /chat request would
+    retry_after = rate_limiter.check_client(client_id(request), max(1, len(batch.requests)))
+    if retry_after:
+        return JSONResponse(
+            status_code=429,
+            content={"error": f"Rate limit exceeded: a batch of {len(batch.requests)} needs that many requests of quota"},
+            headers={"Retry-After": str(max(1, round(retry_after)))}
+        )
+    limit = max(1, batch.max_concurrency or BATCH_CONCURRENCY)
+    limits = {name: asyncio.Semaphore(limit) for name in ("gemini", "openai", "ollama")}
+    
+    async def run_item(index: int, item: ChatRequest) -> dict:
+        provider_limits.set(limits)
+        # Items only get a deadline if they ask for one: they may queue a while for a provider slot
+        deadline = Deadline(parse_timeout(item.timeout, None, CHAT_DEADLINE_MAX))
+        # Items queue for an admission slot like /chat requests hold one, so batch load counts as load
+        ticket = None
+        if admission:
+            ticket = await admit_when_free(deadline)
+            if ticket is None:
+                return {"index": index, "status": "error", "error": "Server busy: no slot before the deadline"}
+        finished = False
+        try:
+            result = await coalesced_chat(item, deadline=deadline)
+            finished = True
+        except Exception as e:
+            print(f"Batch item {index} error: {e}")
+            return {"index": index, "status": "error", "error": str(e)}
+        finally:
+            if ticket:
+                admission.release(ticket, timed_out=deadline.expired, sample=finished)
+        
+        if result["provider"] == "Error Fallback":
+            return {"index": index, "status": "error", "error": result["answer"], **result}
+        return {"index": index, "status": "ok", **result}
+    
+    tasks = [asyncio.create_task(run_item(i, item)) for i, item in enumerate(batch.requests)]
+    
+    if not batch.stream:
+        results = await asyncio.gather(*tasks)
+        failed = sum(1 for r in results if r["status"] == "error")
+        return {"results": results, "total": len(results), "failed": failed}
+    
+    async def ndjson_lines():
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield json.dumps(await finished) + "\n"
+        finally:
+            # Client went away mid-stream: don't keep calling providers for it
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+def build_messages(req: ChatRequest) -> list:
+    """Turn a chat request into the message list sent to providers"""
     # Build context string
     context_str = ""
     if req.context:
@@ -58,142 +459,287 @@ async def chat_endpoint(req: ChatRequest):
     if context_str:
         messages.append({"role": "system", "content": f"Context: {context_str}"})
     
+    # Passages from local documents that match the question
+    if retriever and RAG_TOP_K > 0:
+        with stage_timers.stage("retrieval"):
+            passages = retriever.search(req.message, RAG_TOP_K, RAG_MIN_SCORE)
+        if passages:
+            documents = "\n\n".join(f"[{i}] ({p['source']}) {p['text']}" for i, p in enumerate(passages, 1))
+            messages.append({"role": "system", "content": f"Relevant documents:\n{documents}"})
+    
     messages.append({"role": "user", "content": req.message})
+    return messages
+
+def chat_result(req: ChatRequest, answer: str, provider: str) -> dict:
+    """Package an answer and record it in the conversation context"""
+    with stage_timers.stage("context_update"):
+        new_context = req.context
+        new_context['last_message'] = req.message
+        new_context['last_answer'] = answer
+        return {"answer": answer, "provider": provider, "context": new_context}
+
+def resolve_selection(req: ChatRequest):
+    """Pick (provider, model) for a request: the request itself, then its session, then the global choice"""
+    session = state.get(f"session:{req.session_id}", {}) if req.session_id else {}
+    provider = (req.provider or session.get("provider") or state.get("selected_provider") or "").lower() or None
+    if provider and provider not in PROVIDER_ORDER:
+        print(f"⚠️  Unknown provider '{provider}', using priority order")
+        return None, None
     
-    # Debug: Print current selected provider
-    print(f"🔍 Current selected_provider: {selected_provider}")
-    
-    # Check if specific provider is selected
-    if selected_provider == "gemini":
-        print("🎯 Using Gemini as primary provider")
-        # Try Gemini first when selected
-        if gemini_client.is_configured:
-            try:
-                answer = gemini_client.chat_completion(messages)
-                if answer and "Gemini error" not in answer and "not configured" not in answer:
-                    new_context = req.context
-                    new_context['last_message'] = req.message
-                    new_context['last_answer'] = answer
-                    return {"answer": answer, "provider": "Google Gemini Pro", "context": new_context}
-            except Exception as e:
-                print(f"Gemini error: {e}")
-    
-    elif selected_provider == "ollama":
-        print("🎯 Using Ollama as primary provider")
-        # Try Ollama first when selected
-        if ollama_client.check_connection():
-            try:
-                answer = ollama_client.chat_completion(messages)
-                if answer and "Error:" not in answer:
-                    new_context = req.context
-                    new_context['last_message'] = req.message
-                    new_context['last_answer'] = answer
-                    return {"answer": answer, "provider": f"Ollama ({ollama_client.current_model})", "context": new_context}
-            except Exception as e:
-                print(f"Ollama error: {e}")
-    
-    print("🔄 Using default priority order")
-    # Default priority order: Gemini → OpenAI → Ollama → Fallback
-    # Priority 1: Try Gemini Pro first (free, fast, cloud-based)
-    if gemini_client.is_configured:
-        try:
-            answer = gemini_client.chat_completion(messages)
-            if answer and "Gemini error" not in answer and "not configured" not in answer:
-                # Update context
-                new_context = req.context
-                new_context['last_message'] = req.message
-                new_context['last_answer'] = answer
-                
-                return {
-                    "answer": answer,
-                    "provider": "Google Gemini Pro", 
-                    "context": new_context
-                }
-        except Exception as e:
-            print(f"Gemini error: {e}")
+    model = req.model
+    if not model and session.get("provider") == provider:
+        model = session.get("model")
+    if model and provider and not known_model(provider, model):
+        print(f"⚠️  Unknown {provider} model '{model}', using the default")
+        model = None
+    return provider, model or (default_model(provider) if provider else None)
+
+def known_models(provider: str) -> set:
+    """Models a provider may be asked for: its configured or discovered list, plus the
+    defaults and the models the cascade and shadow mode were set up with"""
+    if provider == "gemini":
+        models = set(GEMINI_MODELS) | {gemini_client.model_name}
+    elif provider == "openai":
+        models = set(OPENAI_MODELS) | {os.getenv("OPENAI_MODEL", OPENAI_MODELS[0])}
+    else:
+        models = set(ollama_client.available_models) | {ollama_client.current_model, EMBED_MODEL}
+    configured = ([cascade.small, cascade.large] if cascade else []) + ([shadow_mirror.candidate] if shadow_mirror else [])
+    return models | {m for p, m in configured if p == provider}
+
+def known_model(provider: str, model: Optional[str]) -> bool:
+    # Every model gets a client and worker threads of its own, so don't make lanes for arbitrary names
+    return model is None or model in known_models(provider)
+
+def provider_available(provider: str, model: Optional[str]) -> bool:
+    """Whether a provider/model is set up at all (not whether it will succeed)"""
+    if not known_model(provider, model):
+        return False
+    client = lane_pool.get().lane(provider, model).client
+    if provider == "gemini":
+        return bool(client and client.is_configured)
+    if provider == "ollama":
+        return bool(model)
+    return bool(client)
+
+async def ask_provider(provider: str, model: Optional[str], messages: list,
+                       on_delta: Optional[Callable[[str], None]] = None,
+                       timeout: Optional[float] = None, conversation: Optional[str] = None,
+                       restart: bool = False) -> Optional[str]:
+    """Ask one provider/model for an answer; None if it is unavailable, failed or ran out of time.
     
-    # Priority 2: Try OpenAI (fast, reliable, paid)
-    if openai_client:
-        try:
-            response = openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=messages,
-                max_tokens=500,
-                timeout=10
-            )
-            
-            answer = response.choices[0].message.content
-            
-            # Update context
-            new_context = req.context
-            new_context['last_message'] = req.message
-            new_context['last_answer'] = answer
-            
-            return {
-                "answer": answer,
-                "provider": "OpenAI GPT-3.5",
-                "context": new_context
-            }
-        except Exception as e:
-            print(f"OpenAI error: {e}")
+    With on_delta the answer is streamed and on_delta receives each text piece
+    (called from a worker thread). timeout bounds the whole attempt, including
+    any wait for quota; the client call is given the same limit so its worker
+    thread is freed too. conversation (with restart for a new one) lets
+    providers that keep server-side chat sessions (Gemini) continue it.
+    """
+    if not provider_available(provider, model):
+        return None
+    lane = lane_pool.get().lane(provider, model)
+    client = lane.client
     
-    # Priority 3: Try Ollama (local, slower but private)
-    if ollama_client.current_model:
-        try:
+    estimated = sum(estimate_tokens(m["content"]) for m in messages) + EXPECTED_ANSWER_TOKENS
+    started = loop_time()
+    max_wait = RATE_LIMIT_MAX_WAIT if timeout is None else min(RATE_LIMIT_MAX_WAIT, timeout)
+    acquired = await acquire_quota(provider, estimated, max_wait)
+    stage_timers.record("quota_wait", loop_time() - started)
+    if not acquired:
+        return None
+    if timeout is not None:
+        timeout -= loop_time() - started
+    
+    try:
+        with stage_timers.stage(f"provider:{provider}"):
+            return await asyncio.wait_for(
+                call_provider(provider, model, lane, messages, estimated, on_delta, timeout,
+                              conversation, restart), timeout)
+    except asyncio.TimeoutError:
+        print(f"⏳ {provider.title()} ({model}) ran out of time")
+    except Exception as e:
+        print(f"{provider.title()} error: {e}")
+        if is_rate_limit_error(str(e)):
+            quota_limiter.get().penalize(provider)
+    return None
+
+def loop_time() -> float:
+    return asyncio.get_running_loop().time()
+
+async def call_provider(provider: str, model: Optional[str], lane: ProviderLane, messages: list,
+                        estimated: int, on_delta: Optional[Callable[[str], None]],
+                        timeout: Optional[float], conversation: Optional[str] = None,
+                        restart: bool = False) -> Optional[str]:
+    """The provider-specific part of ask_provider"""
+    client = lane.client
+    if provider == "gemini":
+        answer = await run_provider_async(lane, client.chat_async, messages, on_delta=on_delta, timeout=timeout,
+                                          conversation=conversation, restart=restart)
+        if answer and answer.startswith("Gemini error") and is_rate_limit_error(answer):
+            quota_limiter.get().penalize(provider)
+        if answer and not answer.startswith(("Gemini error", "Gemini not configured")):
+            quota_limiter.get().record_usage(provider, estimated, estimated - EXPECTED_ANSWER_TOKENS + estimate_tokens(answer))
+            return answer
+    
+    elif provider == "openai":
+        response = await run_provider(
+            lane,
+            client.chat.completions.create,
+            model=model,
+            messages=messages,
+            max_tokens=500,
+            timeout=timeout or 10,
+            stream=on_delta is not None
+        )
+        if on_delta is not None:
+            answer = await run_provider(lane, collect_openai_stream, response, on_delta, timeout)
+            if answer is not None:
+                # Streamed responses carry no usage, so correct the reservation with an estimate
+                quota_limiter.get().record_usage(provider, estimated, estimated - EXPECTED_ANSWER_TOKENS + estimate_tokens(answer))
+            return answer
+        if response.usage:
+            quota_limiter.get().record_usage(provider, estimated, response.usage.total_tokens)
+        return response.choices[0].message.content
+    
+    elif provider == "ollama":
+        answer = await run_provider(lane, client.chat_completion, messages, on_delta=on_delta, timeout=timeout)
+        if answer and not answer.startswith(("Error", "Request timed out", "No model available")):
+            return answer
+    return None
+
+def collect_openai_stream(stream, on_delta: Callable[[str], None], timeout: Optional[float] = None) -> Optional[str]:
+    """Forward streamed OpenAI chunks to on_delta and return the joined answer (None if out of time)"""
+    stop_at = time.monotonic() + timeout if timeout else None
+    parts = []
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+            on_delta(chunk.choices[0].delta.content)
+        if stop_at and time.monotonic() > stop_at:
+            stream.close()
+            return None
+    return "".join(parts)
+
+# Cheap canned answers used when every provider is unavailable
+FALLBACK_RESPONSES = {
+    "hello": "Hello! I'm an AI assistant ready to help you.",
+    "hi": "Hi there! How can I assist you today?",
+    "how are you": "I'm doing well, thank you for asking! How can I help you?",
+    "what is your name": "I'm your AI Assistant, powered by multiple AI providers including Gemini Pro, OpenAI, and Ollama.",
+    "help": "I can help you with various tasks like answering questions, writing code, creative writing, math problems, and general conversation. What would you like assistance with?",
+    "bye": "Goodbye! Feel free to chat with me anytime.",
+    "thank you": "You're welcome! Is there anything else I can help you with?",
+    "weather": "I don't have access to real-time weather data, but I'd be happy to help you with other questions!"
+}
+
+FALLBACK_PATTERNS = {keyword: re.compile(rf"\b{re.escape(keyword)}\b") for keyword in FALLBACK_RESPONSES}
+CANNED_EXTRA_WORDS = 2  # Words allowed around the keyword for a whole-message match, e.g. "hi there"
+
+def rule_based_answer(message: str, whole_message: bool = False) -> Optional[str]:
+    """Canned fallback answer for a message containing one of its keywords as whole words.
+
+    With whole_message the message must be little more than the keyword
+    ("thank you so much", but not "help me write a parser").
+    """
+    words = re.findall(r"[a-z0-9']+", message.lower())
+    text = " ".join(words)
+    for keyword, response in FALLBACK_RESPONSES.items():
+        if whole_message and len(words) > len(keyword.split()) + CANNED_EXTRA_WORDS:
+            continue
+        if FALLBACK_PATTERNS[keyword].search(text):
+            return response
+    return None
+
+async def route_chat(req: ChatRequest, events: Optional[Callable[[dict], None]] = None,
+                     deadline: Optional[Deadline] = None) -> dict:
+    """Build the prompt and walk the provider chain for a single chat request.
+    
+    If events is given, the answer is streamed: it receives {"type": "delta"}
+    events with text pieces, {"type": "status"} events as providers are tried,
+    and {"type": "reset"} when a provider fails after it had started streaming.
+    It must be safe to call from any thread.
+    
+    The deadline is shared out over the provider attempts: each one gets
+    DEADLINE_ATTEMPT_SHARE of the time left (the last one gets all of it),
+    and once it has passed we go straight to the rule-based fallback.
+    
+    Without an explicit provider choice, the model cascade (if configured)
+    decides which models go first, and a weak answer from its small model is
+    escalated.
+    """
+    with stage_timers.stage("build_messages"):
+        messages = build_messages(req)
+    selected_provider, selected_model = resolve_selection(req)
+    deadline = deadline or Deadline()
+    
+    # Debug: Print current selection
+    print(f"🔍 Current selection: {selected_provider or 'auto'} ({selected_model})")
+    
+    # A request without context starts a new conversation
+    conversation = {"conversation": req.session_id, "restart": not req.context}
+    
+    async def attempt(provider, model, timeout):
+        if not events:
+            return await ask_provider(provider, model, messages, timeout=timeout, **conversation)
+        
+        streamed = []
+        finished = False
+        def on_delta(text):
+            if finished:
+                return  # A timed-out attempt's worker thread may still be producing text
+            streamed.append(text)
+            events({"type": "delta", "text": text})
+        
+        events({"type": "status", "state": "trying", "provider": provider_label(provider, model)})
+        answer = await ask_provider(provider, model, messages, on_delta=on_delta, timeout=timeout, **conversation)
+        finished = True
+        if not answer and streamed:
+            events({"type": "reset"})  # Discard the partial answer shown so far
+        return answer
+    
+    # The selected provider/model (or the cascade's choice) first, then the
+    # default priority order: Gemini → OpenAI → Ollama → Fallback
+    plan = cascade.plan(req.message) if cascade and not selected_provider else None
+    if plan:
+        print(f"🎯 Cascade: {plan.tier} message (score {plan.score:.2f}) → {'/'.join(plan.models[0])}")
+        candidates = list(plan.models)
+    else:
+        candidates = [(selected_provider, selected_model)] if selected_provider else []
+    candidates += [(p, default_model(p)) for p in PROVIDER_ORDER if (p, default_model(p)) not in candidates]
+    candidates = [(p, m) for p, m in candidates if provider_available(p, m)]
+    
+    if selected_provider:
+        print(f"🎯 Using {selected_provider} ({selected_model}) as primary provider")
+    elif not plan:
+        print("🔄 Using default priority order")
+    
+    unconfident = None  # Small-model answer kept in case escalation finds nothing better
+    for index, (provider, model) in enumerate(candidates):
+        if deadline.expired:
+            print(f"⏳ Deadline of {deadline.seconds:.0f}s reached, skipping remaining providers")
+            break
+        
+        if provider == "ollama":
             # Check for quick code generation first
             quick_response = ollama_client.quick_code_response(req.message)
             if quick_response:
-                new_context = req.context
-                new_context['last_message'] = req.message
-                new_context['last_answer'] = quick_response
-                
-                return {
-                    "answer": quick_response,
-                    "provider": f"Ollama ({ollama_client.current_model}) - Quick Code",
-                    "context": new_context
-                }
-            
-            # Regular Ollama chat
-            answer = ollama_client.chat_completion(messages)
-            if answer and "Error:" not in answer:
-                # Update context
-                new_context = req.context
-                new_context['last_message'] = req.message
-                new_context['last_answer'] = answer
-                
-                return {
-                    "answer": answer,
-                    "provider": f"Ollama ({ollama_client.current_model})",
-                    "context": new_context
-                }
-        except Exception as e:
-            print(f"Ollama error: {e}")
-            
-    # Fallback: Simple rule-based responses
-    fallback_responses = {
-        "hello": "Hello! I'm an AI assistant ready to help you.",
-        "hi": "Hi there! How can I assist you today?",
-        "how are you": "I'm doing well, thank you for asking! How can I help you?",
-        "what is your name": "I'm your AI Assistant, powered by multiple AI providers including Gemini Pro, OpenAI, and Ollama.",
-        "help": "I can help you with various tasks like answering questions, writing code, creative writing, math problems, and general conversation. What would you like assistance with?",
-        "bye": "Goodbye! Feel free to chat with me anytime.",
-        "thank you": "You're welcome! Is there anything else I can help you with?",
-        "weather": "I don't have access to real-time weather data, but I'd be happy to help you with other questions!"
-    }
+                return chat_result(req, quick_response, f"{provider_label(provider, model)} - Quick Code")
+        
+        answer = await attempt(provider, model, deadline.budget(len(candidates) - index, DEADLINE_ATTEMPT_SHARE))
+        if answer and plan and cascade.should_escalate(plan, (provider, model), req.message, answer):
+            print(f"🔼 Low-confidence answer from {provider}/{model}, escalating")
+            if events:
+                events({"type": "reset"})
+            unconfident = (answer, provider_label(provider, model))
+            continue
+        if answer:
+            return chat_result(req, answer, provider_label(provider, model))
     
-    # Check for simple keyword matches
-    message_lower = req.message.lower().strip()
-    for keyword, response in fallback_responses.items():
-        if keyword in message_lower:
-            new_context = req.context
-            new_context['last_message'] = req.message
-            new_context['last_answer'] = response
-            
-            return {
-                "answer": response,
-                "provider": "Rule-based Fallback",
-                "context": new_context
-            }
+    if unconfident:
+        return chat_result(req, *unconfident)
+    
+    # Fallback: Simple rule-based responses
+    answer = rule_based_answer(req.message)
+    if answer:
+        return chat_result(req, answer, "Rule-based Fallback")
     
     # Final fallback
     return {
@@ -201,325 +747,510 @@ async def chat_endpoint(req: ChatRequest):
         "provider": "Error Fallback",
         "context": req.context
     }
-    messages = [
-        {"role": "system", "content": "You are a helpful AI assistant that can understand and respond to queries while maintaining context."}
-    ]
-    
-    if context_str:
-        messages.append({"role": "system", "content": f"Context: {context_str}"})
-    
-    messages.append({"role": "user", "content": req.message})
-    
-    # Use selected provider if specified, otherwise use priority order
-    if selected_provider == "gemini":
-        return await try_gemini_first(messages, req)
-    elif selected_provider == "ollama":
-        return await try_ollama_first(messages, req)  
-    elif selected_provider == "openai":
-        return await try_openai_first(messages, req)
-    else:
-        # Default priority order: Gemini → OpenAI → Ollama → Fallback
-        return await try_priority_order(messages, req)
 
-async def try_gemini_first(messages, req):
-    """Try Gemini first, fallback to others if needed"""
-    # Try Gemini Pro first
-    if gemini_client.is_configured:
-        try:
-            answer = gemini_client.chat_completion(messages)
-            if answer and "Gemini error" not in answer and "not configured" not in answer:
-                new_context = req.context
-                new_context['last_message'] = req.message
-                new_context['last_answer'] = answer
-                return {"answer": answer, "provider": "Google Gemini Pro", "context": new_context}
-        except Exception as e:
-            print(f"Gemini error: {e}")
-    
-    # Fallback to others
-    return await try_other_providers(messages, req, exclude="gemini")
+# Identical requests in flight at the same time share one provider call
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "1") == "1"
+singleflight = SingleFlight()
 
-async def try_ollama_first(messages, req):
-    """Try Ollama first, fallback to others if needed"""
-    # Try Ollama first
-    if ollama_client.check_connection():
-        try:
-            answer = ollama_client.chat_completion(messages)
-            if answer and "Error:" not in answer:
-                new_context = req.context
-                new_context['last_message'] = req.message
-                new_context['last_answer'] = answer
-                return {"answer": answer, "provider": f"Ollama ({ollama_client.current_model})", "context": new_context}
-        except Exception as e:
-            print(f"Ollama error: {e}")
+async def coalesced_chat(req: ChatRequest, events: Optional[Callable[[dict], None]] = None,
+                         deadline: Optional[Deadline] = None) -> dict:
+    """route_chat, but joined to an identical request that is already in flight if there is one.
     
-    # Fallback to others
-    return await try_other_providers(messages, req, exclude="ollama")
+    A follower waits under the leader's deadline. Real traffic comes through
+    here, so it also preempts any follow-up being prefetched.
+    """
+    if prefetcher:
+        prefetcher.preempt()
+    if not COALESCE_REQUESTS:
+        return await route_chat(req, events, deadline)
+    provider, model = resolve_selection(req)
+    # Gemini records the turn in the leader's chat session only, so while Gemini can
+    # answer (it is in every fallback chain) only the same session's requests are merged
+    session = req.session_id if gemini_client.is_configured else None
+    key = request_key(req.message, req.context, provider, model, session)
+    # The leader always streams, so followers that want deltas can share them
+    return await singleflight.do(key, lambda broadcast: route_chat(req, events=broadcast, deadline=deadline), events)
 
-async def try_openai_first(messages, req):
-    """Try OpenAI first, fallback to others if needed"""
-    # Try OpenAI first
-    if openai_client:
-        try:
-            response = openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=messages,
-                max_tokens=500,
-                timeout=10
-            )
-            answer = response.choices[0].message.content
-            new_context = req.context
-            new_context['last_message'] = req.message
-            new_context['last_answer'] = answer
-            return {"answer": answer, "provider": "OpenAI GPT-3.5", "context": new_context}
-        except Exception as e:
-            print(f"OpenAI error: {e}")
+@app.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket):
+    """Persistent chat session.
     
-    # Fallback to others
-    return await try_other_providers(messages, req, exclude="openai")
-
-async def try_other_providers(messages, req, exclude=None):
-    """Try remaining providers as fallback"""
-    # Try Gemini if not excluded
-    if exclude != "gemini" and gemini_client.is_configured:
-        try:
-            answer = gemini_client.chat_completion(messages)
-            if answer and "Gemini error" not in answer:
-                new_context = req.context
-                new_context['last_message'] = req.message
-                new_context['last_answer'] = answer
-                return {"answer": answer, "provider": "Google Gemini Pro (fallback)", "context": new_context}
-        except Exception as e:
-            print(f"Gemini fallback error: {e}")
+    The conversation context stays on the server, so clients only send new
+    messages. Client → server:
+        {"type": "message", "message": "...", "id"?: ..., "provider"?: "...", "model"?: "...", "timeout"?: seconds}
+        {"type": "cancel", "id": ...}  - the client gave up on that message
+        {"type": "reset"}  - start a new conversation
+        {"type": "ping"}
+    Server → client:
+        {"type": "ready", "session_id": "...", "models": {...}, "session": {...}}
+        {"type": "status", "state": "trying", "provider": "..."}
+        {"type": "delta", "text": "..."} / {"type": "reset"}
+        {"type": "done", "answer": "...", "provider": "..."}
+        (status, delta, reset and done events echo the message's "id")
+        {"type": "models", "models": {...}, "session": {...}} - whenever provider/model selection changes
+        {"type": "reminder", "id": ..., "message": "...", "due_at": ...} - a reminder for this session is due
+        {"type": "error", "error": "...", "retry_after"?: seconds}
+    """
+    await websocket.accept()
+    loop = asyncio.get_running_loop()
+    session_id = websocket.query_params.get("session_id") or uuid.uuid4().hex
+    caller = websocket.headers.get("X-Client-Id") or (websocket.client.host if websocket.client else "unknown")
+    context = {}
+    outgoing: asyncio.Queue = asyncio.Queue()
     
-    # Try Ollama if not excluded
-    if exclude != "ollama" and ollama_client.check_connection():
-        try:
-            answer = ollama_client.chat_completion(messages)
-            if answer and "Error:" not in answer:
-                new_context = req.context
-                new_context['last_message'] = req.message
-                new_context['last_answer'] = answer
-                return {"answer": answer, "provider": f"Ollama ({ollama_client.current_model}) (fallback)", "context": new_context}
-        except Exception as e:
-            print(f"Ollama fallback error: {e}")
+    def emit(event: dict):
+        loop.call_soon_threadsafe(outgoing.put_nowait, event)
     
-    # Try OpenAI if not excluded
-    if exclude != "openai" and openai_client:
-        try:
-            response = openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=messages,
-                max_tokens=500,
-                timeout=10
-            )
-            answer = response.choices[0].message.content
-            new_context = req.context
-            new_context['last_message'] = req.message
-            new_context['last_answer'] = answer
-            return {"answer": answer, "provider": "OpenAI GPT-3.5 (fallback)", "context": new_context}
-        except Exception as e:
-            print(f"OpenAI fallback error: {e}")
+    def on_state_change(key, value):
+        # Push routing changes instead of making clients poll /models
+        if key in ("selected_provider", f"session:{session_id}") or key.endswith("_model"):
+            loop.call_soon_threadsafe(lambda: outgoing.put_nowait({"type": "models", **session_status()}))
     
-    # Final fallback
-    return await try_priority_order(messages, req)
-
-async def try_priority_order(messages, req):
-    # Use context to maintain conversation history
-    context_str = "\n".join([f"{k}: {v}" for k, v in req.context.items()])
+    def session_status():
+        return {"models": models_status(), "session": state.get(f"session:{session_id}")}
     
-    # Build messages for AI
-    messages = [
-        {"role": "system", "content": "You are a helpful AI assistant that can understand and respond to queries while maintaining context."}
-    ]
+    async def sender():
+        while True:
+            await websocket.send_json(await outgoing.get())
     
-    if context_str:
-        messages.append({"role": "system", "content": f"Context: {context_str}"})
+    # Messages and resets are handled one at a time, in order, by run_turns; the
+    # receive loop stays free to notice cancels and disconnects meanwhile
+    turns: asyncio.Queue = asyncio.Queue()
+    current = {"id": None, "task": None}
     
-    messages.append({"role": "user", "content": req.message})
+    async def run_turns():
+        nonlocal context
+        while True:
+            data = await turns.get()
+            if data.get("type") == "reset":
+                context = {}
+                continue
+            
+            turn = data.get("id")
+            emit_turn = lambda event: emit({**event, "id": turn})
+            req = ChatRequest(message=data["message"], context=context, session_id=session_id,
+                              provider=data.get("provider"), model=data.get("model"))
+            deadline = Deadline(parse_timeout(data.get("timeout"), CHAT_DEADLINE_SECONDS, CHAT_DEADLINE_MAX))
+            ticket = None
+            result = prefetched_answer(req)
+            if not result and admission:
+                ticket = admission.try_acquire()
+                if ticket is None:
+                    result = degraded_answer(req)
+                    if not result:
+                        emit_turn({"type": "error", "error": "Server busy, please retry shortly",
+                                   "retry_after": admission.retry_after()})
+                        continue
+            if not result:
+                task = asyncio.ensure_future(coalesced_chat(req, events=emit_turn, deadline=deadline))
+                current.update(id=turn, task=task)
+                finished = False
+                try:
+                    result = await asyncio.shield(task)
+                    finished = True
+                except asyncio.CancelledError:
+                    if not task.cancelled():
+                        task.cancel()
+                        raise  # The connection is closing
+                    print(f"🔌 Turn {turn} cancelled by the client")
+                    continue
+                finally:
+                    current.update(id=None, task=None)
+                    if ticket:
+                        admission.release(ticket, timed_out=deadline.expired, sample=finished)
+            context = result["context"]
+            emit_turn({"type": "done", "answer": result["answer"], "provider": result["provider"]})
+            prefetch_followups(req, result)
     
-    # Priority 1: Try Gemini Pro first (free, fast, cloud-based)
-    if gemini_client.is_configured:
-        try:
-            answer = gemini_client.chat_completion(messages)
-            if answer and "Gemini error" not in answer and "not configured" not in answer:
-                # Update context
-                new_context = req.context
-                new_context['last_message'] = req.message
-                new_context['last_answer'] = answer
-                
-                return {
-                    "answer": answer, 
-                    "context": new_context,
-                    "provider": "Google Gemini Pro"
-                }
-        except Exception as e:
-            print(f"Gemini error: {str(e)}")
+    send_task = asyncio.create_task(sender())
+    turn_task = asyncio.create_task(run_turns())
+    state.subscribe(on_state_change)
+    outgoing.put_nowait({"type": "ready", "session_id": session_id, **session_status()})
     
-    # Priority 2: Try OpenAI (fast, reliable, paid)
-    if openai_client:
-        try:
-            response = openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=messages
-            )
-            answer = response.choices[0].message.content
-            
-            # Update context
-            new_context = req.context
-            new_context['last_message'] = req.message
-            new_context['last_answer'] = answer
+    attach_session(session_id, emit)
+    try:
+        while True:
+            data = await websocket.receive_json()
+            kind = data.get("type", "message")
             
-            return {
-                "answer": answer, 
-                "context": new_context,
-                "provider": "OpenAI (GPT-3.5-turbo)"
-            }
-        except Exception as e:
-            print(f"OpenAI error: {str(e)}")
+            if kind == "ping":
+                outgoing.put_nowait({"type": "pong"})
+            elif kind == "reset":
+                turns.put_nowait(data)
+            elif kind == "cancel":
+                if current["task"] and current["id"] == data.get("id"):
+                    current["task"].cancel()
+            elif kind == "message" and data.get("message"):
+                retry_after = rate_limiter.check_client(caller)
+                if retry_after:
+                    outgoing.put_nowait({"type": "error", "error": "Rate limit exceeded, please slow down",
+                                         "retry_after": max(1, round(retry_after))})
+                    continue
+                turns.put_nowait({**data, "type": "message"})
+            else:
+                outgoing.put_nowait({"type": "error", "error": f"Unsupported message: {kind}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Nobody is left to read the answer: stop working on it
+        state.unsubscribe(on_state_change)
+        detach_session(session_id, emit)
+        turn_task.cancel()
+        send_task.cancel()
 
-    # Priority 3: Try Ollama (local, slower but private)
-    if ollama_client.current_model:
-        try:
-            # Check for quick code generation first
-            quick_response = ollama_client.quick_code_response(req.message)
-            if quick_response:
-                new_context = req.context
-                new_context['last_message'] = req.message
-                new_context['last_answer'] = quick_response
-                
-                return {
-                    "answer": quick_response, 
-                    "context": new_context,
-                    "provider": f"Ollama Quick Response ({ollama_client.current_model})"
-                }
-            
-            # If no quick response, use full AI generation with shorter timeout
-            answer = ollama_client.chat_completion(messages)
-            if answer and "Error" not in answer and "timed out" not in answer.lower():
-                # Update context
-                new_context = req.context
-                new_context['last_message'] = req.message
-                new_context['last_answer'] = answer
-                
-                return {
-                    "answer": answer, 
-                    "context": new_context,
-                    "provider": f"Ollama ({ollama_client.current_model})"
-                }
-        except Exception as e:
-            print(f"Ollama error: {str(e)}")
-        
-    # Final fallback: Rule-based responses when all AI services are unavailable
-    fallback_responses = {
-        "hello": "Hello! How can I help you today?",
-        "hi": "Hi there! What can I do for you?",
-        "how are you": "I'm doing great! How about you?",
-        "what is your name": "I'm your AI assistant. How can I assist you?",
-        "thank you": "You're welcome! Is there anything else I can help with?",
-        "diagram": "Here's a simple text diagram:\n\n```\n┌─────────────┐\n│   System    │\n│  Overview   │\n└─────────────┘\n      |\n      v\n┌─────────────┐\n│   Process   │\n│    Flow     │\n└─────────────┘\n```",
-        "chart": "Text-based chart example:\n\nData Flow:\nInput → Process → Output\n  |       |        |\n  v       v        v\nUser → System → Result",
-    }
-    
-    # Simple keyword matching for fallback
-    message_lower = req.message.lower()
-    answer = "I'm sorry, all AI services are currently unavailable. Please try again later."
-    
-    # Check for diagram/chart requests
-    if "diagram" in message_lower or "chart" in message_lower or "|" in req.message:
-        if "diagram" in message_lower:
-            answer = fallback_responses["diagram"]
-        elif "chart" in message_lower:
-            answer = fallback_responses["chart"]
-        else:
-            # Simple ASCII art for pipe symbol requests
-            answer = """Here's a simple diagram using | symbols:
-
-```
-    Input Data
-        |
-        v
-   ┌─────────┐
-   │ Process │
-   └─────────┘
-        |
-        v
-   Output Result
-        |
-        v
-    ┌─────────┐
-    │ Display │
-    └─────────┘
-```"""
-    else:
-        # Other fallback responses
-        for key, response in fallback_responses.items():
-            if key in message_lower:
-                answer = response
-                break
+def reminder_due_at(params: dict) -> float:
+    """Due time from "due_at" (Unix time), "in_seconds" or "in_minutes" parameters"""
+    if params.get("due_at") is not None:
+        return float(params["due_at"])
+    if params.get("in_seconds") is not None:
+        return time.time() + float(params["in_seconds"])
+    if params.get("in_minutes") is not None:
+        return time.time() + 60 * float(params["in_minutes"])
+    raise ValueError("'due_at', 'in_seconds' or 'in_minutes' parameter required")
+
+def set_reminder_task(job):
+    """Schedule a reminder. Parameters: session_id, message, and due_at, in_seconds or in_minutes"""
+    params = job.parameters
+    if not params.get("session_id") or not params.get("message"):
+        raise ValueError("'session_id' and 'message' parameters required")
+    return reminder_scheduler.schedule(params["session_id"], params["message"], reminder_due_at(params))
+
+# Deadline for one AI call made by a job
+JOB_LLM_TIMEOUT = float(os.getenv("JOB_LLM_TIMEOUT", "120"))
+
+def ask_task(job):
+    """Answer a prompt in the background. Parameters: message, and optionally provider, model, context"""
+    params = job.parameters
+    if not params.get("message"):
+        raise ValueError("'message' parameter required")
+    return job.ask(params["message"], provider=params.get("provider"), model=params.get("model"),
+                   context=params.get("context", {}), timeout=float(params.get("timeout", JOB_LLM_TIMEOUT)))
+
+# Tasks run as background jobs (can be extended based on requirements)
+TASK_HANDLERS = {
+    "ask": ask_task,
+    "weather": lambda job: "Weather functionality to be implemented",
+    "play_music": lambda job: "Music playback functionality to be implemented",
+    "set_reminder": set_reminder_task
+}
+
+# Connected /ws clients per session, for pushing reminders: session_id -> emit functions
+ws_sessions = {}
+ws_sessions_lock = threading.Lock()
+
+def attach_session(session_id: str, emit: Callable[[dict], None]) -> None:
+    """Register a connected client for pushed events, and hand it reminders that fell due while offline"""
+    with ws_sessions_lock:
+        ws_sessions.setdefault(session_id, set()).add(emit)
+    for reminder in reminder_store.for_session(session_id, ("due",)):
+        deliver_reminder(reminder)
+
+def detach_session(session_id: str, emit: Callable[[dict], None]) -> None:
+    with ws_sessions_lock:
+        emitters = ws_sessions.get(session_id, set())
+        emitters.discard(emit)
+        if not emitters:
+            ws_sessions.pop(session_id, None)
+
+def deliver_reminder(reminder: dict) -> bool:
+    """Push a due reminder to its session's connected clients (runs on the reminder timer thread)"""
+    with ws_sessions_lock:
+        emitters = list(ws_sessions.get(reminder["session_id"], ()))
+    if not emitters:
+        return False
+    if reminder_store.claim_delivery(reminder["id"]):
+        event = {"type": "reminder", "id": reminder["id"], "message": reminder["message"], "due_at": reminder["due_at"]}
+        for emit in emitters:
+            emit(event)
+    return True
+
+reminder_store = ReminderStore(os.getenv("REMINDERS_DB_PATH", "assistant_reminders.db"))
+reminder_scheduler = ReminderScheduler(reminder_store, deliver_reminder)
+
+job_engine = JobEngine(
+    JobStore(os.getenv("JOBS_DB_PATH", "assistant_jobs.db")),
+    TASK_HANDLERS,
+    workers=int(os.getenv("JOB_WORKERS", "2"))
+)
+
+async def job_chat(req: ChatRequest, timeout: float) -> dict:
+    """A provider call on behalf of a job, on the job lanes and the job quota"""
+    lane_pool.set(job_pool)
+    provider_limits.set(None)
+    quota_limiter.set(job_limiter)
+    result = await route_chat(req, deadline=Deadline(timeout))
+    return {"answer": result["answer"], "provider": result["provider"]}
+
+@app.on_event("startup")
+async def start_jobs():
+    loop = asyncio.get_running_loop()
     
-    # Update context
-    new_context = req.context
-    new_context['last_message'] = req.message
-    new_context['last_answer'] = answer
+    def llm(message, timeout, **options):
+        # Called from job worker threads; the call itself runs on our event loop
+        req = ChatRequest(message=message, **options)
+        return asyncio.run_coroutine_threadsafe(job_chat(req, timeout), loop)
     
-    return {
-        "answer": answer, 
-        "context": new_context, 
-        "provider": "Rule-based Fallback"
-    }
+    job_engine.llm = llm
+    job_engine.start()
+    reminder_scheduler.start()
+    loop_monitor.start()
+    if prefetcher:
+        prefetcher.start()
+
+@app.on_event("shutdown")
+async def stop_jobs():
+    job_engine.stop()
+    reminder_scheduler.stop()
+    loop_monitor.stop()
+    if capture_writer:
+        capture_writer.close()
+    if shadow_mirror:
+        await shadow_mirror.close()
+    if prefetcher:
+        prefetcher.stop()
 
 @app.post("/task")
 async def task_endpoint(req: TaskRequest):
-    # Handle specific tasks (can be extended based on requirements)
-    tasks = {
-        "weather": lambda params: "Weather functionality to be implemented",
-        "play_music": lambda params: "Music playback functionality to be implemented",
-        "set_reminder": lambda params: "Reminder functionality to be implemented"
-    }
+    """Queue a task as a background job; poll it with GET /task/{job_id}"""
+    try:
+        job = job_engine.submit(req.task, req.parameters)
+    except KeyError:
+        return {"error": "Task not supported"}
     
-    if req.task in tasks:
-        return {"result": tasks[req.task](req.parameters)}
-    return {"error": "Task not supported"}
+    waited = 0.0
+    while waited < req.wait and job["status"] in ("queued", "running"):
+        await asyncio.sleep(0.1)
+        waited += 0.1
+        job = job_engine.store.get(job["job_id"])
+    return job
 
-@app.get("/models")
-async def get_models():
-    """Get available AI models from all providers"""
-    models = {
+@app.get("/task/{job_id}")
+async def get_task(job_id: str):
+    """Status, progress and result of a job"""
+    job = job_engine.store.get(job_id)
+    if not job:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    return job
+
+@app.delete("/task/{job_id}")
+async def cancel_task(job_id: str):
+    """Cancel a job: queued jobs stop immediately, running ones at their next check"""
+    job = job_engine.cancel(job_id)
+    if not job:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    return job
+
+class ReminderRequest(BaseModel):
+    session_id: str
+    message: str
+    due_at: Optional[float] = None  # Unix time
+    in_seconds: Optional[float] = None
+    in_minutes: Optional[float] = None
+
+@app.post("/reminders")
+async def create_reminder(req: ReminderRequest):
+    """Schedule a reminder, pushed to the session's /ws clients when due"""
+    try:
+        due_at = reminder_due_at(req.model_dump())
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    return reminder_scheduler.schedule(req.session_id, req.message, due_at)
+
+@app.get("/reminders")
+async def list_reminders(session_id: str):
+    """A session's pending and undelivered reminders"""
+    return {"reminders": reminder_store.for_session(session_id)}
+
+@app.delete("/reminders/{reminder_id}")
+async def cancel_reminder(reminder_id: int, session_id: str):
+    """Cancel one of the session's reminders; other sessions' reminders are not found"""
+    if not reminder_scheduler.cancel(reminder_id, session_id):
+        return JSONResponse(status_code=404, content={"error": "No pending reminder with that id"})
+    return {"message": "Reminder cancelled", "id": reminder_id}
+
+@app.get("/tasks")
+async def list_tasks(status: Optional[str] = None, limit: int = 50):
+    """Recent jobs, newest first"""
+    return {"jobs": job_engine.store.list(status, min(limit, 500))}
+
+def models_status() -> dict:
+    """Available models, current choices and status for every provider"""
+    return {
         "providers": {
             "gemini": {
-                "available": ["gemini-pro"],
+                "available": GEMINI_MODELS,
+                "current": default_model("gemini"),
                 "status": "configured" if gemini_client.is_configured else "not configured",
                 "priority": 1,
+                "quota": rate_limiter.status("gemini"),
                 "description": "Google Gemini Pro (free tier, fast, cloud-based)"
             },
             "openai": {
-                "available": ["gpt-3.5-turbo", "gpt-4"],
+                "available": OPENAI_MODELS,
+                "current": default_model("openai"),
                 "status": "configured" if openai_client else "not configured",
                 "priority": 2,
+                "quota": rate_limiter.status("openai"),
                 "description": "OpenAI GPT models (fast, reliable, paid)"
             },
             "ollama": {
                 "available": ollama_client.available_models,
-                "current": ollama_client.current_model,
+                "current": default_model("ollama"),
                 "status": "connected" if ollama_client.current_model else "disconnected",
                 "priority": 3,
+                "quota": rate_limiter.status("ollama"),
+                "hosts": ollama_client.pool.status(),
                 "description": "Local AI models (private, slower)"
             }
         },
         "priority_order": "Gemini → OpenAI → Ollama → Rule-based fallback"
     }
-    return models
+
+@app.get("/models")
+async def get_models():
+    """Get available AI models from all providers"""
+    return models_status()
+
+# Embeddings come from Ollama, grouped into batches and cached on disk by content hash
+EMBED_MODEL = os.getenv("EMBED_MODEL", "nomic-embed-text")
+EMBED_TIMEOUT = float(os.getenv("EMBED_TIMEOUT", "60"))
+EMBED_MAX_TEXTS = int(os.getenv("EMBED_MAX_TEXTS", "10000"))
+
+async def ollama_embed(texts: List[str], model: str) -> list:
+    lane = lane_pool.get().lane("ollama", model)
+    with stage_timers.stage("provider:ollama_embed"):
+        return await run_provider(lane, lane.client.embed, texts, model, timeout=EMBED_TIMEOUT)
+
+embedding_service = EmbeddingService(
+    EmbeddingCache(os.getenv("EMBED_CACHE_DIR", "embedding_cache")), ollama_embed,
+    max_batch=int(os.getenv("EMBED_BATCH_SIZE", "64")),
+    max_wait=float(os.getenv("EMBED_BATCH_WAIT_MS", "5")) / 1000
+)
+
+@app.post("/embed")
+async def embed_endpoint(req: EmbedRequest, request: Request):
+    """Embedding vectors for a list of texts, in the same order"""
+    if not req.texts or len(req.texts) > EMBED_MAX_TEXTS:
+        return JSONResponse(status_code=400, content={"error": f"Send between 1 and {EMBED_MAX_TEXTS} texts"})
+    if req.encoding not in ("float", "base64"):
+        return JSONResponse(status_code=400, content={"error": f"Unknown encoding: {req.encoding} (use float or base64)"})
+    # Each text counts against the client's CLIENT_RPM, as batch items do
+    retry_after = rate_limiter.check_client(client_id(request), len(req.texts))
+    if retry_after:
+        return JSONResponse(
+            status_code=429,
+            content={"error": f"Rate limit exceeded: {len(req.texts)} texts need that many requests of quota"},
+            headers={"Retry-After": str(max(1, round(retry_after)))}
+        )
+    model = req.model or EMBED_MODEL
+    if not known_model("ollama", model):
+        return JSONResponse(status_code=400, content={"error": f"Unknown embedding model: {model}"})
+    try:
+        vectors, cached = await embedding_service.embed(req.texts, model)
+    except Exception as e:
+        print(f"❌ Embedding error: {e}")
+        return JSONResponse(status_code=502, content={"error": f"Embedding failed: {e}"})
+    
+    with stage_timers.stage("serialize"):
+        result = {"model": model, "dimensions": int(vectors.shape[1]), "count": len(vectors), "cached": cached}
+        if req.encoding == "base64":
+            result["embeddings"] = base64.b64encode(vectors.astype("<f4", copy=False).tobytes()).decode("ascii")
+        else:
+            result["embeddings"] = vectors.tolist()
+        return JSONResponse(result)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Runtime counters for the backend"""
+    return {"singleflight": singleflight.metrics(), "cascade": cascade.metrics() if cascade else None,
+            "capture": capture_writer.stats() if capture_writer else None,
+            "embeddings": embedding_service.metrics(),
+            "gemini_sessions": gemini_client.metrics(),
+            "shadow": shadow_mirror.metrics() if shadow_mirror else None,
+            "admission": admission.metrics() if admission else None,
+            "prefetch": prefetcher.metrics() if prefetcher else None}
+
+# Debug endpoints need X-Admin-Token when ADMIN_TOKEN is set; otherwise they only answer local callers
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+MAX_PROFILE_SECONDS = 60
+
+def is_admin(request: Request) -> bool:
+    if ADMIN_TOKEN:
+        return hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN)
+    return bool(request.client) and request.client.host in ("127.0.0.1", "::1")
+
+@app.get("/debug/profile")
+async def debug_profile(request: Request, seconds: float = 10, interval_ms: float = 5):
+    """Sample every thread's stack for `seconds` and return collapsed stacks for a flamegraph"""
+    if not is_admin(request):
+        return JSONResponse(status_code=403, content={"error": "Admin access required"})
+    seconds = min(max(seconds, 0.1), MAX_PROFILE_SECONDS)
+    interval = max(interval_ms, 1) / 1000
+    print(f"🔍 Profiling for {seconds:.1f}s")
+    loop = asyncio.get_running_loop()
+    collapsed = await loop.run_in_executor(None, profiler.profile, seconds, interval)
+    if collapsed is None:
+        return JSONResponse(status_code=409, content={"error": "A profile is already running"})
+    return PlainTextResponse(collapsed)
+
+@app.get("/debug/stats")
+async def debug_stats(request: Request):
+    """Event-loop lag and per-stage timings"""
+    if not is_admin(request):
+        return JSONResponse(status_code=403, content={"error": "Admin access required"})
+    return {"event_loop": loop_monitor.stats(), "stages": stage_timers.stats()}
+
+@app.get("/shadow")
+async def shadow_summary(request: Request, hours: Optional[float] = None):
+    """Shadow traffic results per model: latency, answer tokens and failure rate"""
+    if not is_admin(request):
+        return JSONResponse(status_code=403, content={"error": "Admin access required"})
+    if not shadow_mirror:
+        return JSONResponse(status_code=404, content={"error": "Shadow mode is off (set SHADOW_FRACTION and SHADOW_CANDIDATE)"})
+    since = time.time() - hours * 3600 if hours else None
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, shadow_mirror.store.summary, since)
+
+@app.get("/shadow/export")
+async def shadow_export(request: Request, format: str = "csv", hours: Optional[float] = None):
+    """Every shadow run as CSV or JSON lines"""
+    if not is_admin(request):
+        return JSONResponse(status_code=403, content={"error": "Admin access required"})
+    if not shadow_mirror:
+        return JSONResponse(status_code=404, content={"error": "Shadow mode is off (set SHADOW_FRACTION and SHADOW_CANDIDATE)"})
+    if format not in ("csv", "jsonl"):
+        return JSONResponse(status_code=400, content={"error": "format must be csv or jsonl"})
+    since = time.time() - hours * 3600 if hours else None
+    loop = asyncio.get_running_loop()
+    text = await loop.run_in_executor(None, shadow_mirror.store.export_text, format, since)
+    return PlainTextResponse(text, media_type="text/csv" if format == "csv" else "application/x-ndjson")
 
 @app.post("/switch_model")
 async def switch_model(model_data: dict):
-    """Switch AI model and provider"""
-    global selected_provider
-    
+    """Switch AI model and provider, for one session if session_id is given, otherwise globally"""
     model_name = model_data.get("model")
+    session_id = model_data.get("session_id")
     if not model_name:
         return {"error": "Model name required"}
     
-    print(f"🔧 Switch model request: '{model_name}'")
+    print(f"🔧 Switch model request: '{model_name}' (session: {session_id or 'global'})")
+    
+    def select(provider, model):
+        if session_id:
+            state.set(f"session:{session_id}", {"provider": provider, "model": model})
+        else:
+            state.set("selected_provider", provider)
+            state.set(f"{provider}_model", model)
+        print(f"🔧 Set provider to: {provider} ({model})")
+    
+    def select_ollama(model):
+        if session_id:
+            if model not in ollama_client.available_models:
+                return False
+        elif not ollama_client.switch_model(model):
+            return False
+        select("ollama", model)
+        return True
     
     # Parse provider and model from format "Provider: model"
     if ":" in model_name:
@@ -529,30 +1260,34 @@ async def switch_model(model_data: dict):
         
         print(f"🔧 Parsed - Provider: '{provider}', Model: '{actual_model}'")
         
+        if provider in ("gemini", "openai") and not known_model(provider, actual_model):
+            return {"error": f"Unknown {provider} model: {actual_model}"}
+        
         if provider == "gemini":
-            selected_provider = "gemini"
-            print(f"🔧 Set selected_provider to: {selected_provider}")
-            return {"message": f"Switched to Gemini Pro", "current_model": actual_model, "provider": "gemini"}
+            select("gemini", actual_model)
+            return {"message": f"Switched to Gemini: {actual_model}", "current_model": actual_model, "provider": "gemini"}
         
         elif provider == "ollama":
-            selected_provider = "ollama"
-            print(f"🔧 Set selected_provider to: {selected_provider}")
-            if ollama_client.switch_model(actual_model):
+            if select_ollama(actual_model):
                 return {"message": f"Switched to Ollama: {actual_model}", "current_model": actual_model, "provider": "ollama"}
             else:
                 return {"error": f"Could not switch to Ollama: {actual_model}"}
         
         elif provider == "openai":
-            selected_provider = "openai"
+            select("openai", actual_model)
             return {"message": f"Switched to OpenAI: {actual_model}", "current_model": actual_model, "provider": "openai"}
     
     # Legacy format - assume Ollama
-    if ollama_client.switch_model(model_name):
-        selected_provider = "ollama"
+    if select_ollama(model_name):
         return {"message": f"Switched to Ollama: {model_name}", "current_model": model_name, "provider": "ollama"}
     else:
         return {"error": f"Could not switch to {model_name}"}
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    
+    # Routing state lives in the shared store, so several workers stay consistent
+    if WORKERS > 1:
+        uvicorn.run("main:app", host="0.0.0.0", port=8001, workers=WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -2,11 +2,11 @@ import tkinter as tk
 from tkinter import scrolledtext, ttk, messagebox
 import threading
 from voice_assistant import VoiceAssistant
-import requests
+from backend_client import create_backend
 import sys
 
 class ModernAssistantGUI:
-    def __init__(self, root):
+    def __init__(self, root, transport=None):
         self.root = root
         self.root.title("🤖 Professional AI Assistant")
         self.root.geometry("800x900")
@@ -16,10 +16,15 @@ class ModernAssistantGUI:
         # Set modern theme
         self.setup_theme()
         
-        self.context = {}
         self.assistant = VoiceAssistant()
         
         self.setup_modern_gui()
+        
+        # Persistent WebSocket session when available (or the backend in-process with
+        # transport="embedded"); model choice applies to this window only
+        self.backend = create_backend("http://localhost:8001", transport=transport,
+                                      on_status=lambda event: self.root.after(0, self.on_backend_status, event))
+        self.session_id = self.backend.session_id
         self.load_models()
         
         # Protocol for window closing
@@ -257,6 +262,7 @@ class ModernAssistantGUI:
         """Handle window closing with confirmation"""
         if messagebox.askokcancel("Close Application", 
                                  "Are you sure you want to close the AI Assistant?"):
+            self.backend.close()
             self.root.quit()
             self.root.destroy()
             sys.exit(0)
@@ -282,32 +288,65 @@ class ModernAssistantGUI:
     
     def _send_message_thread(self, message):
         """Background thread for sending messages"""
+        # Streamed text is inserted as it arrives; all widget updates go through
+        # root.after so they run on the Tk thread in order
+        answer_state = {"streaming": False}
+        
+        def show_delta(text):
+            if not answer_state["streaming"]:
+                answer_state["streaming"] = True
+                self.chat_area.mark_set("answer_start", "end-1c")
+                self.chat_area.mark_gravity("answer_start", tk.LEFT)
+                self.chat_area.insert(tk.END, "Assistant: ", "assistant")
+            self.chat_area.insert(tk.END, text)
+            self.chat_area.see(tk.END)
+        
+        def discard_partial():
+            # The provider failed mid-answer; the next one starts over
+            if answer_state["streaming"]:
+                self.chat_area.delete("answer_start", "end-1c")
+                answer_state["streaming"] = False
+        
+        def show_answer(answer, provider):
+            if answer_state["streaming"]:
+                self.chat_area.insert(tk.END, "\n\n")
+            else:
+                self.append_message("Assistant", answer)
+            self.append_message("System", f"🤖 Provider: {provider}")
+            self.status_label.configure(text=f"🟢 Ready | Last answer: {provider}")
+        
         try:
-            response = requests.post(
-                "http://localhost:8001/chat",
-                json={"message": message, "context": self.context},
+            result = self.backend.chat(
+                message,
+                on_delta=lambda text: self.root.after(0, show_delta, text),
+                on_reset=lambda: self.root.after(0, discard_partial),
                 timeout=30
             )
+            answer = result.get("answer", "No response received")
+            provider = result.get("provider", "Unknown")
             
-            if response.status_code == 200:
-                result = response.json()
-                answer = result.get("answer", "No response received")
-                provider = result.get("provider", "Unknown")
-                self.context = result.get("context", {})
-                
-                # Update UI in main thread
-                self.root.after(0, lambda: self.append_message("Assistant", answer))
-                self.root.after(0, lambda: self.append_message("System", f"🤖 Provider: {provider}"))
-            else:
-                self.root.after(0, lambda: self.append_message("Assistant", 
-                    f"❌ Server error: {response.status_code}"))
+            # Update UI in main thread
+            self.root.after(0, show_answer, answer, provider)
         except Exception as e:
+            self.root.after(0, discard_partial)
             self.root.after(0, lambda: self.append_message("Assistant", 
                 f"❌ Cannot connect to backend server. Error: {str(e)}"))
         finally:
             # Re-enable send button
             self.root.after(0, lambda: self.send_button.configure(text="📤 Send", state="normal"))
     
+    def on_backend_status(self, event):
+        """Status pushed over the WebSocket session (runs on the Tk thread)"""
+        if event.get("type") == "status":
+            self.status_label.configure(text=f"⏳ Asking {event.get('provider')}...")
+        elif event.get("type") == "reminder":
+            self.append_message("Assistant", f"⏰ Reminder: {event.get('message', '')}")
+        elif event.get("type") in ("ready", "models"):
+            providers = event.get("models", {}).get("providers", {})
+            working_count = sum(1 for p in providers.values()
+                               if p.get("status") in ["configured", "connected"])
+            self.status_label.configure(text=f"🟢 Ready | {working_count}/{len(providers)} providers active")
+    
     def start_voice_input(self):
         """Start voice input with UI feedback"""
         self.voice_button.configure(text="🎙️ Listening...", state="disabled")
@@ -338,13 +377,12 @@ class ModernAssistantGUI:
         """Background thread for server status check"""
         try:
             # Check server connectivity
-            response = requests.get("http://localhost:8001", timeout=3)
+            self.backend.health()
             self.root.after(0, lambda: self.append_message("System", "✅ Server is running and connected!"))
             
             # Check AI providers status
-            models_response = requests.get("http://localhost:8001/models", timeout=3)
-            if models_response.status_code == 200:
-                models_data = models_response.json()
+            models_data = self.backend.models()
+            if models_data:
                 providers = models_data.get("providers", {})
                 
                 self.root.after(0, lambda: self.append_message("System", "🤖 AI Providers Status:"))
@@ -376,15 +414,14 @@ class ModernAssistantGUI:
         """Clear chat with confirmation"""
         if messagebox.askyesno("Clear Chat", "Are you sure you want to clear the conversation?"):
             self.chat_area.delete('1.0', tk.END)
-            self.context = {}
+            self.backend.reset()
             self.append_message("System", "🗑️ Chat cleared!")
     
     def load_models(self):
         """Load available models from server"""
         try:
-            response = requests.get("http://localhost:8001/models", timeout=3)
-            if response.status_code == 200:
-                models_data = response.json()
+            models_data = self.backend.models()
+            if models_data:
                 providers = models_data.get("providers", {})
                 
                 # Collect all available models from all providers
@@ -421,25 +458,11 @@ class ModernAssistantGUI:
         try:
             # Parse the model format "Provider: model"
             if ":" in selected_model:
-                provider, model_name = selected_model.split(":", 1)
-                provider = provider.strip().lower()
-                model_name = model_name.strip()
-                
-                if provider == "ollama":
-                    # Only Ollama models can be switched via API
-                    response = requests.post(
-                        "http://localhost:8001/switch_model",
-                        json={"model": model_name},
-                        timeout=5
-                    )
-                    result = response.json()
-                    if "error" in result:
-                        self.append_message("System", f"❌ {result['error']}")
-                    else:
-                        self.append_message("System", f"✅ {result['message']}")
+                result = self.backend.switch_model(selected_model)
+                if "error" in result:
+                    self.append_message("System", f"❌ {result['error']}")
                 else:
-                    # For Gemini/OpenAI, just show a message (priority order handles this)
-                    self.append_message("System", f"🔄 Selected {selected_model}. The system will prioritize this provider for responses.")
+                    self.append_message("System", f"✅ {result['message']}")
             else:
                 self.append_message("System", "❌ Invalid model format")
                 
@@ -449,8 +472,9 @@ class ModernAssistantGUI:
             self.switch_button.configure(text="🔄 Switch Model", state="normal")
 
 if __name__ == "__main__":
+    # --embedded runs the backend inside the GUI process instead of talking to main.py over HTTP
     root = tk.Tk()
-    app = ModernAssistantGUI(root)
+    app = ModernAssistantGUI(root, transport="embedded" if "--embedded" in sys.argv else None)
     
     # Initial welcome message
     app.append_message("Assistant", "Hello! How can I help you today?")
@@ -1,26 +1,174 @@
 #!/usr/bin/env python
 """
 Ollama Integration for AI Assistant
+
+The client can spread requests over several Ollama hosts (OLLAMA_HOSTS, comma
+separated). Each request goes to the least-loaded healthy host that already has
+the model loaded in memory, and fails over to the next host if that one errors.
 """
+import os
 import requests
 import json
-from typing import Optional, Dict, Any
+import threading
+import time
+from typing import Optional, Dict, Any, Callable, List, Tuple
+
+from cascade import is_code_request
+from inference_profiles import InferenceProfiles
+
+class OllamaHostError(Exception):
+    """A host failed in a way another host might not (server error)"""
+
+class OllamaHost:
+    """One Ollama server: its models, what it has loaded and how it is doing"""
+    
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.models: List[str] = []
+        self.resident: set = set()  # Models currently loaded in memory (/api/ps)
+        self.in_flight = 0
+        self.latency = 0.0  # Moving average seconds per request
+        self.failures = 0
+        self.down_until = 0.0
+    
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.down_until
+    
+    def status(self) -> dict:
+        return {"url": self.url, "healthy": self.healthy, "in_flight": self.in_flight,
+                "models": self.models, "resident": sorted(self.resident),
+                "latency_ms": round(self.latency * 1000, 1)}
+
+class OllamaHostPool:
+    """Tracks a set of Ollama hosts and picks one per request"""
+    
+    def __init__(self, urls: List[str], refresh_interval: float = 10.0, spill_after: int = 2):
+        self.hosts = [OllamaHost(url) for url in urls]
+        self.refresh_interval = refresh_interval
+        self.spill_after = spill_after  # Busy loaded hosts lose their preference at this many requests
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+    
+    def refresh(self) -> None:
+        """Re-read every host's models and loaded models"""
+        for host in self.hosts:
+            try:
+                tags = self.session.get(f"{host.url}/api/tags", timeout=5)
+                tags.raise_for_status()
+                models = [model['name'] for model in tags.json().get('models', [])]
+                resident = set()
+                try:
+                    ps = self.session.get(f"{host.url}/api/ps", timeout=5)
+                    if ps.status_code == 200:
+                        resident = {model['name'] for model in ps.json().get('models', [])}
+                except requests.RequestException:
+                    pass
+                with self._lock:
+                    host.models, host.resident = models, resident
+                    host.failures, host.down_until = 0, 0.0
+            except Exception as e:
+                self.failed(host, e)
+    
+    def start(self) -> None:
+        """Keep host state fresh in the background (only useful with several hosts)"""
+        if self._refresher is None and len(self.hosts) > 1:
+            self._refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+            self._refresher.start()
+    
+    def _refresh_loop(self) -> None:
+        while True:
+            time.sleep(self.refresh_interval)
+            self.refresh()
+    
+    @property
+    def models(self) -> List[str]:
+        """Every model available on at least one host"""
+        seen = []
+        for host in self.hosts:
+            seen.extend(model for model in host.models if model not in seen)
+        return seen
+    
+    def pick(self, model: str, exclude=()) -> Optional[OllamaHost]:
+        """Least-loaded healthy host with the model, preferring hosts that have it loaded.
+        
+        Once every host with the model loaded has spill_after requests running,
+        the next one goes to an idle host even though it has to load the model.
+        If every candidate is marked down, the one that went down first is
+        returned anyway rather than failing without trying.
+        """
+        with self._lock:
+            candidates = [h for h in self.hosts if h not in exclude and (model in h.models or not h.models)]
+            healthy = [h for h in candidates if h.healthy]
+            if not healthy:
+                return min(candidates, key=lambda h: h.down_until, default=None)
+            return min(healthy, key=lambda h: (model not in h.resident or h.in_flight >= self.spill_after,
+                                               h.in_flight, h.latency))
+    
+    def begin(self, host: OllamaHost) -> float:
+        with self._lock:
+            host.in_flight += 1
+        return time.monotonic()
+    
+    def end(self, host: OllamaHost, model: str, started: float, ok: bool) -> None:
+        with self._lock:
+            host.in_flight -= 1
+            if ok:
+                host.latency = 0.8 * host.latency + 0.2 * (time.monotonic() - started) if host.latency \
+                    else time.monotonic() - started
+                host.resident.add(model)  # Ollama keeps a model loaded after using it
+                host.failures, host.down_until = 0, 0.0
+    
+    def failed(self, host: OllamaHost, error) -> None:
+        """Take a host out of rotation for a while, longer after repeated failures"""
+        with self._lock:
+            host.failures += 1
+            backoff = min(60.0, 2.0 ** host.failures)
+            host.down_until = time.monotonic() + backoff
+        print(f"⚠️  Ollama host {host.url} failed ({error}), retrying it in {backoff:.0f}s")
+    
+    def status(self) -> List[dict]:
+        with self._lock:
+            return [host.status() for host in self.hosts]
+
+def ollama_pool_from_env(base_url: Optional[str] = None) -> OllamaHostPool:
+    """Host pool from base_url or OLLAMA_HOSTS (comma-separated URLs)"""
+    urls = [url.strip() for url in (base_url or os.getenv("OLLAMA_HOSTS") or "http://localhost:11434").split(",")]
+    return OllamaHostPool([url for url in urls if url],
+                          refresh_interval=float(os.getenv("OLLAMA_HOST_REFRESH", "10")),
+                          spill_after=int(os.getenv("OLLAMA_HOST_SPILL_AFTER", "2")))
 
 class OllamaClient:
-    def __init__(self, base_url: str = "http://localhost:11434"):
-        self.base_url = base_url
+    def __init__(self, base_url: Optional[str] = None, connect: bool = True,
+                 pool: Optional[OllamaHostPool] = None, profiles: Optional[InferenceProfiles] = None):
+        self.pool = pool or ollama_pool_from_env(base_url)
+        self.profiles = profiles or InferenceProfiles()
+        self.base_url = self.pool.hosts[0].url
         self.available_models = []
         self.current_model = None
-        self.check_connection()
+        self.session = requests.Session()  # Reuse keep-alive connections
+        if connect:
+            self.check_connection()
+            self.pool.start()
+    
+    def for_model(self, model: str) -> "OllamaClient":
+        """A client pinned to one model, with its own connection pool (sharing host state)"""
+        client = OllamaClient(connect=False, pool=self.pool, profiles=self.profiles)
+        client.available_models = self.available_models
+        client.current_model = model
+        return client
         
     def check_connection(self) -> bool:
         """Check if Ollama service is running"""
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
-            if response.status_code == 200:
-                models_data = response.json()
-                self.available_models = [model['name'] for model in models_data.get('models', [])]
+            self.pool.refresh()
+            if any(host.healthy and host.models for host in self.pool.hosts):
+                self.available_models = self.pool.models
                 print(f"✅ Connected to Ollama. Available models: {self.available_models}")
+                if len(self.pool.hosts) > 1:
+                    healthy = sum(1 for host in self.pool.hosts if host.healthy)
+                    print(f"✅ Ollama hosts: {healthy}/{len(self.pool.hosts)} healthy")
                 
                 # Set default model
                 if 'mistral:latest' in self.available_models:
@@ -37,57 +185,155 @@ class OllamaClient:
             print(f"❌ Cannot connect to Ollama: {str(e)}")
             return False
     
-    def generate_response(self, prompt: str, model: Optional[str] = None, timeout: int = 10) -> str:
-        """Generate response using Ollama with shorter timeout"""
+    def generate_response(self, prompt: str, model: Optional[str] = None, timeout: Optional[float] = None,
+                          on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """Generate response using Ollama with shorter timeout.
+        
+        timeout is the total time allowed in seconds; without one, 10s (15s for
+        code requests) is used. If on_delta is given the answer is streamed and
+        on_delta is called with each piece of text as it arrives; the full answer
+        is still returned.
+        """
         model = model or self.current_model
         if not model:
             return "No model available"
             
         try:
             # For code generation, use more focused options
-            is_code_request = any(keyword in prompt.lower() for keyword in 
-                                ['program', 'code', 'function', 'cpp', 'python', 'java', 'javascript', 'algorithm'])
-            
-            if is_code_request:
+            if is_code_request(prompt):
                 options = {
                     "temperature": 0.3,  # Lower temperature for more focused code
                     "top_p": 0.8,
-                    "max_tokens": 500,  # Reduced for faster responses
+                    "num_predict": 500,  # Reduced for faster responses
                     "stop": ["\n\n\n"]  # Stop at multiple newlines to avoid excessive output
                 }
-                timeout = 15  # Reduced timeout for code generation
+                default_timeout = 15  # Reduced timeout for code generation
             else:
                 options = {
                     "temperature": 0.7,
                     "top_p": 0.9,
-                    "max_tokens": 200  # Reduced for faster responses
+                    "num_predict": 200  # Reduced for faster responses
                 }
+                default_timeout = 10
+            timeout = timeout if timeout is not None else default_timeout
+            stop_at = time.monotonic() + timeout
             
             payload = {
                 "model": model,
                 "prompt": prompt,
-                "stream": False,
-                "options": options
+                "stream": on_delta is not None
             }
             
-            response = requests.post(
-                f"{self.base_url}/api/generate",
-                json=payload,
-                timeout=timeout
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result.get('response', 'No response generated')
-            else:
-                return f"Error: {response.status_code} - {response.text}"
+            # Try hosts in order of preference until one answers or time runs out
+            tried = []
+            while True:
+                host = self.pool.pick(model, exclude=tried)
+                remaining = stop_at - time.monotonic()
+                if host is None:
+                    if tried:
+                        return f"Error: every Ollama host with model {model} failed"
+                    return f"Error: no Ollama host has model {model}"
+                if remaining <= 0:
+                    return "Request timed out. Ollama is taking too long to respond."
+                tried.append(host)
+                streamed = []
+                started = self.pool.begin(host)
+                ok = False
+                try:
+                    result, ok = self._generate_on(host, self._with_profile(payload, model, host, options),
+                                                   remaining, stop_at, on_delta, streamed)
+                    return result
+                except (requests.exceptions.ConnectionError, OllamaHostError) as e:
+                    self.pool.failed(host, e)
+                    if streamed:
+                        raise  # Part of the answer already went out; can't restart elsewhere
+                finally:
+                    self.pool.end(host, model, started, ok)
                 
         except requests.exceptions.Timeout:
             return "Request timed out. Ollama is taking too long to respond."
         except Exception as e:
             return f"Error generating response: {str(e)}"
     
-    def chat_completion(self, messages: list, model: Optional[str] = None) -> str:
+    def _with_profile(self, payload: dict, model: str, host: OllamaHost, options: dict) -> dict:
+        """payload with the options and keep_alive of the model's profile for this host"""
+        payload = dict(payload, options=dict(options, **self.profiles.options(model, host.url)))  # Tuned num_thread/num_ctx/num_batch
+        keep_alive = self.profiles.keep_alive(model, host.url)
+        if keep_alive:
+            payload["keep_alive"] = keep_alive
+        return payload
+    
+    def _generate_on(self, host: OllamaHost, payload: dict, timeout: float, stop_at: float,
+                     on_delta: Optional[Callable[[str], None]], streamed: list) -> Tuple[str, bool]:
+        """One /api/generate call against one host; returns the text and whether the host finished it"""
+        response = self.session.post(
+            f"{host.url}/api/generate",
+            json=payload,
+            timeout=timeout,
+            stream=on_delta is not None
+        )
+        
+        if response.status_code >= 500:
+            raise OllamaHostError(f"{response.status_code} - {response.text}")
+        if response.status_code != 200:
+            return f"Error: {response.status_code} - {response.text}", False
+        if on_delta is None:
+            result = response.json()
+            return result.get('response', 'No response generated'), True
+        
+        # Streaming: one JSON object per line until "done"
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get('response'):
+                streamed.append(chunk['response'])
+                on_delta(chunk['response'])
+            if chunk.get('done'):
+                return "".join(streamed) or 'No response generated', True
+            if time.monotonic() > stop_at:
+                response.close()
+                return "Request timed out. Ollama is taking too long to respond.", False
+        # The stream ended without "done": the host cut the answer short
+        return "".join(streamed) or 'No response generated', False
+    
+    def embed(self, texts: List[str], model: str, timeout: float = 60) -> List[List[float]]:
+        """Embedding vectors for texts, in one /api/embed call; raises on failure"""
+        stop_at = time.monotonic() + timeout
+        tried = []
+        while True:
+            host = self.pool.pick(model, exclude=tried)
+            if host is None:
+                raise RuntimeError(f"No Ollama host could embed with {model}")
+            remaining = stop_at - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Ollama embedding timed out")
+            tried.append(host)
+            started = self.pool.begin(host)
+            ok = False
+            try:
+                payload = {"model": model, "input": texts}
+                keep_alive = self.profiles.keep_alive(model, host.url)
+                if keep_alive:
+                    payload["keep_alive"] = keep_alive
+                response = self.session.post(f"{host.url}/api/embed", json=payload, timeout=remaining)
+                if response.status_code >= 500:
+                    raise OllamaHostError(f"{response.status_code} - {response.text}")
+                if response.status_code != 200:
+                    raise RuntimeError(f"Ollama embed error: {response.status_code} - {response.text}")
+                embeddings = response.json().get("embeddings") or []
+                if len(embeddings) != len(texts):
+                    raise RuntimeError(f"Ollama returned {len(embeddings)} embeddings for {len(texts)} texts")
+                ok = True
+                return embeddings
+            except (requests.exceptions.ConnectionError, OllamaHostError) as e:
+                self.pool.failed(host, e)
+            finally:
+                self.pool.end(host, model, started, ok)
+    
+    def chat_completion(self, messages: list, model: Optional[str] = None,
+                        on_delta: Optional[Callable[[str], None]] = None,
+                        timeout: Optional[float] = None) -> str:
         """Chat completion similar to OpenAI format"""
         model = model or self.current_model
         if not model:
@@ -107,7 +353,7 @@ class OllamaClient:
         
         prompt += "Assistant: "
         
-        return self.generate_response(prompt, model)
+        return self.generate_response(prompt, model, timeout=timeout, on_delta=on_delta)
     
     def switch_model(self, model_name: str) -> bool:
         """Switch to a different model"""
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+"""
+Stand-in Ollama server for trying out multi-host setups without GPUs.
+
+    python ollama_stub.py --ports 11435,11436,11437 --models tiny:latest,big:latest
+    OLLAMA_HOSTS=http://localhost:11435,http://localhost:11436,http://localhost:11437 python main.py
+
+Serves /api/tags, /api/ps, /api/generate (streaming or not) with canned
+answers, and /api/embed with repeatable random vectors. A model that isn't loaded yet costs --load-delay seconds on first
+use and stays loaded after that, like the real server (new num_ctx, num_batch
+or num_thread values reload it, and /api/ps reports a size that grows with
+num_ctx, so inference_profiles.py can be tried too). --fail-rate makes a
+share of generate calls answer 500 so failover can be exercised.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = "This is a canned answer from the Ollama stub on port {port}."
+
+class StubState:
+    """What one stub server has loaded and how it behaves"""
+
+    def __init__(self, port: int, models, loaded=(), max_loaded: int = 1, token_delay: float = 0.02,
+                 load_delay: float = 1.0, fail_rate: float = 0.0, embed_dim: int = 768,
+                 embed_delay: float = 0.0005):
+        self.port = port
+        self.models = list(models)
+        self.loaded = OrderedDict((model, {}) for model in loaded)  # model -> runtime options
+        self.max_loaded = max_loaded
+        self.token_delay = token_delay
+        self.load_delay = load_delay
+        self.fail_rate = fail_rate
+        self.embed_dim = embed_dim
+        self.embed_delay = embed_delay  # Seconds per embedded text
+        self.served = 0
+        self.lock = threading.Lock()
+
+    def size(self, model: str) -> int:
+        """Pretend loaded size: 1 GiB of weights plus a KV cache that grows with num_ctx"""
+        return 2**30 + self.loaded.get(model, {}).get("num_ctx", 2048) * 2**18
+
+    def use(self, model: str, options: dict) -> float:
+        """Mark a model loaded (evicting the least recently used); returns the load delay to pay.
+
+        Like Ollama, changing num_ctx, num_batch or num_thread reloads the model.
+        """
+        runtime = {key: options[key] for key in ("num_ctx", "num_batch", "num_thread") if key in options}
+        with self.lock:
+            self.served += 1
+            if self.loaded.get(model) == runtime:
+                self.loaded.move_to_end(model)
+                return 0.0
+            self.loaded.pop(model, None)
+            self.loaded[model] = runtime
+            while len(self.loaded) > self.max_loaded:
+                self.loaded.popitem(last=False)
+            return self.load_delay
+
+def stub_vector(text: str, dim: int) -> list:
+    """Repeatable unit vector for a text"""
+    rng = random.Random(hashlib.sha256(text.encode()).digest())
+    vector = [rng.gauss(0, 1) for _ in range(dim)]
+    norm = sum(x * x for x in vector) ** 0.5
+    return [round(x / norm, 6) for x in vector]
+
+def make_handler(stub: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, status: int, body: dict) -> None:
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/api/tags":
+                self.send_json(200, {"models": [{"name": model, "model": model} for model in stub.models]})
+            elif self.path == "/api/ps":
+                with stub.lock:
+                    loaded = [{"name": model, "model": model, "size": stub.size(model)} for model in stub.loaded]
+                self.send_json(200, {"models": loaded})
+            else:
+                self.send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path not in ("/api/generate", "/api/embed"):
+                self.send_json(404, {"error": "not found"})
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            model = body.get("model")
+            if model not in stub.models:
+                self.send_json(404, {"error": f"model '{model}' not found"})
+                return
+            if random.random() < stub.fail_rate:
+                self.send_json(500, {"error": "stub failure"})
+                return
+            if self.path == "/api/embed":
+                self.embed(model, body)
+                return
+            options = body.get("options") or {}
+            time.sleep(stub.use(model, options))
+            words = [word + " " for word in ANSWER.format(port=stub.port).split()]
+            words = words[:options.get("num_predict") or len(words)]
+            stats = {"eval_count": len(words), "eval_duration": int(stub.token_delay * len(words) * 1e9)}
+            if not body.get("stream"):
+                time.sleep(stub.token_delay * len(words))
+                self.send_json(200, {"model": model, "response": "".join(words).strip(), "done": True, **stats})
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            for word in words:
+                time.sleep(stub.token_delay)
+                self.wfile.write((json.dumps({"model": model, "response": word, "done": False}) + "\n").encode())
+                self.wfile.flush()
+            self.wfile.write((json.dumps({"model": model, "response": "", "done": True, **stats}) + "\n").encode())
+
+        def embed(self, model: str, body: dict) -> None:
+            texts = body.get("input") or []
+            texts = [texts] if isinstance(texts, str) else texts
+            time.sleep(stub.use(model, {}) + stub.embed_delay * len(texts))
+            self.send_json(200, {"model": model, "embeddings": [stub_vector(text, stub.embed_dim) for text in texts]})
+
+    return Handler
+
+def serve(stub: StubState, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Start a stub server on a background thread and return it"""
+    server = ThreadingHTTPServer((host, stub.port), make_handler(stub))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in Ollama server(s)")
+    parser.add_argument("--ports", default="11434", help="Comma-separated ports, one stub server each")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--models", default="tiny:latest", help="Comma-separated model names")
+    parser.add_argument("--loaded", default="", help="Models loaded at start")
+    parser.add_argument("--max-loaded", type=int, default=1, help="Models a server keeps loaded at once")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds per streamed word")
+    parser.add_argument("--load-delay", type=float, default=1.0, help="Seconds to load a model on first use")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of generate calls that return 500")
+    args = parser.parse_args()
+
+    models = [model.strip() for model in args.models.split(",") if model.strip()]
+    loaded = [model.strip() for model in args.loaded.split(",") if model.strip()]
+    for port in (int(port) for port in args.ports.split(",")):
+        serve(StubState(port, models, loaded, args.max_loaded, args.token_delay, args.load_delay,
+                        args.fail_rate), args.host)
+        print(f"✅ Ollama stub listening on http://{args.host}:{port} with {models}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+"""
+Speculative prefetch of likely follow-up questions.
+
+After each answer, predict_followups guesses what the user will ask next from
+a few rules (code in the answer → "explain that", "show me in Python"; a
+definition → "give me an example"; a long answer → "summarize that", ...).
+Prefetcher answers those follow-ups in the background, one at a time and only
+while the providers are idle, and keeps the answers per session. A real
+request arriving mid-computation preempts it, and the follow-up is tried again
+at the next idle moment. When the
+next question is one of the predicted follow-ups, asked about the same
+exchange, it is answered from the cache at once.
+
+Follow-ups are recognised by intent rather than exact wording, so "explain
+that", "can you explain this?" and "what does that mean" all match "explain".
+"""
+import asyncio
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# intent -> (prompt used to precompute it, patterns a follow-up question matches)
+FOLLOWUP_INTENTS: Dict[str, Tuple[str, List[str]]] = {
+    "explain": ("Can you explain that in more detail?", [
+        r"(can you |could you |please )?(explain|elaborate on|break down) (that|this|it)( (again|more|in more detail|step by step))?( please)?",
+        r"what does (that|this|it) mean", r"i don'?t (understand|get it)", r"how does (that|this|it) work",
+    ]),
+    "example": ("Can you give me an example?", [
+        r"(can you |could you |please )?(give|show) (me )?(an |another |a concrete )?example( of (that|this|it))?( please)?",
+        r"(an |for )?example( please)?", r"such as\??",
+    ]),
+    "more": ("Tell me more.", [
+        r"(tell me|say) more( about (that|this|it))?( please)?", r"go on", r"continue", r"more details?( please)?",
+        r"and then\??", r"what else",
+    ]),
+    "python": ("Show me that in Python.", [
+        r"(can you |could you |please )?(show|write|do|give|convert|translate|rewrite) (me )?(it |that |this |the code )?(in|using|to|into) python( please)?",
+        r"(in|using) python( please)?", r"python version( please)?", r"how (would|do) (i|you) do (that|this|it) in python",
+    ]),
+    "simpler": ("Can you explain that more simply?", [
+        r"(can you |could you |please )?(explain|say|put) (that|this|it) (more simply|simpler|in simpler terms|in plain english)( please)?",
+        r"simplify( (that|this|it))?( please)?", r"eli5", r"explain (it )?like i'?m (5|five)", r"in simple terms",
+    ]),
+    "summarize": ("Summarize that briefly.", [
+        r"(can you |could you |please )?(summari[sz]e|shorten|condense) (that|this|it)( please)?",
+        r"tl;?dr", r"(give me )?(a |the )?(short|brief) (version|summary)( please)?", r"in short\??",
+    ]),
+}
+
+INTENT_PATTERNS = {intent: re.compile(r"^(?:" + "|".join(patterns) + r")$")
+                   for intent, (_, patterns) in FOLLOWUP_INTENTS.items()}
+
+CODE_BLOCK = re.compile(r"```(\w*)")
+DEFINITION = re.compile(r"^(what|who) (is|are|was|were)\b|^define\b|^meaning of\b", re.IGNORECASE)
+
+def normalize(message: str) -> str:
+    message = re.sub(r"\s+", " ", message.lower()).strip()
+    return message.rstrip(" ?!.")
+
+def followup_intent(message: str) -> Optional[str]:
+    """The follow-up intent a question expresses, or None if it is not a generic follow-up"""
+    text = normalize(message)
+    if len(text) > 80:
+        return None
+    for intent, pattern in INTENT_PATTERNS.items():
+        if pattern.match(text):
+            return intent
+    return None
+
+def predict_followups(message: str, answer: str, count: int = 2) -> List[str]:
+    """The most likely follow-up intents after this question and answer, best first"""
+    languages = [lang.lower() for lang in CODE_BLOCK.findall(answer)]
+    if languages:
+        ranked = ["explain"] + (["python"] if not any(lang.startswith("py") for lang in languages) else []) + ["simpler"]
+    elif DEFINITION.search(message.strip()):
+        ranked = ["example", "more", "simpler"]
+    elif len(answer.split()) > 150:
+        ranked = ["summarize", "simpler", "example"]
+    else:
+        ranked = ["more", "example", "explain"]
+    return ranked[:count]
+
+def exchange_key(context: Optional[dict]) -> Optional[str]:
+    """Identifies the exchange a follow-up refers to: the context's last question and answer"""
+    if not context or not context.get("last_message") or not context.get("last_answer"):
+        return None
+    payload = f"{context['last_message']}\0{context['last_answer']}".encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+class PrefetchEntry:
+    def __init__(self, intent: str, exchange: str):
+        self.intent = intent
+        self.exchange = exchange
+        self.answer: Optional[str] = None
+        self.provider: Optional[str] = None
+        self.seconds = 0.0  # Time spent computing it
+        self.created = time.monotonic()
+
+class Prefetcher:
+    """Per-session cache of precomputed follow-up answers, filled while providers are idle.
+
+    compute(session_id, prompt, context) answers one follow-up and returns
+    (answer, provider label), or None if no provider gave an answer. idle()
+    says whether the providers are free for low-priority work. Call preempt()
+    when real work starts.
+    """
+
+    def __init__(self, compute: Callable[[str, str, dict], Awaitable[Optional[Tuple[str, str]]]],
+                 idle: Callable[[], bool], count: int = 2, ttl: float = 600, max_sessions: int = 1000,
+                 idle_wait: float = 30):
+        self.compute = compute
+        self.idle = idle
+        self.count = count
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.idle_wait = idle_wait
+        # session_id -> {intent: PrefetchEntry}, least recently used first
+        self._sessions: "OrderedDict[str, Dict[str, PrefetchEntry]]" = OrderedDict()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+        self._computing: Optional[asyncio.Task] = None
+        self._preempted: Optional[asyncio.Task] = None
+        self.stats = {"predicted": 0, "computed": 0, "failed": 0, "dropped_busy": 0, "superseded": 0,
+                      "preempted": 0, "hits": 0, "misses": 0, "wasted": 0, "compute_seconds": 0.0, "wasted_seconds": 0.0}
+
+    def start(self) -> None:
+        self._worker = asyncio.get_running_loop().create_task(self._work())
+
+    def stop(self) -> None:
+        if self._worker:
+            self._worker.cancel()
+
+    def preempt(self) -> None:
+        """Stop the follow-up being computed, if any, to leave the providers to real traffic"""
+        computing = self._computing
+        if computing and not computing.done() and self._preempted is not computing:
+            self._preempted = computing
+            computing.cancel()
+            self.stats["preempted"] += 1
+
+    def take(self, session_id: Optional[str], message: str, context: Optional[dict]) -> Optional[Tuple[str, str]]:
+        """(answer, provider) if this question is a prefetched follow-up of the session's last exchange"""
+        intent = followup_intent(message)
+        if not session_id or intent is None:
+            return None
+        entries = self._sessions.get(session_id, {})
+        entry = entries.get(intent)
+        if entry and entry.answer is not None and entry.exchange == exchange_key(context) \
+                and time.monotonic() - entry.created < self.ttl:
+            del entries[intent]
+            self.stats["hits"] += 1
+            return entry.answer, entry.provider
+        self.stats["misses"] += 1
+        return None
+
+    def schedule(self, session_id: Optional[str], message: str, answer: str, context: dict) -> None:
+        """Queue the likely follow-ups to an answer; context is the conversation context including it"""
+        exchange = exchange_key(context)
+        if not session_id or exchange is None:
+            return
+        self._discard(self._sessions.pop(session_id, {}), "superseded")  # The session has moved on
+        entries = self._sessions[session_id] = {}
+        while len(self._sessions) > self.max_sessions:
+            _, evicted = self._sessions.popitem(last=False)
+            self._discard(evicted, "wasted")
+        for intent in predict_followups(message, answer, self.count):
+            entries[intent] = PrefetchEntry(intent, exchange)
+            self._queue.put_nowait((session_id, entries[intent], dict(context), time.monotonic()))
+            self.stats["predicted"] += 1
+
+    def _discard(self, entries: Dict[str, PrefetchEntry], reason: str) -> None:
+        for entry in entries.values():
+            if entry.answer is not None:
+                self.stats["wasted"] += 1
+                self.stats["wasted_seconds"] += entry.seconds
+            elif reason == "superseded":
+                self.stats["superseded"] += 1
+
+    async def _wait_until_idle(self, queued: float) -> bool:
+        """Wait for idle providers; False if idle_wait passed since the follow-up was queued"""
+        while not self.idle():
+            if time.monotonic() - queued > self.idle_wait:
+                return False
+            await asyncio.sleep(0.2)
+        return True
+
+    def _current(self, session_id: str, entry: PrefetchEntry) -> bool:
+        return self._sessions.get(session_id, {}).get(entry.intent) is entry
+
+    async def _work(self) -> None:
+        while True:
+            session_id, entry, context, queued = await self._queue.get()
+            if not self._current(session_id, entry):
+                continue  # Superseded by a newer answer before we got to it
+            if not await self._wait_until_idle(queued):
+                self.stats["dropped_busy"] += 1
+                self._sessions.get(session_id, {}).pop(entry.intent, None)
+                continue
+
+            started = time.monotonic()
+            computing = self._computing = asyncio.ensure_future(
+                self.compute(session_id, FOLLOWUP_INTENTS[entry.intent][0], context))
+            try:
+                result = await computing
+            except asyncio.CancelledError:
+                if self._preempted is not computing:
+                    raise  # Stopping
+                # Spent for nothing; try again when idle, within the original idle_wait
+                seconds = time.monotonic() - started
+                self.stats["compute_seconds"] += seconds
+                self.stats["wasted_seconds"] += seconds
+                self._queue.put_nowait((session_id, entry, context, queued))
+                continue
+            except Exception as e:
+                print(f"⚠️  Prefetch failed: {e}")
+                result = None
+            finally:
+                self._computing = None
+            entry.seconds = time.monotonic() - started
+            self.stats["compute_seconds"] += entry.seconds
+            if result is None:
+                self.stats["failed"] += 1
+                self._sessions.get(session_id, {}).pop(entry.intent, None)
+                continue
+            entry.answer, entry.provider = result
+            entry.created = time.monotonic()
+            self.stats["computed"] += 1
+            if not self._current(session_id, entry):
+                self.stats["wasted"] += 1  # The session moved on while we were computing
+                self.stats["wasted_seconds"] += entry.seconds
+
+    def metrics(self) -> dict:
+        computed = self.stats["computed"]
+        return dict(
+            self.stats,
+            compute_seconds=round(self.stats["compute_seconds"], 3),
+            wasted_seconds=round(self.stats["wasted_seconds"], 3),
+            hit_rate=round(self.stats["hits"] / computed, 4) if computed else None,
+            wasted_share=round(self.stats["wasted_seconds"] / self.stats["compute_seconds"], 4)
+            if self.stats["compute_seconds"] else None,
+            queued=self._queue.qsize(),
+            sessions=len(self._sessions),
+        )
+
+def prefetcher_from_env(compute, idle) -> Optional[Prefetcher]:
+    """Prefetcher from PREFETCH_* settings, or None unless PREFETCH_FOLLOWUPS=1"""
+    if os.getenv("PREFETCH_FOLLOWUPS", "0") != "1":
+        return None
+    return Prefetcher(
+        compute, idle,
+        count=int(os.getenv("PREFETCH_COUNT", "2")),
+        ttl=float(os.getenv("PREFETCH_TTL", "600")),
+        max_sessions=int(os.getenv("PREFETCH_MAX_SESSIONS", "1000")),
+        idle_wait=float(os.getenv("PREFETCH_IDLE_WAIT", "30")),
+    )
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+Runtime diagnostics for the AI Assistant backend.
+
+- SamplingProfiler: samples every thread's Python stack at a fixed rate and
+  returns them in the "collapsed" format read by flamegraph.pl, speedscope
+  and similar tools (one "frame;frame;frame count" line per distinct stack).
+- LoopLagMonitor: measures how late the event loop wakes up from a short
+  sleep. Sustained lag means something is blocking the loop.
+- StageTimers: named timers around hot-path stages of a request.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Optional
+
+def percentiles(samples, points=(50, 95, 99)) -> dict:
+    ordered = sorted(samples)
+    if not ordered:
+        return {f"p{p}": None for p in points}
+    return {f"p{p}": round(ordered[min(len(ordered) - 1, len(ordered) * p // 100)], 3) for p in points}
+
+class SamplingProfiler:
+    """Wall-clock stack sampler for all threads (one profile at a time)"""
+
+    def __init__(self):
+        self._busy = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._busy.locked()
+
+    @staticmethod
+    def _frame_label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+    def profile(self, seconds: float, interval: float = 0.005) -> Optional[str]:
+        """Sample for `seconds` and return collapsed stacks, or None if a profile is already running.
+
+        Blocks the calling thread for the duration.
+        """
+        if not self._busy.acquire(blocking=False):
+            return None
+        try:
+            me = threading.get_ident()
+            stacks: Counter = Counter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    labels = []
+                    while frame is not None:
+                        labels.append(self._frame_label(frame))
+                        frame = frame.f_back
+                    labels.append(names.get(ident, f"thread-{ident}"))
+                    stacks[";".join(reversed(labels))] += 1
+                time.sleep(interval)
+            return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+        finally:
+            self._busy.release()
+
+class LoopLagMonitor:
+    """Background task that records event-loop scheduling delay"""
+
+    def __init__(self, interval: float = 0.1, window: int = 600, stall_threshold: float = 0.1):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.samples: Deque[float] = deque(maxlen=window)  # Lag in ms
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self.samples.append(lag * 1000)
+            self.max_lag = max(self.max_lag, lag * 1000)
+            if lag >= self.stall_threshold:
+                self.stalls += 1
+
+    def stats(self) -> dict:
+        samples = list(self.samples)
+        return {
+            "current_ms": round(samples[-1], 3) if samples else None,
+            "mean_ms": round(sum(samples) / len(samples), 3) if samples else None,
+            **{f"{k}_ms": v for k, v in percentiles(samples).items()},
+            "max_ms": round(self.max_lag, 3),
+            "stalls": self.stalls,
+            "stall_threshold_ms": self.stall_threshold * 1000,
+        }
+
+class StageTimers:
+    """Per-stage timing totals plus percentiles over the most recent samples"""
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self._stages: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float) -> None:
+        ms = seconds * 1000
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                stage = self._stages[name] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                              "recent": deque(maxlen=self.window)}
+            stage["count"] += 1
+            stage["total_ms"] += ms
+            stage["max_ms"] = max(stage["max_ms"], ms)
+            stage["recent"].append(ms)
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stages = {name: dict(stage, recent=list(stage["recent"])) for name, stage in self._stages.items()}
+        return {
+            name: {
+                "count": stage["count"],
+                "mean_ms": round(stage["total_ms"] / stage["count"], 3),
+                "max_ms": round(stage["max_ms"], 3),
+                **{f"{k}_ms": v for k, v in percentiles(stage["recent"]).items()},
+            }
+            for name, stage in sorted(stages.items())
+        }
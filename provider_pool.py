@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+Per-(provider, model) client pool for the AI Assistant backend.
+
+Each provider/model pair gets its own "lane": a client with its own connections
+and a small set of worker threads for the blocking SDK calls. A slow model (say a
+20B local model) can only back up its own lane, so requests for other models keep
+flowing.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+def parse_lane_overrides(spec: str) -> Dict[Tuple[str, str], int]:
+    """Parse "ollama/gpt-oss:20b=1,openai/gpt-4=2" into {(provider, model): workers}"""
+    overrides = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        try:
+            lane, workers = item.rsplit("=", 1)
+            provider, model = lane.split("/", 1)
+            overrides[(provider.strip().lower(), model.strip())] = int(workers)
+        except ValueError:
+            print(f"⚠️  Ignoring bad LANE_WORKERS_OVERRIDES entry: '{item}'")
+    return overrides
+
+class ProviderLane:
+    """A client and dedicated worker threads for one provider/model pair"""
+
+    def __init__(self, provider: str, model: Optional[str], client: Any, max_workers: int):
+        self.provider = provider
+        self.model = model
+        self.client = client
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix=f"{provider}-{model}")
+
+    @property
+    def key(self) -> Tuple[str, Optional[str]]:
+        return (self.provider, self.model)
+
+class ProviderPool:
+    """Creates lanes lazily, the first time a provider/model pair is requested"""
+
+    def __init__(self, factories: Dict[str, Callable[[Optional[str]], Any]],
+                 max_workers: Optional[int] = None, overrides: Optional[Dict] = None):
+        self.factories = factories
+        self.max_workers = max_workers or int(os.getenv("LANE_WORKERS", "4"))
+        self.overrides = overrides if overrides is not None else \
+            parse_lane_overrides(os.getenv("LANE_WORKERS_OVERRIDES", ""))
+        self._lanes: Dict[Tuple[str, Optional[str]], ProviderLane] = {}
+        self._lock = threading.Lock()
+
+    def lane(self, provider: str, model: Optional[str]) -> ProviderLane:
+        key = (provider, model)
+        lane = self._lanes.get(key)
+        if lane is None:
+            with self._lock:
+                lane = self._lanes.get(key)
+                if lane is None:
+                    workers = self.overrides.get(key, self.max_workers)
+                    lane = ProviderLane(provider, model, self.factories[provider](model), workers)
+                    self._lanes[key] = lane
+        return lane
+
+    def lanes(self):
+        return list(self._lanes.values())
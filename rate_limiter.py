@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+"""
+Token-bucket rate limiting for AI providers and API clients.
+
+Each provider has two buckets, one for requests per minute (RPM) and one for
+tokens per minute (TPM), sized from its configured quota. Before a call we
+reserve one request and an estimated token count. If the buckets are short, the
+caller can wait briefly or route to another provider instead of running into a
+429 from the provider.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token for English text)"""
+    return max(1, len(text) // 4)
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at capacity per period"""
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self) -> float:
+        self._refill()
+        return self.tokens
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (requests larger than the bucket wait for a full one)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        """Take tokens; may go negative when actual usage exceeds the estimate"""
+        self._refill()
+        self.tokens -= amount
+
+    def drain(self) -> None:
+        self._refill()
+        self.tokens = min(self.tokens, 0)
+
+class ProviderQuota:
+    """RPM and TPM buckets for one provider (a limit of 0 means unlimited)"""
+
+    def __init__(self, rpm: float = 0, tpm: float = 0):
+        self.rpm = TokenBucket(rpm) if rpm else None
+        self.tpm = TokenBucket(tpm) if tpm else None
+
+    def wait_time(self, tokens: int) -> float:
+        waits = [0.0]
+        if self.rpm:
+            waits.append(self.rpm.wait_time(1))
+        if self.tpm:
+            waits.append(self.tpm.wait_time(tokens))
+        return max(waits)
+
+    def consume(self, tokens: int) -> None:
+        if self.rpm:
+            self.rpm.consume(1)
+        if self.tpm:
+            self.tpm.consume(tokens)
+
+    def snapshot(self) -> dict:
+        def bucket_info(bucket):
+            if not bucket:
+                return {"limit": None, "remaining": None}
+            return {"limit": int(bucket.capacity), "remaining": max(0, int(bucket.available()))}
+        return {"rpm": bucket_info(self.rpm), "tpm": bucket_info(self.tpm)}
+
+class RateLimiter:
+    """Quota tracking for every provider plus a request bucket per API client"""
+
+    def __init__(self, provider_quotas: Dict[str, Tuple[float, float]], client_rpm: float = 0,
+                 max_clients: int = 10000):
+        self.providers = {name: ProviderQuota(rpm, tpm) for name, (rpm, tpm) in provider_quotas.items()}
+        self.client_rpm = client_rpm
+        self.max_clients = max_clients
+        self._clients: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def reserve(self, provider: str, tokens: int) -> float:
+        """Reserve one request and `tokens` for provider.
+
+        Returns 0 when the reservation was made, otherwise the number of seconds
+        to wait before it could succeed (nothing is reserved in that case).
+        """
+        quota = self.providers.get(provider)
+        if not quota:
+            return 0.0
+        with self._lock:
+            wait = quota.wait_time(tokens)
+            if wait == 0:
+                quota.consume(tokens)
+            return wait
+
+    def record_usage(self, provider: str, estimated: int, actual: int) -> None:
+        """Correct the TPM bucket once the real token count is known"""
+        quota = self.providers.get(provider)
+        if quota and quota.tpm and actual != estimated:
+            with self._lock:
+                quota.tpm.consume(actual - estimated)
+
+    def penalize(self, provider: str) -> None:
+        """The provider said 429 anyway: treat its quota as used up until it refills"""
+        quota = self.providers.get(provider)
+        if quota:
+            with self._lock:
+                for bucket in (quota.rpm, quota.tpm):
+                    if bucket:
+                        bucket.drain()
+
+    def check_client(self, client_id: str, count: int = 1) -> float:
+        """Count `count` requests for client; returns 0 if allowed, else seconds until retry.
+
+        All or nothing. More requests than a minute's allowance are let through once
+        the bucket is full, leaving the client in debt until it refills.
+        """
+        if not self.client_rpm:
+            return 0.0
+        with self._lock:
+            bucket = self._clients.get(client_id)
+            if bucket is None:
+                bucket = TokenBucket(self.client_rpm)
+                self._clients[client_id] = bucket
+                if len(self._clients) > self.max_clients:
+                    self._clients.popitem(last=False)  # Forget the least recently seen client
+            else:
+                self._clients.move_to_end(client_id)
+
+            wait = bucket.wait_time(count)
+            if wait == 0:
+                bucket.consume(count)
+            return wait
+
+    def status(self, provider: str) -> Optional[dict]:
+        quota = self.providers.get(provider)
+        if not quota:
+            return None
+        with self._lock:
+            return quota.snapshot()
+
+def rate_limiter_from_env(providers, workers: int = 1, share: float = 1.0) -> RateLimiter:
+    """Read <PROVIDER>_RPM / <PROVIDER>_TPM and CLIENT_RPM, split evenly across worker processes.
+
+    share scales the provider quotas, to split them between limiters.
+    """
+    defaults = {"gemini": (15, 1000000), "openai": (500, 90000), "ollama": (0, 0)}
+    workers = max(1, workers)
+    quotas = {}
+    for name in providers:
+        default_rpm, default_tpm = defaults.get(name, (0, 0))
+        rpm = float(os.getenv(f"{name.upper()}_RPM", default_rpm)) * share / workers
+        tpm = float(os.getenv(f"{name.upper()}_TPM", default_tpm)) * share / workers
+        quotas[name] = (rpm, tpm)
+    client_rpm = float(os.getenv("CLIENT_RPM", "60")) / workers
+    return RateLimiter(quotas, client_rpm)
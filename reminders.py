@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+"""
+Reminder scheduler for the AI Assistant backend.
+
+All pending reminders sit in one indexed min-heap ordered by due time, so
+scheduling and cancelling are O(log n). A single timer thread sleeps until
+the earliest one is due. Reminders are stored in SQLite. Every write stamps
+the row with a new version number, so each worker process polls only the
+rows that changed and keeps its heap in step with the others.
+
+A reminder that fires while its session has no connected client is marked
+"due" and handed over the next time that session connects.
+
+Reminder states: pending → delivered | due → delivered, or cancelled
+"""
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+REMINDER_COLUMNS = ("id", "session_id", "message", "due_at", "status", "created_at", "delivered_at")
+
+class IndexedHeap:
+    """Binary min-heap of (due, id) that can also remove or reschedule any id in O(log n)"""
+
+    def __init__(self):
+        self._heap: List[List] = []
+        self._positions: Dict[int, int] = {}
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, item_id: int) -> bool:
+        return item_id in self._positions
+
+    def push(self, item_id: int, due: float) -> None:
+        if item_id in self._positions:
+            index = self._positions[item_id]
+            old_due = self._heap[index][0]
+            self._heap[index][0] = due
+            if due < old_due:
+                self._sift_up(index)
+            else:
+                self._sift_down(index)
+            return
+        self._heap.append([due, item_id])
+        self._positions[item_id] = len(self._heap) - 1
+        self._sift_up(len(self._heap) - 1)
+
+    def peek(self) -> Optional[Tuple[float, int]]:
+        return tuple(self._heap[0]) if self._heap else None
+
+    def pop(self) -> Tuple[float, int]:
+        due, item_id = self._heap[0]
+        self.remove(item_id)
+        return due, item_id
+
+    def remove(self, item_id: int) -> bool:
+        index = self._positions.pop(item_id, None)
+        if index is None:
+            return False
+        last = self._heap.pop()
+        if index < len(self._heap):
+            self._heap[index] = last
+            self._positions[last[1]] = index
+            self._sift_up(index)
+            self._sift_down(self._positions[last[1]])
+        return True
+
+    def _swap(self, i: int, j: int) -> None:
+        heap = self._heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self._positions[heap[i][1]] = i
+        self._positions[heap[j][1]] = j
+
+    def _sift_up(self, index: int) -> None:
+        heap = self._heap
+        while index > 0:
+            parent = (index - 1) >> 1
+            if heap[index] < heap[parent]:
+                self._swap(index, parent)
+                index = parent
+            else:
+                break
+
+    def _sift_down(self, index: int) -> None:
+        heap = self._heap
+        size = len(heap)
+        while True:
+            smallest = index
+            left = 2 * index + 1
+            if left < size and heap[left] < heap[smallest]:
+                smallest = left
+            if left + 1 < size and heap[left + 1] < heap[smallest]:
+                smallest = left + 1
+            if smallest == index:
+                return
+            self._swap(index, smallest)
+            index = smallest
+
+class ReminderStore:
+    """The reminders table"""
+
+    NEXT_VERSION = "(SELECT COALESCE(MAX(version), 0) + 1 FROM reminders)"
+
+    def __init__(self, path: str = "assistant_reminders.db"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL; skips an fsync per write
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS reminders ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, message TEXT NOT NULL, "
+            "due_at REAL NOT NULL, status TEXT NOT NULL, created_at REAL NOT NULL, delivered_at REAL, "
+            "version INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS reminders_version ON reminders (version)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS reminders_session ON reminders (session_id, status)")
+
+    def _row(self, row) -> Optional[dict]:
+        return dict(zip(REMINDER_COLUMNS, row)) if row else None
+
+    def add(self, session_id: str, message: str, due_at: float) -> dict:
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO reminders (session_id, message, due_at, status, created_at, version) "
+                f"VALUES (?, ?, ?, 'pending', ?, {self.NEXT_VERSION})",
+                (session_id, message, due_at, time.time()),
+            )
+        return self.get(cursor.lastrowid)
+
+    def add_many(self, reminders: Iterable[Tuple[str, str, float]]) -> int:
+        """Insert (session_id, message, due_at) rows in one transaction"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = self._conn.execute(f"SELECT {self.NEXT_VERSION}").fetchone()[0]
+                cursor = self._conn.executemany(
+                    "INSERT INTO reminders (session_id, message, due_at, status, created_at, version) "
+                    "VALUES (?, ?, ?, 'pending', ?, ?)",
+                    ((session_id, message, due_at, now, version + i)
+                     for i, (session_id, message, due_at) in enumerate(reminders)),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return cursor.rowcount
+
+    def get(self, reminder_id: int) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(REMINDER_COLUMNS)} FROM reminders WHERE id = ?", (reminder_id,)
+            ).fetchone()
+        return self._row(row)
+
+    def for_session(self, session_id: str, statuses: Tuple[str, ...] = ("pending", "due")) -> List[dict]:
+        marks = ", ".join("?" * len(statuses))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(REMINDER_COLUMNS)} FROM reminders "
+                f"WHERE session_id = ? AND status IN ({marks}) ORDER BY due_at",
+                (session_id, *statuses),
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def _transition(self, reminder_id: int, status: str, from_statuses: Tuple[str, ...],
+                    session_id: Optional[str] = None) -> bool:
+        marks = ", ".join("?" * len(from_statuses))
+        owner = " AND session_id = ?" if session_id is not None else ""
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE reminders SET status = ?, version = {self.NEXT_VERSION}, "
+                "delivered_at = CASE WHEN ? = 'delivered' THEN ? ELSE delivered_at END "
+                f"WHERE id = ? AND status IN ({marks}){owner}",
+                (status, status, time.time(), reminder_id, *from_statuses,
+                 *((session_id,) if session_id is not None else ())),
+            )
+        return cursor.rowcount == 1
+
+    def cancel(self, reminder_id: int, session_id: str) -> bool:
+        """Cancel a session's pending or undelivered reminder; False if it has no such reminder"""
+        return self._transition(reminder_id, "cancelled", ("pending", "due"), session_id)
+
+    def claim_delivery(self, reminder_id: int) -> bool:
+        """Mark delivered; False if someone else delivered (or cancelled) it first"""
+        return self._transition(reminder_id, "delivered", ("pending", "due"))
+
+    def mark_due(self, reminder_id: int) -> bool:
+        return self._transition(reminder_id, "due", ("pending",))
+
+    def changes(self, since_version: int, limit: int = 10000) -> List[Tuple[int, float, str, int]]:
+        """(id, due_at, status, version) of rows written after since_version"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, due_at, status, version FROM reminders WHERE version > ? ORDER BY version LIMIT ?",
+                (since_version, limit),
+            ).fetchall()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class ReminderScheduler:
+    """One timer thread delivering reminders from an IndexedHeap.
+
+    deliver(reminder) is called on the timer thread. It returns True if the
+    reminder reached a client, in which case it must have claimed it with
+    store.claim_delivery first. On False the reminder is kept as "due".
+    """
+
+    def __init__(self, store: ReminderStore, deliver: Callable[[dict], bool], poll_interval: float = 1.0):
+        self.store = store
+        self.deliver = deliver
+        self.poll_interval = poll_interval
+        self.heap = IndexedHeap()
+        self._version = 0
+        self._condition = threading.Condition()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+
+    def _sync(self) -> None:
+        """Apply reminders added, cancelled or delivered by any process since the last sync"""
+        while True:
+            rows = self.store.changes(self._version)
+            if not rows:
+                return
+            with self._condition:
+                for reminder_id, due_at, status, version in rows:
+                    if status == "pending":
+                        self.heap.push(reminder_id, due_at)
+                    else:
+                        self.heap.remove(reminder_id)
+                    self._version = max(self._version, version)
+                self._condition.notify()
+
+    def start(self) -> None:
+        self._sync()
+        self._thread = threading.Thread(target=self._run, name="reminders", daemon=True)
+        self._thread.start()
+        print(f"✅ Reminder scheduler started with {len(self.heap)} pending reminders")
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stop = True
+            self._condition.notify()
+        if self._thread:
+            self._thread.join(timeout=2)
+
+    def schedule(self, session_id: str, message: str, due_at: float) -> dict:
+        reminder = self.store.add(session_id, message, due_at)
+        with self._condition:
+            self.heap.push(reminder["id"], due_at)
+            if self.heap.peek()[1] == reminder["id"]:
+                self._condition.notify()  # New earliest reminder: re-arm the timer
+        return reminder
+
+    def cancel(self, reminder_id: int, session_id: str) -> bool:
+        cancelled = self.store.cancel(reminder_id, session_id)
+        if cancelled:
+            with self._condition:
+                self.heap.remove(reminder_id)
+        return cancelled
+
+    def _run(self) -> None:
+        next_sync = time.monotonic() + self.poll_interval
+        while True:
+            due = []
+            with self._condition:
+                if self._stop:
+                    return
+                now = time.time()
+                while self.heap and self.heap.peek()[0] <= now:
+                    due.append(self.heap.pop()[1])
+                if not due:
+                    earliest = self.heap.peek()
+                    wait = max(0.0, next_sync - time.monotonic())
+                    if earliest:
+                        wait = min(wait, earliest[0] - now)
+                    self._condition.wait(wait)
+
+            for reminder_id in due:
+                self._fire(reminder_id)
+            if time.monotonic() >= next_sync and not self._stop:
+                next_sync = time.monotonic() + self.poll_interval
+                try:
+                    self._sync()
+                except sqlite3.Error as e:
+                    print(f"⚠️  Reminder sync failed: {e}")
+
+    def _fire(self, reminder_id: int) -> None:
+        reminder = self.store.get(reminder_id)
+        if not reminder or reminder["status"] not in ("pending", "due"):
+            return  # Cancelled or already delivered by another process
+        try:
+            delivered = self.deliver(reminder)
+        except Exception as e:
+            print(f"❌ Reminder {reminder_id} delivery failed: {e}")
+            delivered = False
+        if not delivered:
+            self.store.mark_due(reminder_id)
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+"""
+Local document retrieval (RAG) for the AI Assistant.
+
+Files are split into overlapping chunks of words and indexed with BM25. The
+index is a set of flat NumPy arrays on disk, opened memory-mapped, so even a
+million chunks load instantly and only the pages a query touches are read:
+
+    vocab.json           term -> term id
+    postings_offsets.npy term id -> slice of the postings arrays (CSR layout)
+    postings_docs.npy    chunk ids, highest weight first within each term
+    postings_weights.npy precomputed BM25 weight of the term in that chunk
+    text_offsets.npy     chunk id -> byte range in texts.bin
+    texts.bin            chunk texts (UTF-8)
+    chunk_sources.npy    chunk id -> index into meta.json "sources"
+    meta.json            sizes, BM25 parameters and source file names
+
+Because each term's postings are ordered by weight, a query only reads the
+first max_postings of each list. Terms with very long lists are the common,
+low-weight ones, so the chunks that are cut off could not have made the top k
+anyway in practice, and query time stays flat as the index grows.
+
+Usage:
+    python retrieval.py ingest docs/ notes.md --index rag_index
+    python retrieval.py search "how do I reset my password" --index rag_index
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Very common words carry almost no BM25 weight but have the longest postings lists
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have i in is it its me my of on or so that the
+this to was we were what when which who will with you your
+""".split())
+
+TEXT_EXTENSIONS = (".txt", ".md", ".rst", ".py", ".json", ".csv", ".html", ".log")
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+def chunk_text(text: str, chunk_words: int = 200, overlap: int = 40) -> List[str]:
+    """Split text into chunks of about chunk_words words, each sharing overlap words with the previous one"""
+    words = text.split()
+    step = max(1, chunk_words - overlap)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + chunk_words]))
+        if start + chunk_words >= len(words):
+            break
+    return chunks
+
+def iter_files(paths: Iterable[str]) -> Iterable[str]:
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.lower().endswith(TEXT_EXTENSIONS):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+def write_index(index_dir: str, doc_ids: np.ndarray, term_ids: np.ndarray, vocab: Dict[str, int],
+                texts: List[bytes], chunk_sources: np.ndarray, sources: List[str],
+                k1: float = 1.5, b: float = 0.75) -> None:
+    """Write an index from parallel arrays of (chunk id, term id), one entry per token occurrence.
+
+    All the heavy lifting is vectorized, so this also serves synthetic corpora
+    of millions of chunks (see benchmarks/bench_retrieval.py). The files are
+    written to a scratch directory that then replaces index_dir, so a running
+    server keeps reading its old (memory-mapped) copy safely.
+    """
+    final_dir, index_dir = index_dir, index_dir.rstrip("/\\") + ".tmp"
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.makedirs(index_dir)
+    num_docs = len(texts)
+    num_terms = len(vocab)
+
+    # Term frequency of every (term, chunk) pair, ordered by term then chunk
+    keys = term_ids.astype(np.int64) * num_docs + doc_ids.astype(np.int64)
+    pairs, tf = np.unique(keys, return_counts=True)
+    terms, docs = np.divmod(pairs, num_docs)
+
+    doc_lengths = np.bincount(doc_ids, minlength=num_docs).astype(np.float32)
+    avg_length = float(doc_lengths.mean()) if num_docs else 0.0
+    doc_freq = np.bincount(terms, minlength=num_terms)
+    idf = np.log(1 + (num_docs - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+
+    tf = tf.astype(np.float32)
+    norm = k1 * (1 - b + b * doc_lengths[docs] / max(avg_length, 1e-9))
+    weights = idf[terms] * tf * (k1 + 1) / (tf + norm)
+
+    # Highest-weight postings first within each term
+    order = np.lexsort((-weights, terms))
+    docs, weights = docs[order], weights[order]
+
+    offsets = np.zeros(num_terms + 1, dtype=np.int64)
+    np.cumsum(doc_freq, out=offsets[1:])
+
+    text_offsets = np.zeros(num_docs + 1, dtype=np.int64)
+    np.cumsum([len(t) for t in texts], out=text_offsets[1:])
+    with open(os.path.join(index_dir, "texts.bin"), "wb") as f:
+        for text in texts:
+            f.write(text)
+
+    np.save(os.path.join(index_dir, "postings_offsets.npy"), offsets)
+    np.save(os.path.join(index_dir, "postings_docs.npy"), docs.astype(np.int32))
+    np.save(os.path.join(index_dir, "postings_weights.npy"), weights.astype(np.float32))
+    np.save(os.path.join(index_dir, "text_offsets.npy"), text_offsets)
+    np.save(os.path.join(index_dir, "chunk_sources.npy"), chunk_sources.astype(np.int32))
+    with open(os.path.join(index_dir, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f)
+    with open(os.path.join(index_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"chunks": num_docs, "terms": num_terms, "postings": int(len(docs)),
+                   "avg_length": avg_length, "k1": k1, "b": b, "sources": sources}, f)
+
+    old_dir = final_dir.rstrip("/\\") + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(final_dir):
+        os.rename(final_dir, old_dir)
+    os.rename(index_dir, final_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+def build_index(paths: Iterable[str], index_dir: str, chunk_words: int = 200, overlap: int = 40) -> dict:
+    """Chunk and index every text file under paths, replacing any index in index_dir"""
+    vocab: Dict[str, int] = {}
+    doc_ids, term_ids, texts, chunk_sources, sources = [], [], [], [], []
+    for path in iter_files(paths):
+        try:
+            with open(path, encoding="utf-8", errors="ignore") as f:
+                text = f.read()
+        except OSError as e:
+            print(f"⚠️  Skipping {path}: {e}")
+            continue
+        sources.append(path)
+        for chunk in chunk_text(text, chunk_words, overlap):
+            ids = [vocab.setdefault(token, len(vocab)) for token in tokenize(chunk)]
+            doc_ids.append(np.full(len(ids), len(texts), dtype=np.int32))
+            term_ids.append(np.asarray(ids, dtype=np.int32))
+            texts.append(chunk.encode("utf-8"))
+            chunk_sources.append(len(sources) - 1)
+
+    write_index(
+        index_dir,
+        np.concatenate(doc_ids) if doc_ids else np.zeros(0, dtype=np.int32),
+        np.concatenate(term_ids) if term_ids else np.zeros(0, dtype=np.int32),
+        vocab, texts, np.asarray(chunk_sources, dtype=np.int32), sources
+    )
+    return {"files": len(sources), "chunks": len(texts), "terms": len(vocab)}
+
+class Retriever:
+    """BM25 search over a memory-mapped index written by build_index"""
+
+    def __init__(self, index_dir: str, max_postings: Optional[int] = None):
+        self.index_dir = index_dir
+        self.max_postings = max_postings or int(os.getenv("RAG_MAX_POSTINGS", "20000"))
+        self._local = threading.local()
+        with open(os.path.join(index_dir, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(index_dir, "vocab.json"), encoding="utf-8") as f:
+            self.vocab: Dict[str, int] = json.load(f)
+
+        def load(name):
+            return np.load(os.path.join(index_dir, name), mmap_mode="r")
+
+        self.offsets = load("postings_offsets.npy")
+        self.docs = load("postings_docs.npy")
+        self.weights = load("postings_weights.npy")
+        self.text_offsets = load("text_offsets.npy")
+        self.chunk_sources = load("chunk_sources.npy")
+        self.texts = np.memmap(os.path.join(index_dir, "texts.bin"), dtype=np.uint8, mode="r") \
+            if self.text_offsets[-1] else np.zeros(0, dtype=np.uint8)
+        self.num_docs = self.meta["chunks"]
+
+    def __len__(self):
+        return self.num_docs
+
+    def _scores(self) -> np.ndarray:
+        """Per-thread score accumulator, all zeros between queries"""
+        scores = getattr(self._local, "scores", None)
+        if scores is None:
+            scores = self._local.scores = np.zeros(self.num_docs, dtype=np.float32)
+        return scores
+
+    def search_ids(self, query: str, k: int = 3):
+        """Top-k (chunk ids, scores), best first"""
+        term_ids = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+        if not term_ids or k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        spans = [(self.offsets[t], min(self.offsets[t + 1], self.offsets[t] + self.max_postings))
+                 for t in term_ids]
+        docs = np.concatenate([self.docs[start:end] for start, end in spans])
+        weights = np.concatenate([self.weights[start:end] for start, end in spans])
+
+        scores = self._scores()
+        np.add.at(scores, docs, weights)
+        totals = scores[docs]
+        scores[docs] = 0
+
+        # A chunk matching several terms appears several times in docs
+        limit = min(len(totals), k * len(term_ids))
+        top = np.argpartition(-totals, limit - 1)[:limit]
+        top = top[np.argsort(-totals[top], kind="stable")]
+        ids, first = np.unique(docs[top], return_index=True)
+        best = np.sort(first)[:k]
+        return docs[top][best].astype(np.int64), totals[top][best]
+
+    def text(self, chunk_id: int) -> str:
+        start, end = self.text_offsets[chunk_id], self.text_offsets[chunk_id + 1]
+        return bytes(self.texts[start:end]).decode("utf-8", errors="replace")
+
+    def search(self, query: str, k: int = 3, min_score: float = 0.0) -> List[dict]:
+        """Top-k passages as {"text", "source", "score"}"""
+        ids, scores = self.search_ids(query, k)
+        return [
+            {"text": self.text(i), "source": self.meta["sources"][self.chunk_sources[i]], "score": float(s)}
+            for i, s in zip(ids, scores) if s >= min_score
+        ]
+
+def load_retriever(index_dir: Optional[str] = None) -> Optional[Retriever]:
+    """Open the index in RAG_INDEX_DIR (default rag_index) if one has been built"""
+    index_dir = index_dir or os.getenv("RAG_INDEX_DIR", "rag_index")
+    if not os.path.exists(os.path.join(index_dir, "meta.json")):
+        return None
+    try:
+        retriever = Retriever(index_dir)
+        print(f"✅ Loaded document index: {len(retriever)} chunks from {index_dir}")
+        return retriever
+    except Exception as e:
+        print(f"❌ Could not load document index {index_dir}: {e}")
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the local document index")
+    parser.add_argument("--index", default=os.getenv("RAG_INDEX_DIR", "rag_index"), help="Index directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", help="Index files and directories (replaces the index)")
+    ingest.add_argument("paths", nargs="+")
+    ingest.add_argument("--chunk-words", type=int, default=200)
+    ingest.add_argument("--overlap", type=int, default=40)
+
+    search = commands.add_parser("search", help="Show the best passages for a query")
+    search.add_argument("query")
+    search.add_argument("-k", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        started = time.perf_counter()
+        stats = build_index(args.paths, args.index, args.chunk_words, args.overlap)
+        print(f"✅ Indexed {stats['chunks']} chunks from {stats['files']} files "
+              f"({stats['terms']} terms) in {time.perf_counter() - started:.1f}s")
+    else:
+        retriever = load_retriever(args.index)
+        if retriever is None:
+            print(f"❌ No index in {args.index}, run: python retrieval.py ingest <paths>")
+            return
+        started = time.perf_counter()
+        results = retriever.search(args.query, args.k)
+        print(f"🔍 {len(results)} results in {(time.perf_counter() - started) * 1000:.2f} ms")
+        for result in results:
+            print(f"\n[{result['score']:.2f}] {result['source']}\n{result['text'][:300]}")
+
+if __name__ == "__main__":
+    main()
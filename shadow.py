@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+"""
+Shadow traffic: compare a candidate provider/model against live /chat traffic.
+
+A fraction of /chat requests (SHADOW_FRACTION) is sent again, in the
+background and after the user has their answer, to the candidate model
+(SHADOW_CANDIDATE, e.g. "ollama/llama3.2"). Each pair is stored as one row in
+SQLite (SHADOW_DB_PATH) with both sides' latency, estimated token counts and
+outcome, plus how much the two answers' wording overlaps. Rows hold no
+message text, only its length and a hash.
+
+    python shadow.py summary --hours 24
+    python shadow.py export --format csv -o shadow.csv
+"""
+import argparse
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from rate_limiter import estimate_tokens
+
+SHADOW_COLUMNS = ("id", "created_at", "message_hash", "message_chars", "prompt_tokens",
+                  "primary_label", "primary_ok", "primary_ms", "primary_answer_tokens",
+                  "candidate_label", "candidate_ok", "candidate_ms", "candidate_answer_tokens",
+                  "candidate_error", "overlap")
+
+# Answers from these mean every real provider failed
+FALLBACK_LABELS = ("Rule-based Fallback", "Error Fallback")
+
+WORD = re.compile(r"\w+")
+
+def word_overlap(a: str, b: str) -> float:
+    """Jaccard similarity of the two texts' word sets (1.0 = same words)"""
+    words_a, words_b = set(WORD.findall(a.lower())), set(WORD.findall(b.lower()))
+    if not words_a and not words_b:
+        return 1.0
+    return len(words_a & words_b) / len(words_a | words_b)
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+class ShadowStore:
+    """The shadow_runs table"""
+
+    def __init__(self, path: str = "assistant_shadow.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS shadow_runs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL, "
+            "message_hash TEXT NOT NULL, message_chars INTEGER NOT NULL, prompt_tokens INTEGER NOT NULL, "
+            "primary_label TEXT NOT NULL, primary_ok INTEGER NOT NULL, primary_ms REAL NOT NULL, "
+            "primary_answer_tokens INTEGER NOT NULL, "
+            "candidate_label TEXT NOT NULL, candidate_ok INTEGER NOT NULL, candidate_ms REAL NOT NULL, "
+            "candidate_answer_tokens INTEGER NOT NULL, candidate_error TEXT, overlap REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS shadow_runs_time ON shadow_runs (created_at)")
+
+    def record(self, run: dict) -> None:
+        columns = [c for c in SHADOW_COLUMNS if c != "id"]
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO shadow_runs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [run.get(c) for c in columns],
+            )
+
+    def rows(self, since: Optional[float] = None, until: Optional[float] = None) -> Iterator[dict]:
+        """Runs in time order, optionally between two Unix times"""
+        query = f"SELECT {', '.join(SHADOW_COLUMNS)} FROM shadow_runs WHERE created_at >= ? AND created_at < ? ORDER BY id"
+        with self._lock:
+            rows = self._conn.execute(query, (since or 0, until or float("inf"))).fetchall()
+        for row in rows:
+            run = dict(zip(SHADOW_COLUMNS, row))
+            run["primary_ok"], run["candidate_ok"] = bool(run["primary_ok"]), bool(run["candidate_ok"])
+            yield run
+
+    def summary(self, since: Optional[float] = None) -> dict:
+        """Latency, token and failure figures for each side, per model"""
+        sides: Dict[Tuple[str, str], dict] = {}
+        pairs = both_ok = candidate_faster = 0
+        overlaps = []
+        for run in self.rows(since):
+            pairs += 1
+            for side in ("primary", "candidate"):
+                figures = sides.setdefault((side, run[f"{side}_label"]), {"ms": [], "answer_tokens": [], "runs": 0, "failures": 0})
+                figures["runs"] += 1
+                if run[f"{side}_ok"]:
+                    figures["ms"].append(run[f"{side}_ms"])
+                    figures["answer_tokens"].append(run[f"{side}_answer_tokens"])
+                else:
+                    figures["failures"] += 1
+            if run["primary_ok"] and run["candidate_ok"]:
+                both_ok += 1
+                candidate_faster += run["candidate_ms"] < run["primary_ms"]
+                overlaps.append(run["overlap"])
+
+        models = []
+        for (side, label), figures in sorted(sides.items()):
+            ms, tokens = figures["ms"], figures["answer_tokens"]
+            models.append({
+                "side": side,
+                "model": label,
+                "runs": figures["runs"],
+                "failure_rate": round(figures["failures"] / figures["runs"], 4),
+                "latency_ms": {"mean": round(sum(ms) / len(ms), 1) if ms else None,
+                               "p50": percentile(ms, 50), "p95": percentile(ms, 95)},
+                "mean_answer_tokens": round(sum(tokens) / len(tokens), 1) if tokens else None,
+                "answer_tokens_per_s": round(sum(tokens) / (sum(ms) / 1000), 1) if ms and sum(ms) else None,
+            })
+        return {
+            "pairs": pairs,
+            "both_ok": both_ok,
+            "candidate_faster": round(candidate_faster / both_ok, 4) if both_ok else None,
+            "mean_overlap": round(sum(overlaps) / len(overlaps), 4) if overlaps else None,
+            "models": models,
+        }
+
+    def export(self, out, fmt: str = "csv", since: Optional[float] = None) -> int:
+        """Write runs to a text file object as CSV or JSON lines; returns the row count"""
+        count = 0
+        if fmt == "csv":
+            writer = csv.DictWriter(out, fieldnames=SHADOW_COLUMNS)
+            writer.writeheader()
+        for run in self.rows(since):
+            if fmt == "csv":
+                writer.writerow(run)
+            else:
+                out.write(json.dumps(run) + "\n")
+            count += 1
+        return count
+
+    def export_text(self, fmt: str = "csv", since: Optional[float] = None) -> str:
+        out = io.StringIO()
+        self.export(out, fmt, since)
+        return out.getvalue()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class ShadowMirror:
+    """Sends sampled requests to the candidate model in the background and records both sides.
+
+    ask(provider, model, messages, timeout) is the provider call; it returns
+    the answer, or None if the model failed or ran out of time.
+    """
+
+    def __init__(self, store: ShadowStore, candidate: Tuple[str, str],
+                 ask: Callable[[str, str, list, float], Awaitable[Optional[str]]],
+                 label: str, fraction: float, max_in_flight: int = 2, timeout: float = 60):
+        self.store = store
+        self.candidate = candidate
+        self.ask = ask
+        self.label = label
+        self.fraction = fraction
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.in_flight = 0
+        self._tasks = set()
+        self.stats = {"sampled": 0, "skipped_busy": 0, "skipped_same_model": 0, "recorded": 0,
+                      "candidate_failures": 0}
+
+    def should_mirror(self) -> bool:
+        """Decide, before the request runs, whether it is sampled.
+
+        A sampled request holds one of the max_in_flight slots from now on: pass
+        it to mirror(), or give the slot back with release() if it is not answered.
+        """
+        if random.random() >= self.fraction:
+            return False
+        if self.in_flight >= self.max_in_flight:
+            self.stats["skipped_busy"] += 1  # Shadow calls must never pile up behind a slow candidate
+            return False
+        self.in_flight += 1
+        self.stats["sampled"] += 1
+        return True
+
+    def release(self) -> None:
+        """Give back the slot of a sampled request that will not be mirrored"""
+        self.in_flight -= 1
+
+    def mirror(self, message: str, build_messages: Callable[[], list], result: dict, elapsed: float) -> None:
+        """Start the candidate call for an answered request.
+
+        build_messages() gives the provider messages (called in the background);
+        result and elapsed (seconds) are the user's answer and how long it took.
+        """
+        if result["provider"].startswith(self.label):
+            self.stats["skipped_same_model"] += 1
+            self.release()
+            return
+        task = asyncio.get_running_loop().create_task(self._run(message, build_messages, result, elapsed))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, message: str, build_messages: Callable[[], list], result: dict, elapsed: float) -> None:
+        try:
+            messages = build_messages()
+            provider, model = self.candidate
+            started = time.perf_counter()
+            error = None
+            try:
+                answer = await self.ask(provider, model, messages, self.timeout)
+            except Exception as e:
+                answer, error = None, str(e)[:200]
+            candidate_ms = (time.perf_counter() - started) * 1000
+            if answer is None:
+                self.stats["candidate_failures"] += 1
+                error = error or ("timeout" if candidate_ms >= self.timeout * 1000 else "failed")
+
+            primary_ok = not result["provider"].startswith(FALLBACK_LABELS)
+            run = {
+                "created_at": time.time(),
+                "message_hash": hashlib.blake2b(message.encode("utf-8"), digest_size=8).hexdigest(),
+                "message_chars": len(message),
+                "prompt_tokens": sum(estimate_tokens(m["content"]) for m in messages),
+                "primary_label": result["provider"],
+                "primary_ok": int(primary_ok),
+                "primary_ms": round(elapsed * 1000, 1),
+                "primary_answer_tokens": estimate_tokens(result["answer"]),
+                "candidate_label": self.label,
+                "candidate_ok": int(answer is not None),
+                "candidate_ms": round(candidate_ms, 1),
+                "candidate_answer_tokens": estimate_tokens(answer) if answer else 0,
+                "candidate_error": error,
+                "overlap": round(word_overlap(result["answer"], answer), 4) if answer and primary_ok else None,
+            }
+            await asyncio.get_running_loop().run_in_executor(None, self.store.record, run)
+            self.stats["recorded"] += 1
+        except Exception as e:
+            print(f"⚠️  Shadow run failed: {e}")
+        finally:
+            self.release()
+
+    async def close(self) -> None:
+        """Wait briefly for running shadow calls, then drop them"""
+        if self._tasks:
+            _, pending = await asyncio.wait(list(self._tasks), timeout=5)
+            for task in pending:
+                task.cancel()
+        self.store.close()
+
+    def metrics(self) -> dict:
+        return dict(self.stats, candidate=self.label, fraction=self.fraction, in_flight=self.in_flight)
+
+def shadow_from_env(ask, label_for: Callable[[str, str], str]) -> Optional[ShadowMirror]:
+    """ShadowMirror from SHADOW_* settings, or None when shadowing is off"""
+    from cascade import parse_model_ref
+    fraction = float(os.getenv("SHADOW_FRACTION", "0"))
+    candidate = parse_model_ref(os.getenv("SHADOW_CANDIDATE"))
+    if fraction <= 0:
+        return None
+    if not candidate:
+        print("⚠️  SHADOW_FRACTION is set but SHADOW_CANDIDATE is not (provider/model), shadow mode off")
+        return None
+    label = label_for(*candidate)
+    print(f"🔍 Shadow mode: {fraction:.0%} of /chat traffic also goes to {label}")
+    return ShadowMirror(
+        ShadowStore(os.getenv("SHADOW_DB_PATH", "assistant_shadow.db")),
+        candidate, ask, label,
+        fraction=min(fraction, 1.0),
+        max_in_flight=int(os.getenv("SHADOW_MAX_IN_FLIGHT", "2")),
+        timeout=float(os.getenv("SHADOW_TIMEOUT", "60")),
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Query or export shadow traffic results")
+    parser.add_argument("--db", default=os.getenv("SHADOW_DB_PATH", "assistant_shadow.db"))
+    commands = parser.add_subparsers(dest="command", required=True)
+    summary = commands.add_parser("summary", help="Per-model latency, tokens and failure rate")
+    summary.add_argument("--hours", type=float, default=None, help="Only the last N hours")
+    export = commands.add_parser("export", help="Write every run as CSV or JSON lines")
+    export.add_argument("--format", choices=("csv", "jsonl"), default="csv")
+    export.add_argument("--hours", type=float, default=None)
+    export.add_argument("-o", "--output", default=None, help="File to write (default: stdout)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"❌ No shadow results at {args.db}")
+        sys.exit(1)
+    store = ShadowStore(args.db)
+    since = time.time() - args.hours * 3600 if args.hours else None
+    if args.command == "summary":
+        print(json.dumps(store.summary(since), indent=2))
+    else:
+        with (open(args.output, "w", newline="") if args.output else sys.stdout) as out:
+            count = store.export(out, args.format, since)
+        if args.output:
+            print(f"✅ Wrote {count} runs to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""
+Shared routing state for the AI Assistant backend.
+
+Settings such as the selected provider and the active Ollama model have to be the
+same in every worker process when the server runs with `uvicorn --workers N`.
+They live in a small key/value store: SQLite by default (one file shared by all
+workers on the machine), or an in-process dict for single-worker setups.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+class StateStore:
+    """Key/value store with change notification"""
+
+    def __init__(self):
+        self._subscribers: List[Callable[[str, Any], None]] = []
+
+    def get(self, key: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any) -> None:
+        raise NotImplementedError
+
+    def subscribe(self, callback: Callable[[str, Any], None]) -> None:
+        """Call callback(key, value) whenever a key changes, in this or another process"""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[str, Any], None]) -> None:
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def _notify(self, key: str, value: Any) -> None:
+        for callback in self._subscribers:
+            try:
+                callback(key, value)
+            except Exception as e:
+                print(f"⚠️  State subscriber error for '{key}': {e}")
+
+    def close(self) -> None:
+        pass
+
+class LocalStateStore(StateStore):
+    """In-process stand-in, only consistent within a single worker"""
+
+    def __init__(self):
+        super().__init__()
+        self._values: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._values.get(key, default)
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            changed = self._values.get(key) != value
+            self._values[key] = value
+        if changed:
+            self._notify(key, value)
+
+class SQLiteStateStore(StateStore):
+    """State shared between processes through a SQLite file.
+
+    Reads are served from an in-memory copy. SQLite's `data_version` pragma tells
+    us cheaply whether another process has committed since we last looked, so the
+    copy is only updated when something actually changed. A background thread
+    does the same check periodically so subscribers hear about changes even when
+    no requests are arriving.
+    """
+
+    def __init__(self, path: str = "assistant_state.db", check_interval: float = 0.05,
+                 poll_interval: float = 0.5):
+        super().__init__()
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, version INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(state)")]
+        if "version" not in columns:
+            self._conn.execute("ALTER TABLE state ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS state_version ON state (version)")
+
+        self._cache: Dict[str, Any] = {}
+        self._max_version = -1
+        self._data_version = None
+        self._last_check = 0.0
+        self._refresh(force=True)
+
+        self._stop = threading.Event()
+        self._poller = threading.Thread(target=self._poll, args=(poll_interval,), daemon=True)
+        self._poller.start()
+
+    def _refresh(self, force: bool = False) -> None:
+        """Pull in rows another connection has written since the last check.
+
+        Every write stamps its row with a new version number, so a refresh only
+        reads the rows that changed, however many sessions the table holds.
+        """
+        changes = []
+        with self._lock:
+            self._last_check = time.monotonic()
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if not force and version == self._data_version:
+                return
+            self._data_version = version
+            rows = self._conn.execute(
+                "SELECT key, value, version FROM state WHERE version > ?", (self._max_version,)
+            ).fetchall()
+            for key, value, row_version in rows:
+                value = json.loads(value)
+                self._max_version = max(self._max_version, row_version)
+                if self._cache.get(key) != value:
+                    self._cache[key] = value
+                    changes.append((key, value))
+
+        if not force:
+            for key, value in changes:
+                self._notify(key, value)
+
+    def _poll(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                self._refresh()
+            except sqlite3.Error as e:
+                print(f"⚠️  State store poll failed: {e}")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if time.monotonic() - self._last_check >= self.check_interval:
+            self._refresh()
+        return self._cache.get(key, default)
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO state (key, value, version) "
+                "VALUES (?, ?, (SELECT COALESCE(MAX(version), 0) + 1 FROM state)) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, version = excluded.version",
+                (key, json.dumps(value)),
+            )
+            changed = self._cache.get(key) != value
+            self._cache[key] = value
+        if changed:
+            self._notify(key, value)
+
+    def close(self) -> None:
+        self._stop.set()
+        with self._lock:
+            self._conn.close()
+
+def create_state_store(backend: Optional[str] = None) -> StateStore:
+    """Build the store selected by STATE_BACKEND ("sqlite" or "local")"""
+    backend = (backend or os.getenv("STATE_BACKEND", "sqlite")).lower()
+    if backend == "local":
+        return LocalStateStore()
+    if backend == "sqlite":
+        path = os.getenv("STATE_DB_PATH", "assistant_state.db")
+        try:
+            return SQLiteStateStore(path)
+        except sqlite3.Error as e:
+            print(f"⚠️  Cannot open state database {path}: {e}. Using local state")
+            return LocalStateStore()
+    raise ValueError(f"Unknown STATE_BACKEND: {backend}")
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+In-flight request coalescing ("single-flight") for the chat backend.
+
+When identical requests arrive while one is already being answered, the later
+ones wait for that answer instead of calling the providers again. Followers also
+receive the leader's streamed events, including the ones sent before they joined.
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import re
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+Events = Callable[[dict], None]
+
+def request_key(message: str, context: dict, provider: Optional[str], model: Optional[str],
+                session: Optional[str] = None) -> str:
+    """Hash of everything that determines the answer, with the message normalized.
+
+    session keeps requests from different conversations apart, for providers
+    that record each turn in a per-conversation session.
+    """
+    normalized = re.sub(r"\s+", " ", message).strip().lower()
+    payload = json.dumps([normalized, context, provider, model, session], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class _Flight:
+    """One in-progress call and everyone waiting on it"""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        self.events: List[dict] = []
+        self.listeners: List[Events] = []
+        self.lock = threading.Lock()  # Events are broadcast from provider worker threads
+
+    def broadcast(self, event: dict) -> None:
+        with self.lock:
+            self.events.append(event)
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener(event)
+
+    def listen(self, events: Events) -> None:
+        with self.lock:
+            backlog = list(self.events)
+            self.listeners.append(events)
+        for event in backlog:
+            events(event)
+
+class SingleFlight:
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.stats = {"leaders": 0, "coalesced": 0}
+
+    async def do(self, key: str, fn: Callable[[Events], Awaitable[Any]],
+                 events: Optional[Events] = None) -> Any:
+        """Run fn(broadcast) once per key; concurrent callers with the same key share its result.
+
+        The call runs as its own task. It keeps going while anyone is still
+        waiting, and is cancelled once every caller has given up.
+        """
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.ensure_future(fn(flight.broadcast))
+            flight.task.add_done_callback(lambda _: self._flights.pop(key, None))
+            self.stats["leaders"] += 1
+        else:
+            self.stats["coalesced"] += 1
+
+        if events:
+            flight.listen(events)
+        flight.waiters += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.task.cancelled():
+                raise
+            # This caller went away; stop the work if nobody else wants it
+            flight.waiters -= 1
+            if flight.waiters == 0:
+                flight.task.cancel()
+            raise
+        flight.waiters -= 1
+        # Followers get their own copy so nobody mutates a shared context dict
+        return result if leader else copy.deepcopy(result)
+
+    def metrics(self) -> dict:
+        total = self.stats["leaders"] + self.stats["coalesced"]
+        return {
+            **self.stats,
+            "in_flight": len(self._flights),
+            "coalesced_ratio": round(self.stats["coalesced"] / total, 4) if total else 0.0,
+        }
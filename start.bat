@@ -33,6 +33,15 @@ if not exist ".env" (
     echo Create .env file with your API keys for full functionality
 )
 
+REM start.bat --embedded runs the backend inside the GUI process (no server)
+if "%1"=="--embedded" (
+    echo ✅ Starting GUI with embedded backend...
+    python modern_gui.py --embedded
+    echo 👋 Professional AI Assistant stopped.
+    pause
+    exit /b 0
+)
+
 echo ✅ Starting backend server...
 REM Start backend in background
 start "AI Assistant Backend" python main.py
@@ -39,6 +39,14 @@ if [ ! -f ".env" ]; then
     echo "Create .env file with your API keys for full functionality"
 fi
 
+# ./start.sh --embedded runs the backend inside the GUI process (no server)
+if [ "$1" == "--embedded" ]; then
+    echo "✅ Starting GUI with embedded backend..."
+    python modern_gui.py --embedded
+    echo "👋 Professional AI Assistant stopped."
+    exit 0
+fi
+
 echo "✅ Starting backend server..."
 # Start backend in background
 python main.py &
@@ -0,0 +1,90 @@
+import admission
+from admission import AdaptiveLimit
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def make_limit(monkeypatch, **kwargs):
+    clock = FakeClock()
+    monkeypatch.setattr(admission.time, "monotonic", clock)
+    return AdaptiveLimit(**kwargs), clock
+
+def finish(limit, clock, ms, **kwargs):
+    ticket = limit.try_acquire()
+    assert ticket is not None
+    clock.now += ms / 1000
+    limit.release(ticket, **kwargs)
+
+def test_rejects_over_the_limit(monkeypatch):
+    limit, _ = make_limit(monkeypatch, initial=2, min_limit=1)
+    tickets = [limit.try_acquire(), limit.try_acquire()]
+    assert all(tickets) and limit.saturated
+    assert limit.try_acquire() is None
+    limit.release(tickets[0])
+    assert limit.try_acquire() is not None
+    assert limit.stats["rejected"] == 1
+
+def test_latency_over_tolerance_shrinks_the_limit(monkeypatch):
+    limit, clock = make_limit(monkeypatch, initial=10, min_limit=4, warmup=5)
+    for _ in range(10):
+        finish(limit, clock, 100)
+    assert limit.limit == 10
+    for _ in range(20):
+        finish(limit, clock, 1000)
+    assert limit.limit < 10
+    assert limit.stats["decreases"] >= 1
+
+def test_shrinks_at_most_once_per_recent_duration(monkeypatch):
+    limit, clock = make_limit(monkeypatch, initial=10, warmup=1, decrease=0.5)
+    finish(limit, clock, 100)
+    tickets = [limit.try_acquire() for _ in range(3)]
+    clock.now += 0.2
+    for ticket in tickets:
+        limit.release(ticket, timed_out=True)  # Three timeouts at once
+    assert limit.limit == 5  # One decrease, not three
+
+def test_never_below_min(monkeypatch):
+    limit, clock = make_limit(monkeypatch, initial=8, min_limit=4, warmup=1, decrease=0.5)
+    for _ in range(10):
+        finish(limit, clock, 100, timed_out=True)
+        clock.now += 10
+    assert limit.limit == 4
+
+def test_grows_only_when_in_use(monkeypatch):
+    limit, clock = make_limit(monkeypatch, initial=4, min_limit=1, warmup=1)
+    for _ in range(10):
+        finish(limit, clock, 100)  # One at a time: under half the limit
+    assert limit.limit == 4
+    for _ in range(10):
+        tickets = [limit.try_acquire() for _ in range(int(limit.limit))]
+        clock.now += 0.1
+        for ticket in tickets:
+            limit.release(ticket)
+    assert limit.limit > 4
+
+def test_event_loop_lag_counts_as_overload(monkeypatch):
+    lag = [0.0]
+    limit, clock = make_limit(monkeypatch, initial=10, warmup=1, lag=lambda: lag[0])
+    finish(limit, clock, 100)
+    lag[0] = 500
+    finish(limit, clock, 100)
+    assert limit.stats["overloaded_samples"] == 1
+    assert limit.limit < 10
+
+def test_unsampled_release_leaves_the_limit(monkeypatch):
+    limit, clock = make_limit(monkeypatch, initial=10, warmup=1)
+    finish(limit, clock, 100)
+    finish(limit, clock, 100_000, sample=False)
+    assert (limit.limit, limit.in_flight, round(limit.recent_ms)) == (10, 0, 100)
+
+def test_waiting_caller_is_not_counted_as_rejected(monkeypatch):
+    limit, _ = make_limit(monkeypatch, initial=1, min_limit=1)
+    ticket = limit.try_acquire()
+    assert limit.try_acquire(count_rejection=False) is None
+    assert limit.stats["rejected"] == 0
+    limit.release(ticket)
+    assert limit.try_acquire(count_rejection=False) is not None
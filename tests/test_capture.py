@@ -0,0 +1,77 @@
+import asyncio
+import json
+
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.testclient import TestClient
+
+from capture import CaptureMiddleware, ks_distance
+
+def test_ks_distance_same_samples():
+    assert ks_distance([1, 1, 2, 2], [1, 1, 2, 2]) == 0.0
+    assert ks_distance([5.0] * 10, [5.0] * 3) == 0.0
+
+def test_ks_distance_with_ties():
+    # CDFs at 1: 0.5 vs 0.25; at 2: 1.0 vs 1.0
+    assert ks_distance([1, 1, 2, 2], [1, 2, 2, 2]) == 0.25
+
+def test_ks_distance_disjoint():
+    assert ks_distance([1, 2, 3], [4, 5]) == 1.0
+    assert ks_distance([4, 5], [1, 2, 3]) == 1.0
+
+class ListWriter:
+    def __init__(self):
+        self.records = []
+
+    def write(self, record):
+        self.records.append(record() if callable(record) else record)
+
+def ws_app():
+    app = FastAPI()
+
+    @app.websocket("/ws")
+    async def ws(websocket: WebSocket):
+        await websocket.accept()
+        await websocket.send_json({"type": "ready", "session_id": "s1"})
+        while True:
+            try:
+                data = await websocket.receive_json()
+            except WebSocketDisconnect:
+                return
+            if data["type"] != "message":
+                continue
+            if data["message"] == "slow down":
+                await websocket.send_json({"type": "error", "error": "Rate limit exceeded", "retry_after": 1})
+                continue
+            if data["message"] == "busy":
+                await websocket.send_json({"type": "error", "error": "Server busy", "id": data.get("id")})
+                continue
+            await websocket.send_json({"type": "delta", "text": "he", "id": data.get("id")})
+            await asyncio.sleep(0.01)
+            await websocket.send_json({"type": "done", "answer": "hello", "provider": "Stub", "id": data.get("id")})
+
+    return app
+
+def test_ws_turns_are_captured_as_chat_requests():
+    writer = ListWriter()
+    app = ws_app()
+    app.add_middleware(CaptureMiddleware, writer=writer)
+    with TestClient(app) as client, client.websocket_connect("/ws") as websocket:
+        assert websocket.receive_json()["type"] == "ready"
+        websocket.send_json({"type": "message", "message": "hi", "id": 7, "model": "m", "timeout": 5})
+        assert websocket.receive_json()["type"] == "delta"
+        assert websocket.receive_json()["type"] == "done"
+        websocket.send_json({"type": "message", "message": "slow down"})
+        assert websocket.receive_json()["type"] == "error"
+        websocket.send_json({"type": "message", "message": "busy"})
+        assert websocket.receive_json()["type"] == "error"
+        websocket.send_json({"type": "ping"})
+
+    done, limited, busy = writer.records
+    assert done["path"] == "/chat" and done["via"] == "ws" and done["status"] == 200
+    assert done["request"] == {"message": "hi", "model": "m", "session_id": "s1"}
+    assert done["headers"] == {"x-request-timeout": "5"}
+    assert (done["provider"], done["answer"]) == ("Stub", "hello")
+    assert done["ttfb_ms"] is not None and done["ms"] >= done["ttfb_ms"]
+    assert (limited["status"], limited["request"]["message"]) == (429, "slow down")
+    assert (busy["status"], busy["request"]["message"]) == (503, "busy")
+    json.dumps(writer.records)  # Records stay JSON-serializable
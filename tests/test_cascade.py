@@ -0,0 +1,59 @@
+from cascade import (Cascade, answer_confidence, classify, complexity_score, is_code_request,
+                     parse_model_ref)
+
+SMALL = ("ollama", "llama3.2:1b")
+LARGE = ("ollama", "gpt-oss:20b")
+
+def test_code_requests():
+    assert is_code_request("Write a Python function to reverse a list")
+    assert is_code_request("```\nprint(1)\n```")
+    assert is_code_request("fix this: def add(a, b):")
+    # Keywords only count at the start of a word
+    assert not is_code_request("Can you decode this riddle?")
+    assert not is_code_request("Give me a description of Paris")
+
+def test_chitchat_is_simple():
+    assert complexity_score("Hello!") == 0.0
+    assert classify("thanks") == ("simple", 0.0)
+    assert classify("What is the capital of France?")[0] == "simple"
+
+def test_reasoning_is_complex():
+    tier, score = classify("Compare the pros and cons of SQL and NoSQL databases and explain when to use each")
+    assert tier == "code"  # "sql" is a code keyword
+    tier, score = classify("Explain why the sky is blue, step by step")
+    assert tier == "complex" and score >= 0.3
+
+def test_code_tier_score_is_at_least_the_threshold():
+    assert classify("write a script", threshold=0.4) == ("code", 0.4)
+
+def test_answer_confidence():
+    assert answer_confidence("q", "") == 0.0
+    assert answer_confidence("What is 2 + 2?", "4.") == 1.0
+    assert answer_confidence("q", "I'm not sure, I don't know.") < 0.5
+    long_question = "Can you tell me in some detail how photosynthesis works in plants?"
+    assert answer_confidence(long_question, "Sunlight.") < 1.0
+    cut_off = " ".join(["word"] * 30)
+    assert answer_confidence("q", cut_off) < 1.0
+    looping = "the cat sat " * 20 + "."
+    assert answer_confidence("q", looping) < 0.7
+
+def test_parse_model_ref():
+    assert parse_model_ref("ollama/llama3.2:1b") == SMALL
+    assert parse_model_ref("Gemini/gemini-1.5-pro") == ("gemini", "gemini-1.5-pro")
+    assert parse_model_ref("llama3.2") is None
+    assert parse_model_ref(None) is None
+
+def test_plan_and_escalation():
+    cascade = Cascade(SMALL, LARGE)
+    simple = cascade.plan("hi")
+    assert simple.models == [SMALL, LARGE] and simple.small == SMALL
+    assert cascade.should_escalate(simple, SMALL, "hi", "")
+    assert not cascade.should_escalate(simple, SMALL, "hi", "Hello! How can I help?")
+    assert not cascade.should_escalate(simple, LARGE, "hi", "")  # Only the small model's answers
+
+    code = cascade.plan("write a python function")
+    assert code.models == [LARGE] and code.small is None
+
+    metrics = cascade.metrics()
+    assert (metrics["simple"], metrics["code"], metrics["escalated"]) == (1, 1, 1)
+    assert metrics["escalation_ratio"] == 1.0
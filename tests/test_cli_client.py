@@ -0,0 +1,56 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from cli_client import BulkChatClient
+
+@pytest.fixture
+def backend():
+    """A /chat server answering from a list of (status, headers, body), then the last one forever"""
+    replies = []
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            calls.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            status, headers, body = replies.pop(0) if len(replies) > 1 else replies[0]
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", replies, calls
+    server.shutdown()
+
+def test_provider_answer_is_ok(backend):
+    url, replies, calls = backend
+    replies.append((200, {}, {"answer": "Paris", "provider": "Ollama (llama3.2)"}))
+    record = BulkChatClient(url, retries=0).send("1", {"message": "capital of France?"})
+    assert (record["status"], record["answer"]) == ("ok", "Paris")
+
+@pytest.mark.parametrize("provider", ["Rule-based Fallback", "Rule-based Fallback (busy)", "Error Fallback"])
+def test_fallback_answers_are_failures(backend, provider):
+    url, replies, calls = backend
+    replies.append((200, {}, {"answer": "Hi there!", "provider": provider}))
+    record = BulkChatClient(url, retries=1).send("1", {"message": "hi"})
+    assert record["status"] == "error"
+    assert len(calls) == 2  # Retried once
+
+def test_busy_backend_is_waited_out(backend):
+    url, replies, calls = backend
+    replies.extend([(503, {"Retry-After": "0"}, {"error": "busy"}),
+                    (200, {"X-Degraded": "1", "Retry-After": "0"}, {"answer": "Hi there!", "provider": "Rule-based Fallback (busy)"}),
+                    (200, {}, {"answer": "Hello", "provider": "OpenAI (gpt-4)"})])
+    record = BulkChatClient(url, retries=0).send("1", {"message": "hi"})
+    assert (record["status"], record["answer"], len(calls)) == ("ok", "Hello", 3)
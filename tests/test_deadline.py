@@ -0,0 +1,37 @@
+import deadline
+from deadline import Deadline, parse_timeout
+
+def test_no_deadline():
+    d = Deadline()
+    assert d.remaining() is None
+    assert not d.expired
+    assert d.budget(3) is None
+
+def test_budget_shares_out_the_remaining_time(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(deadline.time, "monotonic", lambda: now[0])
+    d = Deadline(10)
+    assert d.budget(3, share=0.6) == 6.0
+    now[0] += 6
+    assert d.budget(2, share=0.6) == 4 * 0.6
+    assert d.budget(1) == 4.0  # The last attempt gets everything left
+
+def test_expiry(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(deadline.time, "monotonic", lambda: now[0])
+    d = Deadline(5)
+    assert not d.expired
+    now[0] += 5
+    assert d.expired
+    assert d.remaining() == 0.0
+    now[0] += 5
+    assert d.remaining() == 0.0  # Never negative
+
+def test_parse_timeout():
+    assert parse_timeout(None, 30, 120) == 30
+    assert parse_timeout("10", 30, 120) == 10
+    assert parse_timeout(500, 30, 120) == 120  # Clamped to the maximum
+    assert parse_timeout("soon", 30, 120) == 30
+    assert parse_timeout(0, 30, 120) == 30
+    assert parse_timeout(-5, None, 120) is None
+    assert parse_timeout(None, None, 120) is None
@@ -0,0 +1,60 @@
+import json
+
+import inference_profiles
+from inference_profiles import InferenceProfiles, required_context
+
+def write(path, profiles):
+    path.write_text(json.dumps(profiles), encoding="utf-8")
+
+def test_host_profile_wins(tmp_path):
+    path = tmp_path / "profiles.json"
+    write(path, {"m": {"num_thread": 4, "keep_alive": "5m"},
+                 "http://a:11434": {"m": {"num_thread": 8, "num_ctx": 8192}}})
+    profiles = InferenceProfiles(str(path))
+    assert profiles.options("m", "http://a:11434/") == {"num_thread": 8, "num_ctx": 8192}
+    assert profiles.options("m", "http://b:11434") == {"num_thread": 4}
+    assert profiles.options("m") == {"num_thread": 4}
+    assert profiles.keep_alive("m", "http://b:11434") == "5m"
+    assert profiles.options("other", "http://a:11434") == {}
+
+def test_save_per_host_keeps_the_rest(tmp_path):
+    path = tmp_path / "profiles.json"
+    profiles = InferenceProfiles(str(path))
+    profiles.save("m", {"num_thread": 4})
+    profiles.save("m", {"num_thread": 8}, "http://a:11434/")
+    profiles.save("n", {"num_thread": 2}, "http://a:11434")
+    assert json.loads(path.read_text()) == {
+        "m": {"num_thread": 4},
+        "http://a:11434": {"m": {"num_thread": 8}, "n": {"num_thread": 2}},
+    }
+
+def test_file_checked_at_most_every_interval(tmp_path, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(inference_profiles.time, "monotonic", lambda: now[0])
+    stats = []
+    real_stat = inference_profiles.os.stat
+    monkeypatch.setattr(inference_profiles.os, "stat", lambda p: stats.append(p) or real_stat(p))
+    path = tmp_path / "profiles.json"
+    write(path, {"m": {"num_thread": 4}})
+    profiles = InferenceProfiles(str(path), check_interval=5)
+    for _ in range(100):
+        profiles.options("m")
+    assert len(stats) == 1
+    write(path, {"m": {"num_thread": 6}})
+    inference_profiles.os.utime(path, (1, 1))  # A new mtime even on coarse clocks
+    now[0] += 5
+    assert profiles.options("m") == {"num_thread": 6}
+    assert len(stats) == 2
+
+def test_required_context():
+    assert required_context(["short"], 200, 4096) == 4096
+    long_prompt = "x" * 4 * 5000  # About 5000 tokens
+    assert required_context([long_prompt, "short"], 200, 4096) == 6144
+
+def test_for_host_overlays_the_host_section(tmp_path):
+    path = tmp_path / "profiles.json"
+    write(path, {"m": {"num_thread": 4}, "n": {"num_thread": 2},
+                 "http://a:11434": {"m": {"num_thread": 8}},
+                 "http://b:11434": {"n": {"num_thread": 16}}})
+    profiles = InferenceProfiles(str(path))
+    assert profiles.for_host("http://a:11434/") == {"m": {"num_thread": 8}, "n": {"num_thread": 2}}
@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+
+from jobs import JobEngine, JobStore
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    yield store
+    store.close()
+
+def wait_for(condition, timeout=5.0):
+    stop_at = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < stop_at, "timed out"
+        time.sleep(0.01)
+
+def test_finish_needs_the_lease(store):
+    job = store.create("t", {})
+    store.claim("a", lease=30)
+    assert not store.finish(job["job_id"], "b", "succeeded", "stale")
+    assert store.get(job["job_id"])["status"] == "running"
+    assert store.finish(job["job_id"], "a", "succeeded", "ok")
+    assert store.get(job["job_id"])["result"] == "ok"
+
+def test_stale_worker_cannot_overwrite_the_retry(store):
+    job = store.create("t", {})
+    store.claim("a", lease=-1)  # Lease already ran out
+    assert store.recover(max_attempts=3) == 1
+    store.claim("b", lease=30)
+    assert store.finish(job["job_id"], "b", "succeeded", "retry")
+    assert not store.finish(job["job_id"], "a", "failed", error="late")
+    job = store.get(job["job_id"])
+    assert (job["status"], job["result"], job["error"]) == ("succeeded", "retry", None)
+
+def test_release_requeues_without_using_an_attempt(store):
+    job = store.create("t", {})
+    store.claim("a", lease=30)
+    assert store.release("a", [job["job_id"]]) == 1
+    job = store.get(job["job_id"])
+    assert (job["status"], job["attempts"]) == ("queued", 0)
+
+def test_release_leaves_cancelled_jobs(store):
+    job = store.create("t", {})
+    store.claim("a", lease=30)
+    store.request_cancel(job["job_id"])
+    assert store.release("a", [job["job_id"]]) == 0
+
+def blocking_engine(store):
+    started = threading.Event()
+
+    def task(job):
+        started.set()
+        while not job.cancelled:
+            time.sleep(0.01)
+        job.check_cancelled()
+
+    engine = JobEngine(store, {"block": task}, workers=1, poll_interval=0.05)
+    engine.start()
+    return engine, started
+
+def test_shutdown_requeues_running_jobs(store):
+    engine, started = blocking_engine(store)
+    job = engine.submit("block")
+    assert started.wait(5)
+    engine.stop()
+    wait_for(lambda: not engine._running)
+    assert store.get(job["job_id"])["status"] == "queued"
+
+def test_user_cancel_still_cancels(store):
+    engine, started = blocking_engine(store)
+    job = engine.submit("block")
+    assert started.wait(5)
+    engine.cancel(job["job_id"])
+    wait_for(lambda: store.get(job["job_id"])["status"] == "cancelled")
+    engine.stop()
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from prefetch import Prefetcher, followup_intent, predict_followups
+
+@pytest.mark.parametrize("message, intent", [
+    ("explain that", "explain"),
+    ("Can you explain this?", "explain"),
+    ("what does that mean", "explain"),
+    ("give me an example", "example"),
+    ("Example please.", "example"),
+    ("tell me more about it", "more"),
+    ("show me that in Python", "python"),
+    ("ELI5", "simpler"),
+    ("tl;dr", "summarize"),
+])
+def test_followup_intents(message, intent):
+    assert followup_intent(message) == intent
+
+@pytest.mark.parametrize("message", [
+    "explain quantum computing",
+    "what is a monad",
+    "write a python script that parses logs",
+    "explain that " + "very " * 30 + "slowly",
+])
+def test_specific_questions_are_not_followups(message):
+    assert followup_intent(message) is None
+
+def test_predictions():
+    assert predict_followups("sort a list", "```js\nx.sort()\n```") == ["explain", "python"]
+    assert predict_followups("what is a monad", "A monad is ...") == ["example", "more"]
+    assert predict_followups("history of rome", "word " * 200)[0] == "summarize"
+
+CONTEXT = {"last_message": "what is a monad", "last_answer": "A monad is ..."}
+
+def test_real_traffic_preempts_and_the_followup_is_retried():
+    async def run():
+        calls = []
+        release = asyncio.Event()
+
+        async def compute(session_id, prompt, context):
+            calls.append(prompt)
+            if len(calls) == 1:
+                await asyncio.sleep(10)  # Preempted before it finishes
+            await release.wait()
+            return f"answer to {prompt}", "Stub"
+
+        prefetcher = Prefetcher(compute, idle=lambda: True, count=1)
+        prefetcher.start()
+        prefetcher.schedule("s", "what is a monad", "A monad is ...", CONTEXT)
+        while not calls:
+            await asyncio.sleep(0.01)
+        prefetcher.preempt()
+        release.set()
+        for _ in range(100):
+            if prefetcher.stats["computed"]:
+                break
+            await asyncio.sleep(0.01)
+        prefetcher.stop()
+        return prefetcher, calls
+
+    prefetcher, calls = asyncio.run(run())
+    assert len(calls) == 2
+    assert prefetcher.stats["preempted"] == 1
+    assert prefetcher.take("s", "give me an example", CONTEXT) == ("answer to Can you give me an example?", "Stub")
+
+def test_preempt_without_work_does_nothing():
+    prefetcher = Prefetcher(lambda *args: None, idle=lambda: True)
+    prefetcher.preempt()
+    assert prefetcher.stats["preempted"] == 0
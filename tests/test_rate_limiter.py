@@ -0,0 +1,97 @@
+import rate_limiter
+from rate_limiter import RateLimiter, TokenBucket, estimate_tokens
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def make_clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock)
+    return clock
+
+def test_bucket_starts_full_and_refills(monkeypatch):
+    clock = make_clock(monkeypatch)
+    bucket = TokenBucket(60)
+    assert bucket.wait_time(60) == 0
+    bucket.consume(60)
+    assert bucket.wait_time(1) == 1.0
+    clock.now += 30
+    assert bucket.available() == 30
+
+def test_bucket_never_overfills(monkeypatch):
+    clock = make_clock(monkeypatch)
+    bucket = TokenBucket(10)
+    clock.now += 3600
+    assert bucket.available() == 10
+
+def test_oversized_request_waits_for_a_full_bucket(monkeypatch):
+    make_clock(monkeypatch)
+    bucket = TokenBucket(10)
+    assert bucket.wait_time(100) == 0
+    bucket.consume(100)
+    assert bucket.wait_time(1) == 91 * 6
+
+def test_reserve_takes_nothing_when_short(monkeypatch):
+    clock = make_clock(monkeypatch)
+    limiter = RateLimiter({"gemini": (2, 0)})
+    assert limiter.reserve("gemini", 10) == 0
+    assert limiter.reserve("gemini", 10) == 0
+    assert limiter.reserve("gemini", 10) == 30
+    clock.now += 30
+    assert limiter.reserve("gemini", 10) == 0
+
+def test_unlimited_provider_never_waits(monkeypatch):
+    make_clock(monkeypatch)
+    limiter = RateLimiter({"ollama": (0, 0)})
+    assert all(limiter.reserve("ollama", 10 ** 6) == 0 for _ in range(100))
+
+def test_record_usage_corrects_the_estimate(monkeypatch):
+    make_clock(monkeypatch)
+    limiter = RateLimiter({"openai": (0, 1000)})
+    limiter.reserve("openai", 100)
+    limiter.record_usage("openai", 100, 400)
+    assert limiter.status("openai")["tpm"]["remaining"] == 600
+
+def test_penalize_drains_the_buckets(monkeypatch):
+    make_clock(monkeypatch)
+    limiter = RateLimiter({"gemini": (15, 1000)})
+    limiter.penalize("gemini")
+    assert limiter.reserve("gemini", 1) > 0
+
+def test_client_limit_and_batches(monkeypatch):
+    clock = make_clock(monkeypatch)
+    limiter = RateLimiter({}, client_rpm=60)
+    assert limiter.check_client("a", 50) == 0
+    assert limiter.check_client("a", 20) == 10  # All or nothing
+    assert limiter.check_client("b", 20) == 0  # Clients have separate buckets
+    clock.now += 10
+    assert limiter.check_client("a", 20) == 0
+
+def test_client_limit_off():
+    limiter = RateLimiter({}, client_rpm=0)
+    assert all(limiter.check_client("a", 1000) == 0 for _ in range(10))
+
+def test_least_recent_client_is_forgotten(monkeypatch):
+    make_clock(monkeypatch)
+    limiter = RateLimiter({}, client_rpm=1, max_clients=2)
+    limiter.check_client("a")
+    limiter.check_client("b")
+    limiter.check_client("c")
+    assert limiter.check_client("a") == 0  # Starts over with a full bucket
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("x" * 400) == 100
+
+def test_from_env_splits_quotas(monkeypatch):
+    monkeypatch.setenv("GEMINI_RPM", "20")
+    monkeypatch.setenv("GEMINI_TPM", "1000")
+    main = rate_limiter.rate_limiter_from_env(["gemini", "ollama"], workers=2, share=0.9)
+    side = rate_limiter.rate_limiter_from_env(["gemini", "ollama"], workers=2, share=0.1)
+    assert main.status("gemini")["rpm"]["limit"] == 9
+    assert side.status("gemini")["tpm"]["limit"] == 50
+    assert side.status("ollama")["rpm"]["limit"] is None  # Unlimited stays unlimited
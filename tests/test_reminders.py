@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+from reminders import IndexedHeap, ReminderScheduler, ReminderStore
+
+def drain(heap):
+    return [heap.pop() for _ in range(len(heap))]
+
+def test_pops_in_due_order():
+    heap = IndexedHeap()
+    for item_id, due in enumerate([5.0, 1.0, 4.0, 2.0, 3.0]):
+        heap.push(item_id, due)
+    assert heap.peek() == (1.0, 1)
+    assert drain(heap) == [(1.0, 1), (2.0, 3), (3.0, 4), (4.0, 2), (5.0, 0)]
+    assert heap.peek() is None
+
+def test_push_again_reschedules():
+    heap = IndexedHeap()
+    heap.push(1, 10.0)
+    heap.push(2, 20.0)
+    heap.push(2, 5.0)  # Earlier
+    heap.push(1, 30.0)  # Later
+    assert len(heap) == 2
+    assert drain(heap) == [(5.0, 2), (30.0, 1)]
+
+def test_remove_any_item():
+    heap = IndexedHeap()
+    for item_id in range(10):
+        heap.push(item_id, float(item_id))
+    assert heap.remove(4)
+    assert not heap.remove(4)
+    assert 4 not in heap and 5 in heap
+    assert [item_id for _, item_id in drain(heap)] == [0, 1, 2, 3, 5, 6, 7, 8, 9]
+
+def test_matches_sorting_under_random_operations():
+    rng = random.Random(7)
+    heap, expected = IndexedHeap(), {}
+    for _ in range(2000):
+        item_id = rng.randrange(200)
+        if rng.random() < 0.3:
+            assert heap.remove(item_id) == (expected.pop(item_id, None) is not None)
+        else:
+            due = rng.random()
+            heap.push(item_id, due)
+            expected[item_id] = due
+    assert drain(heap) == sorted((due, item_id) for item_id, due in expected.items())
+
+@pytest.fixture
+def scheduler(tmp_path):
+    store = ReminderStore(str(tmp_path / "reminders.db"))
+    yield ReminderScheduler(store, deliver=lambda reminder: False)
+    store.close()
+
+def test_cancel_only_by_its_session(scheduler):
+    reminder = scheduler.schedule("alice", "stretch", due_at=9e9)
+    assert not scheduler.cancel(reminder["id"], "bob")
+    assert reminder["id"] in scheduler.heap
+    assert scheduler.store.get(reminder["id"])["status"] == "pending"
+    assert scheduler.cancel(reminder["id"], "alice")
+    assert reminder["id"] not in scheduler.heap
+    assert not scheduler.cancel(reminder["id"], "alice")  # Already cancelled
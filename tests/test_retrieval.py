@@ -0,0 +1,78 @@
+import math
+
+from retrieval import Retriever, build_index, chunk_text, tokenize
+
+DOCS = {
+    "cats.md": "Cats are small carnivorous mammals. A cat sleeps most of the day.",
+    "dogs.md": "Dogs are loyal. A dog needs a walk every day, and dogs love to play fetch.",
+    "python.md": "Python lists are mutable sequences. Append adds an item to a Python list.",
+}
+
+def make_index(tmp_path, docs=DOCS):
+    for name, text in docs.items():
+        (tmp_path / name).write_text(text, encoding="utf-8")
+    index = str(tmp_path / "index")
+    stats = build_index([str(tmp_path / name) for name in docs], index)
+    return index, stats
+
+def test_tokenize_drops_case_punctuation_and_stopwords():
+    assert tokenize("The Cat, and THE dog!") == ["cat", "dog"]
+
+def test_chunk_text_overlaps():
+    words = [f"w{i}" for i in range(25)]
+    chunks = chunk_text(" ".join(words), chunk_words=10, overlap=4)
+    assert chunks[0].split() == words[:10]
+    assert chunks[1].split()[:4] == words[6:10]
+    assert chunks[-1].split()[-1] == "w24"
+    assert chunk_text("", 10, 4) == []
+
+def test_best_passage_comes_first(tmp_path):
+    index, stats = make_index(tmp_path)
+    assert stats == {"files": 3, "chunks": 3, "terms": stats["terms"]}
+    retriever = Retriever(index)
+    results = retriever.search("how do I append to a python list")
+    assert results[0]["source"].endswith("python.md")
+    assert retriever.search("dogs walk")[0]["source"].endswith("dogs.md")
+
+def test_unknown_terms_find_nothing(tmp_path):
+    index, _ = make_index(tmp_path)
+    assert Retriever(index).search("quantum chromodynamics") == []
+    assert Retriever(index).search("the and of") == []
+
+def test_scores_match_bm25(tmp_path):
+    index, _ = make_index(tmp_path)
+    retriever = Retriever(index)
+    chunks = [tokenize(text) for text in DOCS.values()]
+    avg = sum(map(len, chunks)) / len(chunks)
+    k1, b = 1.5, 0.75
+
+    def bm25(query, doc):
+        score = 0.0
+        for term in set(tokenize(query)):
+            df = sum(term in c for c in chunks)
+            if not df:
+                continue
+            tf = doc.count(term)
+            idf = math.log(1 + (len(chunks) - df + 0.5) / (df + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avg))
+        return score
+
+    for query in ("dog day", "python list", "cat sleeps day"):
+        expected = sorted((bm25(query, c) for c in chunks), reverse=True)
+        got = [r["score"] for r in retriever.search(query, k=3)]
+        assert [round(s, 4) for s in got] == [round(s, 4) for s in expected if s > 0]
+
+def test_min_score_and_k(tmp_path):
+    index, _ = make_index(tmp_path)
+    retriever = Retriever(index)
+    assert len(retriever.search("day", k=1)) == 1
+    assert retriever.search("day", min_score=100) == []
+
+def test_reindexing_replaces_the_index(tmp_path):
+    index, _ = make_index(tmp_path)
+    (tmp_path / "new.md").write_text("Rust has ownership and borrowing.", encoding="utf-8")
+    build_index([str(tmp_path / "new.md")], index)
+    retriever = Retriever(index)
+    assert len(retriever) == 1
+    assert retriever.search("borrowing")[0]["source"].endswith("new.md")
+    assert retriever.search("python") == []
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from shadow import ShadowMirror, ShadowStore
+
+def make_mirror(tmp_path, answer="the same words here", max_in_flight=2):
+    async def ask(provider, model, messages, timeout):
+        return answer
+
+    store = ShadowStore(str(tmp_path / "shadow.db"))
+    return ShadowMirror(store, ("ollama", "small"), ask, "Ollama (small)", fraction=1.0,
+                        max_in_flight=max_in_flight)
+
+def test_sampling_takes_a_slot(tmp_path):
+    mirror = make_mirror(tmp_path)
+    assert mirror.should_mirror() and mirror.should_mirror()
+    assert not mirror.should_mirror()  # Both slots taken before either request is answered
+    assert mirror.stats["skipped_busy"] == 1
+    mirror.release()
+    assert mirror.should_mirror()
+    mirror.store.close()
+
+def run_mirror(mirror, result):
+    async def run():
+        assert mirror.should_mirror()
+        mirror.mirror("hi", lambda: [{"role": "user", "content": "hi"}], result, 0.1)
+        await mirror.close()
+
+    asyncio.run(run())
+    return mirror.in_flight
+
+@pytest.mark.parametrize("provider, ok", [
+    ("OpenAI (gpt-4)", True),
+    ("Rule-based Fallback", False),
+    ("Rule-based Fallback (busy)", False),
+    ("Error Fallback", False),
+])
+def test_fallback_primaries_are_not_scored(tmp_path, provider, ok):
+    mirror = make_mirror(tmp_path)
+    assert run_mirror(mirror, {"provider": provider, "answer": "the same words here"}) == 0
+    store = ShadowStore(str(tmp_path / "shadow.db"))
+    (run,) = store.rows()
+    assert run["primary_ok"] is ok
+    assert (run["overlap"] is not None) is ok
+    store.close()
+
+def test_same_model_gives_the_slot_back(tmp_path):
+    mirror = make_mirror(tmp_path)
+    assert run_mirror(mirror, {"provider": "Ollama (small)", "answer": "x"}) == 0
+    assert mirror.stats["skipped_same_model"] == 1
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight, request_key
+
+def test_request_key_normalizes_the_message():
+    assert request_key("  Hello   World ", {}, None, None) == request_key("hello world", {}, None, None)
+
+def test_request_key_separates_what_changes_the_answer():
+    base = request_key("hi", {"a": 1}, "ollama", "llama3.2")
+    assert base != request_key("hi", {"a": 2}, "ollama", "llama3.2")
+    assert base != request_key("hi", {"a": 1}, "gemini", "llama3.2")
+    assert base != request_key("hi", {"a": 1}, "ollama", "mistral")
+    assert base != request_key("hi", {"a": 1}, "ollama", "llama3.2", session="s1")
+    assert request_key("hi", {}, None, None, "s1") != request_key("hi", {}, None, None, "s2")
+
+def test_request_key_ignores_context_key_order():
+    assert request_key("hi", {"a": 1, "b": 2}, None, None) == request_key("hi", {"b": 2, "a": 1}, None, None)
+
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight()
+    calls = []
+
+    async def work(broadcast):
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"answer": "42", "context": {}}
+
+    async def main():
+        return await asyncio.gather(*(flights.do("k", work) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(r == {"answer": "42", "context": {}} for r in results)
+    assert flights.metrics()["leaders"] == 1 and flights.metrics()["coalesced"] == 4
+
+def test_followers_get_their_own_copy():
+    flights = SingleFlight()
+
+    async def work(broadcast):
+        await asyncio.sleep(0.01)
+        return {"context": {}}
+
+    async def main():
+        return await asyncio.gather(flights.do("k", work), flights.do("k", work))
+
+    leader, follower = asyncio.run(main())
+    follower["context"]["x"] = 1
+    assert leader["context"] == {}
+
+def test_late_follower_gets_earlier_events():
+    flights = SingleFlight()
+    seen = []
+
+    async def work(broadcast):
+        broadcast({"type": "delta", "text": "a"})
+        await asyncio.sleep(0.05)
+        broadcast({"type": "delta", "text": "b"})
+        return "ab"
+
+    async def main():
+        leader = asyncio.ensure_future(flights.do("k", work))
+        await asyncio.sleep(0.01)
+        follower = await flights.do("k", work, events=seen.append)
+        return await leader, follower
+
+    assert asyncio.run(main()) == ("ab", "ab")
+    assert [e["text"] for e in seen] == ["a", "b"]
+
+def test_sequential_calls_are_not_merged():
+    flights = SingleFlight()
+    calls = []
+
+    async def work(broadcast):
+        calls.append(1)
+        return len(calls)
+
+    async def main():
+        return [await flights.do("k", work), await flights.do("k", work)]
+
+    assert asyncio.run(main()) == [1, 2]
+
+def test_work_is_cancelled_when_every_caller_gives_up():
+    flights = SingleFlight()
+
+    async def main():
+        finished = []
+
+        async def work(broadcast):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                finished.append("cancelled")
+                raise
+
+        callers = [asyncio.ensure_future(flights.do("k", work)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        callers[0].cancel()
+        await asyncio.sleep(0.01)
+        assert not finished  # One caller is still waiting
+        callers[1].cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await callers[1]
+        await asyncio.sleep(0.01)
+        return finished
+
+    assert asyncio.run(main()) == ["cancelled"]
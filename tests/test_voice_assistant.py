@@ -0,0 +1,62 @@
+import types
+
+import pytest
+
+pytest.importorskip("speech_recognition")
+pytest.importorskip("pyttsx3")
+
+import voice_assistant
+
+class FakeEngine:
+    def __init__(self):
+        self.said = []
+
+    def setProperty(self, name, value):
+        pass
+
+    def getProperty(self, name):
+        return [types.SimpleNamespace(id="voice")]
+
+    def say(self, text):
+        self.said.append(text)
+
+    def runAndWait(self):
+        pass
+
+    def stop(self):
+        pass
+
+@pytest.fixture
+def assistant(monkeypatch):
+    engine = FakeEngine()
+    monkeypatch.setattr(voice_assistant.pyttsx3, "init", lambda: engine, raising=False)
+    assistant = voice_assistant.VoiceAssistant(barge_in=True)
+    assert assistant.engine is engine
+    return assistant
+
+def test_barge_in_stops_the_rest_of_a_streamed_answer(assistant):
+    def chunks():
+        yield "One. Two. "
+        assistant.stop_speaking()  # The user starts talking
+        yield "Three. "
+        yield "Four"
+
+    assert assistant.speak_stream(chunks()) == "One. Two. Three. Four"
+    assistant.wait_until_done()
+    assert set(assistant.engine.said) <= {"One.", "Two."}
+
+def test_restarted_stream_speaks_the_new_answer(assistant):
+    def chunks():
+        yield "Old answer. "
+        assistant.restart_stream()  # The provider failed; another one starts over
+        yield "New answer."
+
+    assistant.speak_stream(chunks())
+    assistant.wait_until_done()
+    assert assistant.engine.said[-1] == "New answer."
+
+def test_next_answer_is_spoken_after_a_barge_in(assistant):
+    assistant.stop_speaking()
+    assistant.speak_stream(iter(["Hello there."]))
+    assistant.wait_until_done()
+    assert assistant.engine.said == ["Hello there."]
@@ -2,79 +2,440 @@ import speech_recognition as sr
 import pyttsx3
 import requests
 import json
+import os
+import queue
+import re
+import threading
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from backend_client import create_backend
+from wakeword import wake_from_env
+
+# A sentence ends at . ! or ? followed by whitespace
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+def split_sentences(text):
+    """Split text into (complete sentences, unfinished remainder)"""
+    parts = SENTENCE_BOUNDARY.split(text)
+    return [p.strip() for p in parts[:-1] if p.strip()], parts[-1]
+
+def frame_rms(frame):
+    """Root-mean-square energy of a 16-bit mono PCM frame"""
+    samples = array('h', frame)
+    if not samples:
+        return 0.0
+    return (sum(s * s for s in samples) / len(samples)) ** 0.5
+
+class SpeechStartTap:
+    """Wraps a microphone stream and calls on_start once the audio gets louder than threshold.
+    
+    Lets listen() barge in as soon as the user starts talking, instead of after
+    the recognizer has captured the whole phrase.
+    """
+    
+    def __init__(self, stream, threshold, on_start):
+        self.stream = stream
+        self.threshold = threshold
+        self.on_start = on_start
+    
+    def read(self, size):
+        data = self.stream.read(size)
+        if self.on_start and frame_rms(data) > self.threshold:
+            self.on_start()
+            self.on_start = None
+        return data
+    
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+class ContinuousListener:
+    """Always-on microphone capture with energy-based voice activity detection.
+    
+    Audio is read in short frames on a capture thread. While nobody is talking the
+    last few frames sit in a ring buffer so the start of a phrase is never clipped.
+    Once speech is detected, frames are collected until enough trailing silence
+    (the endpoint) is seen, and the finished segment is handed to a recognition
+    worker pool while capture carries on.
+    
+    With a wake-word detector the listener starts asleep: frames only go to the
+    detector, and nothing is sent for recognition. After the wake word it stays
+    awake for one phrase, or until wake_window_s passes without one.
+    
+    speaking() says whether the assistant's own voice is playing. Meanwhile a
+    phrase only starts if it is echo_ratio times louder than the usual
+    threshold, so speaker output isn't taken for the user; with echo_ratio
+    None nothing is captured until playback ends.
+    """
+    
+    def __init__(self, recognize, sample_rate=16000, frame_ms=30, pre_roll_ms=300,
+                 min_speech_ms=120, end_silence_ms=1000, max_segment_s=30.0,
+                 threshold_ratio=3.0, min_energy=300, recognition_workers=2,
+                 on_speech_start=None, on_frame=None, wake=None, wake_window_s=8.0,
+                 on_wake=None, speaking=None, echo_ratio=None):
+        self.recognize = recognize  # Callable taking sr.AudioData, returning text
+        self.sample_rate = sample_rate
+        self.frame_samples = int(sample_rate * frame_ms / 1000)
+        self.frame_ms = frame_ms
+        
+        # Endpointing, all expressed in frames
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.end_silence_frames = max(1, end_silence_ms // frame_ms)
+        self.max_segment_frames = int(max_segment_s * 1000 / frame_ms)
+        
+        self.threshold_ratio = threshold_ratio
+        self.min_energy = min_energy
+        self.noise_floor = None
+        
+        self.on_speech_start = on_speech_start
+        self.on_frame = on_frame  # Optional hook that sees every raw frame
+        
+        self.wake = wake  # Optional wakeword.WakeWordDetector
+        self.wake_window_frames = int(wake_window_s * 1000 / frame_ms)
+        self.on_wake = on_wake
+        self.speaking = speaking
+        self.echo_ratio = echo_ratio
+        
+        self.ring = deque(maxlen=max(1, pre_roll_ms // frame_ms))
+        self.executor = ThreadPoolExecutor(max_workers=recognition_workers,
+                                           thread_name_prefix="recognizer")
+        # Futures are queued in capture order, so transcripts come out in order
+        # even when a later, shorter segment finishes recognition first
+        self.results = queue.Queue()
+        self._running = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._running.set()
+        self._thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running.clear()
+        if self._thread:
+            self._thread.join(timeout=2)
+        self.results.put(None)
+        self.executor.shutdown(wait=False)
+
+    def transcripts(self):
+        """Yield recognized text for each segment, in the order it was spoken"""
+        while True:
+            future = self.results.get()
+            if future is None:
+                return
+            try:
+                yield future.result()
+            except Exception as e:
+                print(f"❌ Recognition error: {str(e)}")
+                yield ""
+
+    def is_speech(self, frame, louder=1.0):
+        """Classify one frame, adapting the threshold to background noise.
+        
+        louder raises the bar for this frame without affecting the noise floor.
+        """
+        energy = frame_rms(frame)
+        if self.noise_floor is None:
+            self.noise_floor = energy
+        threshold = max(self.min_energy, self.noise_floor * self.threshold_ratio)
+        if energy <= threshold:
+            # Track the noise floor only on non-speech frames
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * energy
+        return energy > threshold * louder
+
+    def _capture_loop(self):
+        with sr.Microphone(sample_rate=self.sample_rate, chunk_size=self.frame_samples) as source:
+            sample_width = source.SAMPLE_WIDTH
+            print("Listening continuously...")
+            
+            segment = None
+            voiced_run = 0
+            silent_run = 0
+            awake = self.wake is None
+            waiting = 0  # Frames awake without a phrase starting
+            while self._running.is_set():
+                frame = source.stream.read(self.frame_samples)
+                if self.on_frame:
+                    self.on_frame(frame)
+                echo = segment is None and self.speaking is not None and self.speaking()
+                speech = self.is_speech(frame, (self.echo_ratio or 1.0) if echo else 1.0)
+                if echo and self.echo_ratio is None:
+                    speech = False  # Our own playback; nothing starts until it ends
+                
+                if not awake:
+                    if self.wake.process(frame):
+                        print("🎯 Wake word detected")
+                        awake = True
+                        waiting = 0
+                        voiced_run = 0
+                        self.ring.clear()  # Don't send the wake word itself
+                        if self.on_wake:
+                            self.on_wake()
+                    continue
+                
+                if segment is None:
+                    waiting += 1
+                    if self.wake and waiting >= self.wake_window_frames:
+                        awake = self._sleep()
+                        continue
+                    self.ring.append(frame)
+                    voiced_run = voiced_run + 1 if speech else 0
+                    if voiced_run >= self.min_speech_frames:
+                        segment = list(self.ring)
+                        self.ring.clear()
+                        silent_run = 0
+                        if self.on_speech_start:
+                            self.on_speech_start()
+                    continue
+                
+                segment.append(frame)
+                silent_run = 0 if speech else silent_run + 1
+                if silent_run >= self.end_silence_frames or len(segment) >= self.max_segment_frames:
+                    self._submit(segment, sample_width)
+                    segment = None
+                    voiced_run = 0
+                    if self.wake:
+                        awake = self._sleep()
+            
+            if segment:
+                self._submit(segment, sample_width)
+
+    def _sleep(self):
+        self.wake.reset()
+        self.ring.clear()
+        print("💤 Waiting for the wake word")
+        return False
+    
+    def _submit(self, frames, sample_width):
+        audio = sr.AudioData(b"".join(frames), self.sample_rate, sample_width)
+        self.results.put(self.executor.submit(self.recognize, audio))
+
+# Endpointing settings for continuous mode: env var -> (ContinuousListener option, type)
+ENDPOINTING_ENV = {
+    "VOICE_END_SILENCE_MS": ("end_silence_ms", int),
+    "VOICE_MIN_SPEECH_MS": ("min_speech_ms", int),
+    "VOICE_MAX_SEGMENT_S": ("max_segment_s", float),
+    "VOICE_THRESHOLD_RATIO": ("threshold_ratio", float),
+    "VOICE_MIN_ENERGY": ("min_energy", int),
+    "VOICE_PRE_ROLL_MS": ("pre_roll_ms", int),
+}
+
+def endpointing_from_env():
+    """ContinuousListener options set through VOICE_* environment variables"""
+    return {option: kind(os.environ[name]) for name, (option, kind) in ENDPOINTING_ENV.items()
+            if os.getenv(name)}
+
 class VoiceAssistant:
-    def __init__(self, backend_url="http://localhost:8000"):
+    def __init__(self, backend_url="http://localhost:8001", barge_in=None):
         self.backend_url = backend_url
-        self.context = {}
+        self.backend = None  # Persistent session, opened on first use
         self.recognizer = sr.Recognizer()
-        self.engine = pyttsx3.init()
+        # Stop playback as soon as the user starts talking (VOICE_BARGE_IN=1). Off by
+        # default: without headphones the microphone also hears the assistant.
+        if barge_in is None:
+            barge_in = os.getenv("VOICE_BARGE_IN", "0") == "1"
+        self.barge_in = barge_in
+        # While the assistant talks, the user must be this many times louder to barge in
+        self.echo_ratio = float(os.getenv("VOICE_ECHO_RATIO", "4"))
+        self.engine = None
+        
+        # Text-to-speech runs on its own thread, fed one sentence at a time, so
+        # playback can start while the rest of the answer is still arriving
+        self.speech_queue = queue.Queue()
+        self.is_speaking = threading.Event()
+        self._speech_generation = 0
+        self._stream_generation = 0  # Generation the streamed answer is spoken in
+        self._engine_ready = threading.Event()
+        self._tts_thread = threading.Thread(target=self._tts_worker, daemon=True)
+        self._tts_thread.start()
+        self._engine_ready.wait(timeout=10)
+
+    def _tts_worker(self):
+        """Own the TTS engine and speak queued sentences in order"""
+        try:
+            self.engine = pyttsx3.init()
+            
+            # Configure voice properties
+            self.engine.setProperty('rate', 150)
+            voices = self.engine.getProperty('voices')
+            self.engine.setProperty('voice', voices[0].id)  # Index 0 for male, 1 for female
+        except Exception as e:
+            print(f"❌ Text-to-speech unavailable: {str(e)}")
+            self.engine = None
+        finally:
+            self._engine_ready.set()
         
-        # Configure voice properties
-        self.engine.setProperty('rate', 150)
-        voices = self.engine.getProperty('voices')
-        self.engine.setProperty('voice', voices[0].id)  # Index 0 for male, 1 for female
+        while True:
+            generation, sentence = self.speech_queue.get()
+            try:
+                # Skip sentences queued before the last barge-in
+                if self.engine and generation == self._speech_generation:
+                    self.is_speaking.set()
+                    self.engine.say(sentence)
+                    self.engine.runAndWait()
+            except Exception as e:
+                print(f"❌ Speech output error: {str(e)}")
+            finally:
+                if self.speech_queue.empty():
+                    self.is_speaking.clear()
+                self.speech_queue.task_done()
 
     def listen(self):
         """Listen for user input through microphone"""
         with sr.Microphone() as source:
             print("Listening...")
             self.recognizer.adjust_for_ambient_noise(source, duration=1)
+            if self.barge_in and self.is_speaking.is_set():
+                # Barge in on the first loud frame, not after the whole phrase
+                source.stream = SpeechStartTap(source.stream, self.recognizer.energy_threshold * self.echo_ratio,
+                                               self._on_speech_start)
             try:
                 audio = self.recognizer.listen(source, timeout=5, phrase_time_limit=5)
-                text = self.recognizer.recognize_google(audio)
-                print("You said:", text)
-                return text.lower()
             except sr.WaitTimeoutError:
                 print("No speech detected within timeout period")
                 return ""
-            except sr.UnknownValueError:
-                print("Could not understand audio")
-                return ""
-            except sr.RequestError as e:
-                if "Forbidden" in str(e):
-                    print("❌ Speech recognition access denied. Possible solutions:")
-                    print("1. Check microphone permissions")
-                    print("2. Make sure microphone is not being used by another app")
-                    print("3. Try running as administrator")
-                    print("4. Check internet connection for Google Speech API")
-                elif "recognition request failed" in str(e):
-                    print("❌ Speech recognition service unavailable")
-                    print("💡 Try using text input instead")
-                else:
-                    print(f"❌ Speech recognition error: {str(e)}")
-                return ""
             except Exception as e:
                 print(f"❌ Unexpected error: {str(e)}")
                 return ""
+        
+        text = self.recognize(audio)
+        if text:
+            print("You said:", text)
+        return text
 
-    def speak(self, text):
-        """Convert text to speech"""
+    def recognize(self, audio):
+        """Turn captured audio into lowercase text, or "" on failure"""
+        try:
+            return self.recognizer.recognize_google(audio).lower()
+        except sr.UnknownValueError:
+            print("Could not understand audio")
+            return ""
+        except sr.RequestError as e:
+            if "Forbidden" in str(e):
+                print("❌ Speech recognition access denied. Possible solutions:")
+                print("1. Check microphone permissions")
+                print("2. Make sure microphone is not being used by another app")
+                print("3. Try running as administrator")
+                print("4. Check internet connection for Google Speech API")
+            elif "recognition request failed" in str(e):
+                print("❌ Speech recognition service unavailable")
+                print("💡 Try using text input instead")
+            else:
+                print(f"❌ Speech recognition error: {str(e)}")
+            return ""
+        except Exception as e:
+            print(f"❌ Unexpected error: {str(e)}")
+            return ""
+
+    def speak(self, text, wait=False):
+        """Queue text for speech, sentence by sentence"""
         print("Assistant:", text)
-        self.engine.say(text)
-        self.engine.runAndWait()
+        sentences, remainder = split_sentences(text)
+        for sentence in sentences + [remainder.strip()]:
+            if sentence:
+                self.speech_queue.put((self._speech_generation, sentence))
+        if wait:
+            self.wait_until_done()
+
+    def speak_stream(self, chunks):
+        """Speak a streamed answer, starting as soon as the first sentence is complete.
+        
+        After a barge-in (stop_speaking) the rest of the answer is read but not
+        spoken; restart_stream() drops what was said and speaks what follows.
+        """
+        self._stream_generation = self._speech_generation
+        buffer = ""
+        full_text = ""
+        for chunk in chunks:
+            buffer += chunk
+            full_text += chunk
+            sentences, buffer = split_sentences(buffer)
+            for sentence in sentences:
+                self._queue_streamed(sentence)
+        if buffer.strip():
+            self._queue_streamed(buffer.strip())
+        print("Assistant:", full_text)
+        return full_text
 
-    def chat_with_backend(self, message):
-        """Send message to backend and get response"""
+    def _queue_streamed(self, sentence):
+        generation = self._stream_generation
+        if generation == self._speech_generation:  # Not interrupted since the stream started
+            self.speech_queue.put((generation, sentence))
+
+    def restart_stream(self):
+        """The streamed answer starts over: stop what was said and speak the new text"""
+        self.stop_speaking()
+        self._stream_generation = self._speech_generation
+
+    def stop_speaking(self):
+        """Barge-in: drop queued sentences and cut off the current one"""
+        self._speech_generation += 1
         try:
-            response = requests.post(
-                f"{self.backend_url}/chat",
-                json={"message": message, "context": self.context}
-            )
-            result = response.json()
-            if "error" in result:
-                return f"Error: {result['error']}", {}
-            return result["answer"], result["context"]
-        except Exception as e:
-            return f"Error connecting to backend: {str(e)}", {}
+            while True:
+                self.speech_queue.get_nowait()
+                self.speech_queue.task_done()
+        except queue.Empty:
+            pass
+        if self.engine:
+            try:
+                self.engine.stop()
+            except Exception as e:
+                print(f"❌ Could not stop speech: {str(e)}")
+        self.is_speaking.clear()
+
+    def wait_until_done(self):
+        """Block until everything queued has been spoken"""
+        self.speech_queue.join()
+
+    def connect(self):
+        """Open the backend session if it isn't open yet"""
+        if self.backend is None:
+            self.backend = create_backend(self.backend_url, on_status=self.on_backend_event)
+    
+    def on_backend_event(self, event):
+        """Events pushed by the backend outside of an answer, such as due reminders"""
+        if event.get("type") == "reminder":
+            self.speak(f"Reminder: {event.get('message', '')}")
+    
+    def respond(self, message):
+        """Ask the backend and start speaking as soon as the first sentence streams in"""
+        self.connect()
+        
+        chunks = queue.Queue()
+        streamed = []
+        result = {}
+        
+        def on_delta(text):
+            streamed.append(text)
+            chunks.put(text)
+        
+        def on_reset():
+            # The provider failed mid-answer; drop what it said
+            streamed.clear()
+            self.restart_stream()
+        
+        def fetch():
+            try:
+                result.update(self.backend.chat(message, on_delta=on_delta, on_reset=on_reset))
+            except Exception as e:
+                result["answer"] = f"Error connecting to backend: {str(e)}"
+            finally:
+                chunks.put(None)
+        
+        threading.Thread(target=fetch, daemon=True).start()
+        self.speak_stream(iter(chunks.get, None))
+        if not streamed:
+            # Nothing was streamed (HTTP transport, canned answer or error)
+            self.speak(result.get("answer", ""))
 
     def execute_task(self, task, parameters=None):
         """Execute specific task through backend"""
         try:
             response = requests.post(
                 f"{self.backend_url}/task",
-                json={"task": task, "parameters": parameters or {}}
+                json={"task": task, "parameters": parameters or {}, "wait": 10}
             )
             return response.json()
         except Exception as e:
@@ -83,6 +444,7 @@ class VoiceAssistant:
     def run(self):
         """Main loop for voice assistant"""
         self.speak("Hello! I'm your AI assistant. How can I help you?")
+        self.connect()
         
         while True:
             user_input = self.listen()
@@ -91,14 +453,75 @@ class VoiceAssistant:
                 continue
                 
             if user_input in ["exit", "quit", "goodbye"]:
-                self.speak("Goodbye! Have a great day!")
+                self.speak("Goodbye! Have a great day!", wait=True)
                 break
                 
-            # Get response from backend
-            answer, new_context = self.chat_with_backend(user_input)
-            self.context = new_context
-            self.speak(answer)
+            # Get response from backend, speaking while it streams in
+            self.respond(user_input)
+            
+            # With barge-in we keep listening while the answer plays
+            if not self.barge_in:
+                self.wait_until_done()
+
+    def _on_speech_start(self):
+        if self.barge_in and self.is_speaking.is_set():
+            self.stop_speaking()
+
+    def run_continuous(self, wake=False, **endpointing):
+        """Hands-free loop: capture never pauses while we recognize, think or speak.
+        
+        Endpointing options are passed to ContinuousListener, e.g. a short
+        end_silence_ms for quick back-and-forth or a long one for dictation.
+        With wake=True only the phrase after the enrolled wake word is
+        recognized; saying the wake word also interrupts a spoken answer.
+        """
+        detector = wake_from_env() if wake else None
+        if wake and detector is None:
+            print("❌ No wake word enrolled. Run: python wakeword.py enroll")
+            return
+        
+        self.speak("Hello! I'm your AI assistant. How can I help you?")
+        self.connect()
+        
+        listener = ContinuousListener(self.recognize, on_speech_start=self._on_speech_start,
+                                      wake=detector, on_wake=self._on_speech_start,
+                                      speaking=self.is_speaking.is_set,
+                                      echo_ratio=self.echo_ratio if self.barge_in else None,
+                                      **endpointing)
+        listener.start()
+        try:
+            for user_input in listener.transcripts():
+                if not user_input:
+                    continue
+                print("You said:", user_input)
+                
+                if user_input in ["exit", "quit", "goodbye"]:
+                    self.speak("Goodbye! Have a great day!", wait=True)
+                    break
+                
+                self.respond(user_input)
+        finally:
+            listener.stop()
 
 if __name__ == "__main__":
-    assistant = VoiceAssistant()
-    assistant.run()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Voice assistant")
+    parser.add_argument("--continuous", action="store_true", help="Hands-free mode with voice activity detection")
+    parser.add_argument("--wake", action="store_true", help="Continuous mode behind the enrolled wake word")
+    parser.add_argument("--barge-in", action="store_true", default=None,
+                        help="Stop playback when the user talks (use headphones; also VOICE_BARGE_IN=1)")
+    # Endpointing for continuous mode; each also has a VOICE_* environment variable
+    for name, (option, kind) in ENDPOINTING_ENV.items():
+        parser.add_argument("--" + option.replace("_", "-"), type=kind, dest=option, help=f"Also {name}")
+    args = parser.parse_args()
+    
+    endpointing = endpointing_from_env()
+    endpointing.update({option: getattr(args, option) for option, _ in ENDPOINTING_ENV.values()
+                        if getattr(args, option) is not None})
+    
+    assistant = VoiceAssistant(barge_in=args.barge_in)
+    if args.wake or args.continuous:
+        assistant.run_continuous(wake=args.wake, **endpointing)
+    else:
+        assistant.run()
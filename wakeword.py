@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+"""
+On-device wake-word detection for always-on voice mode.
+
+The detector compares the live microphone stream against a few recordings of
+the wake word, made once with `enroll`. Audio is turned into MFCC features
+(25 ms windows every 10 ms). Each recording is matched with streaming
+subsequence DTW, which can start anywhere in the stream. Each 10 ms of audio
+adds one DTW column per template, a handful of NumPy operations on arrays as
+long as the template, so listening costs about 1% of one CPU core. The wake
+word is reported as soon as its last frame has been heard.
+
+    python wakeword.py enroll -o wake_templates.npz            # say the wake word 5 times
+    python wakeword.py enroll --wav hey1.wav hey2.wav hey3.wav -o wake_templates.npz
+    python wakeword.py test recording.wav
+
+The detection threshold is set at enrollment, between how far the recordings
+are from each other and how far they are from the same audio played
+backwards. WAKE_THRESHOLD overrides it.
+"""
+import argparse
+import os
+import sys
+import time
+import wave
+from typing import List, Optional
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+WINDOW = 400        # 25 ms
+HOP = 160           # 10 ms
+NFFT = 512
+MEL_FILTERS = 26
+CEPSTRA = 12        # c1..c12; c0 (overall loudness) is left out so the match ignores volume
+THRESHOLD_POSITION = 0.6
+
+def mel_filterbank(sample_rate: int = SAMPLE_RATE, nfft: int = NFFT, filters: int = MEL_FILTERS) -> np.ndarray:
+    """Triangular mel filters as a (filters, nfft // 2 + 1) matrix"""
+    mel = lambda hz: 2595 * np.log10(1 + hz / 700)
+    hz = lambda m: 700 * (10 ** (m / 2595) - 1)
+    points = hz(np.linspace(mel(20), mel(sample_rate / 2), filters + 2))
+    bins = np.floor((nfft + 1) * points / sample_rate).astype(int)
+    bank = np.zeros((filters, nfft // 2 + 1))
+    for i in range(filters):
+        left, center, right = bins[i], bins[i + 1], bins[i + 2]
+        bank[i, left:center] = (np.arange(left, center) - left) / max(1, center - left)
+        bank[i, center:right] = (right - np.arange(center, right)) / max(1, right - center)
+    return bank
+
+def dct_matrix(filters: int = MEL_FILTERS, cepstra: int = CEPSTRA) -> np.ndarray:
+    """Orthonormal DCT-II rows 1..cepstra, applied to log mel energies"""
+    n = np.arange(filters)
+    k = np.arange(1, cepstra + 1)[:, None]
+    return np.sqrt(2 / filters) * np.cos(np.pi * k * (2 * n + 1) / (2 * filters))
+
+class FeatureStream:
+    """MFCC frames from PCM audio that arrives in pieces of any length"""
+
+    def __init__(self):
+        self.window = np.hamming(WINDOW)
+        self.bank = mel_filterbank()
+        self.dct = dct_matrix()
+        self._pending = np.zeros(0, dtype=np.float32)
+
+    def reset(self) -> None:
+        self._pending = np.zeros(0, dtype=np.float32)
+
+    def push(self, samples: np.ndarray) -> np.ndarray:
+        """Features for every complete window the new samples finish, as an (n, CEPSTRA) array"""
+        audio = np.concatenate([self._pending, samples.astype(np.float32)])
+        count = max(0, (len(audio) - WINDOW) // HOP + 1)
+        self._pending = audio[count * HOP:]
+        if not count:
+            return np.empty((0, CEPSTRA), dtype=np.float32)
+        starts = np.arange(count) * HOP
+        frames = audio[starts[:, None] + np.arange(WINDOW)]
+        frames = np.append(frames[:, :1], frames[:, 1:] - 0.97 * frames[:, :-1], axis=1)  # Pre-emphasis
+        power = np.abs(np.fft.rfft(frames * self.window, NFFT)) ** 2
+        energies = np.log(power @ self.bank.T + 1e-3)
+        return (energies @ self.dct.T).astype(np.float32)
+
+def features(samples: np.ndarray) -> np.ndarray:
+    return FeatureStream().push(samples)
+
+def trim_silence(samples: np.ndarray, frame: int = HOP, floor_db: float = 35) -> np.ndarray:
+    """The part of a recording between the first and last frame within floor_db of the loudest"""
+    count = len(samples) // frame
+    if not count:
+        return samples
+    rms = np.sqrt(np.mean(samples[:count * frame].astype(np.float64).reshape(count, frame) ** 2, axis=1)) + 1e-9
+    level = 20 * np.log10(rms)
+    loud = np.nonzero(level > level.max() - floor_db)[0]
+    return samples[loud[0] * frame:(loud[-1] + 1) * frame]
+
+class TemplateMatcher:
+    """Streaming subsequence DTW of one template against the feature stream.
+
+    Steps are (1,1), (2,1) and (1,2), so the spoken word may be between half
+    and twice the template's speed, and each new column only depends on the
+    two before it.
+    """
+
+    def __init__(self, template: np.ndarray):
+        self.template = template
+        self.length = len(template)
+        self.reset()
+
+    def reset(self) -> None:
+        self._d1 = np.full(self.length, np.inf)  # Accumulated cost, previous column
+        self._d2 = np.full(self.length, np.inf)  # ... and the one before
+        self._c1 = np.full(self.length, np.inf)  # Local cost, previous column
+
+    def push(self, frame: np.ndarray) -> float:
+        """Add one feature frame; the length-normalized cost of the best match ending here"""
+        cost = np.sqrt(((self.template - frame) ** 2).sum(axis=1))
+        d = np.empty(self.length)
+        d[0] = cost[0]  # A match may start at any frame
+        d[1:] = self._d1[:-1] + cost[1:]
+        np.minimum(d[1:], self._d2[:-1] + self._c1[1:] + cost[1:], out=d[1:])
+        if self.length > 2:
+            np.minimum(d[2:], self._d1[:-2] + cost[1:-1] + cost[2:], out=d[2:])
+        self._d2, self._d1, self._c1 = self._d1, d, cost
+        return d[-1] / self.length
+
+class WakeWordDetector:
+    """Feed it 16 kHz 16-bit mono PCM; it says when the wake word has just been spoken"""
+
+    def __init__(self, templates: List[np.ndarray], threshold: float, refractory_s: float = 1.0):
+        self.matchers = [TemplateMatcher(t) for t in templates]
+        self.threshold = threshold
+        self.refractory = int(refractory_s * SAMPLE_RATE / HOP)
+        self.stream = FeatureStream()
+        self.frames = 0  # Feature frames seen
+        self._quiet_until = 0
+        self.last_score = float("inf")
+
+    @classmethod
+    def load(cls, path: str, threshold: Optional[float] = None) -> "WakeWordDetector":
+        with np.load(path) as data:
+            templates = [data[key] for key in sorted(data.files) if key.startswith("template_")]
+            saved = float(data["threshold"])
+        return cls(templates, threshold or saved)
+
+    def reset(self) -> None:
+        self.stream.reset()
+        for matcher in self.matchers:
+            matcher.reset()
+
+    def process(self, pcm: bytes) -> bool:
+        """Whether the wake word ends in this piece of audio"""
+        detected = False
+        for frame in self.stream.push(np.frombuffer(pcm, dtype=np.int16)):
+            self.frames += 1
+            score = min(matcher.push(frame) for matcher in self.matchers)
+            self.last_score = score
+            if score < self.threshold and self.frames >= self._quiet_until:
+                detected = True
+                self._quiet_until = self.frames + self.refractory  # One detection per utterance
+                for matcher in self.matchers:
+                    matcher.reset()
+        return detected
+
+def best_score(templates: List[np.ndarray], samples: np.ndarray) -> float:
+    """The lowest match cost of any template anywhere in a recording"""
+    matchers = [TemplateMatcher(t) for t in templates]
+    return min((min(m.push(frame) for m in matchers) for frame in features(samples)), default=float("inf"))
+
+def enroll(recordings: List[np.ndarray]) -> dict:
+    """Templates and a threshold from several recordings of the wake word.
+
+    Genuine distances compare each recording with the others. Impostor
+    distances compare the others with the recording played backwards: the
+    same voice and microphone, but not the word. The threshold sits
+    THRESHOLD_POSITION of the way from the worst genuine distance to the best
+    impostor one.
+    """
+    if len(recordings) < 3:
+        raise ValueError("At least 3 recordings of the wake word are needed")
+    trimmed = [trim_silence(r) for r in recordings]
+    templates = [features(r) for r in trimmed]
+    silence = np.zeros(SAMPLE_RATE // 4, dtype=np.int16)  # Padding, like the pauses around live speech
+    genuine, impostor = [], []
+    for i, recording in enumerate(trimmed):
+        others = templates[:i] + templates[i + 1:]
+        genuine.append(best_score(others, np.concatenate([silence, recording, silence])))
+        impostor.append(best_score(others, np.concatenate([silence, recording[::-1], silence])))
+    if min(impostor) <= max(genuine):
+        raise ValueError("The recordings are too different from each other; record the wake word again")
+    threshold = max(genuine) + THRESHOLD_POSITION * (min(impostor) - max(genuine))
+    return {"templates": templates, "threshold": threshold, "genuine": genuine, "impostor": impostor}
+
+def save(path: str, model: dict) -> None:
+    np.savez(path, threshold=model["threshold"],
+             **{f"template_{i:02d}": t for i, t in enumerate(model["templates"])})
+
+def read_wav(path: str) -> np.ndarray:
+    """16-bit mono samples of a 16 kHz WAV file"""
+    with wave.open(path, "rb") as f:
+        if f.getframerate() != SAMPLE_RATE or f.getsampwidth() != 2 or f.getnchannels() != 1:
+            raise ValueError(f"{path}: expected 16 kHz 16-bit mono, got {f.getframerate()} Hz, "
+                             f"{f.getsampwidth() * 8}-bit, {f.getnchannels()} channel(s)")
+        return np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+
+def write_wav(path: str, samples: np.ndarray) -> None:
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(samples.astype(np.int16).tobytes())
+
+def record_wake_word(count: int) -> List[np.ndarray]:
+    """Record the wake word count times from the microphone"""
+    import speech_recognition as sr
+    recognizer = sr.Recognizer()
+    recordings = []
+    with sr.Microphone(sample_rate=SAMPLE_RATE) as source:
+        recognizer.adjust_for_ambient_noise(source, duration=1)
+        for i in range(count):
+            print(f"🎯 Say the wake word ({i + 1}/{count})...")
+            audio = recognizer.listen(source, timeout=10, phrase_time_limit=3)
+            recordings.append(np.frombuffer(audio.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=2), dtype=np.int16))
+    return recordings
+
+def wake_from_env() -> Optional[WakeWordDetector]:
+    """Detector from WAKE_TEMPLATES (default wake_templates.npz), or None if not enrolled"""
+    path = os.getenv("WAKE_TEMPLATES", "wake_templates.npz")
+    if not os.path.exists(path):
+        return None
+    threshold = float(os.getenv("WAKE_THRESHOLD", "0")) or None
+    detector = WakeWordDetector.load(path, threshold)
+    print(f"✅ Wake word loaded from {path} ({len(detector.matchers)} templates)")
+    return detector
+
+def main():
+    parser = argparse.ArgumentParser(description="Wake-word enrollment and testing")
+    commands = parser.add_subparsers(dest="command", required=True)
+    enroll_cmd = commands.add_parser("enroll", help="Make templates from recordings of the wake word")
+    enroll_cmd.add_argument("--wav", nargs="*", help="16 kHz mono WAV files (default: record from the microphone)")
+    enroll_cmd.add_argument("--count", type=int, default=5, help="Recordings to make from the microphone")
+    enroll_cmd.add_argument("-o", "--output", default="wake_templates.npz")
+    test_cmd = commands.add_parser("test", help="Show where the wake word is detected in recordings")
+    test_cmd.add_argument("wav", nargs="+")
+    test_cmd.add_argument("--templates", default=os.getenv("WAKE_TEMPLATES", "wake_templates.npz"))
+    test_cmd.add_argument("--threshold", type=float, default=None)
+    args = parser.parse_args()
+
+    if args.command == "enroll":
+        recordings = [read_wav(path) for path in args.wav] if args.wav else record_wake_word(args.count)
+        try:
+            model = enroll(recordings)
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        save(args.output, model)
+        print(f"✅ Saved {len(model['templates'])} templates to {args.output} "
+              f"(threshold {model['threshold']:.2f}; recordings differ by up to {max(model['genuine']):.2f}, "
+              f"backwards audio by at least {min(model['impostor']):.2f})")
+        return
+
+    detector = WakeWordDetector.load(args.templates, args.threshold)
+    chunk = SAMPLE_RATE * 30 // 1000
+    for path in args.wav:
+        samples = read_wav(path)
+        detector.reset()
+        started = time.process_time()
+        hits = []
+        for offset in range(0, len(samples), chunk):
+            if detector.process(samples[offset:offset + chunk].tobytes()):
+                hits.append((offset + chunk) / SAMPLE_RATE)
+        cpu = time.process_time() - started
+        print(f"🔍 {path}: {len(hits)} detection(s) at {', '.join(f'{t:.2f}s' for t in hits) or '-'} "
+              f"(CPU {cpu / (len(samples) / SAMPLE_RATE):.2%} of real time)")
+
+if __name__ == "__main__":
+    main()